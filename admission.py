@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Webhook Admission Control
+=========================
+
+Bounds how much Loopy webhook work runs at once so a slow Munch API
+cannot make requests pile up until the platform times them out (and
+Loopy retries, doubling the load).
+
+RULES:
+1. At most `max_in_flight` webhook requests are processed at once
+2. Each event class may only use its share of that capacity, so
+   rewards (money) always have headroom that stamp and enrolled
+   events cannot consume
+3. Anything over the limit is answered immediately:
+   - 429 when a lower-priority class is over its share
+   - 503 when the whole handler is saturated
+   both with a Retry-After based on recent processing time
+"""
+
+import math
+import threading
+
+from app_config import getenv
+
+# Event classes in priority order (highest first)
+EVENT_CLASSES = ('rewards', 'stamp', 'enrolled')
+
+# Fraction of total capacity each class may occupy
+DEFAULT_SHARES = {
+    'rewards': 1.0,
+    'stamp': 0.75,
+    'enrolled': 0.5
+}
+
+
+def classify_event(endpoint, event_name=None):
+    """Map a webhook endpoint (or Loopy event name) to an event class"""
+
+    for value in (endpoint, event_name):
+        value = (value or '').lower()
+        if 'reward' in value:
+            return 'rewards'
+        if 'stamp' in value:
+            return 'stamp'
+        if 'enrol' in value:
+            return 'enrolled'
+
+    # Unknown events get the lowest priority
+    return 'enrolled'
+
+
+class AdmissionDecision:
+    """Result of an admission attempt"""
+
+    __slots__ = ('admitted', 'event_class', 'status_code', 'retry_after', 'reason')
+
+    def __init__(self, admitted, event_class, status_code=200, retry_after=0, reason=None):
+        self.admitted = admitted
+        self.event_class = event_class
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """Priority-aware bound on in-flight webhook requests"""
+
+    def __init__(self, max_in_flight=None, shares=None):
+        """Configure capacity (defaults to WEBHOOK_MAX_IN_FLIGHT or 16)"""
+
+        if max_in_flight is None:
+            max_in_flight = int(getenv('WEBHOOK_MAX_IN_FLIGHT', '16'))
+
+        self.max_in_flight = max(1, max_in_flight)
+        shares = dict(DEFAULT_SHARES, **(shares or {}))
+        self.limits = {
+            event_class: max(1, int(self.max_in_flight * shares[event_class]))
+            for event_class in EVENT_CLASSES
+        }
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.in_flight_by_class = {event_class: 0 for event_class in EVENT_CLASSES}
+        self.peak_in_flight = 0
+        self.admitted = {event_class: 0 for event_class in EVENT_CLASSES}
+        self.rejected = {event_class: 0 for event_class in EVENT_CLASSES}
+
+        # Exponentially weighted processing time, seeds Retry-After
+        self.avg_service_seconds = 1.0
+
+    def try_admit(self, event_class):
+        """Admit a request or explain why it was shed"""
+
+        if event_class not in self.limits:
+            event_class = 'enrolled'
+
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected[event_class] += 1
+                return AdmissionDecision(False, event_class, 503, self._retry_after(), 'handler saturated')
+
+            if self.in_flight >= self.limits[event_class]:
+                self.rejected[event_class] += 1
+                return AdmissionDecision(False, event_class, 429, self._retry_after(), f'{event_class} share exhausted')
+
+            self.in_flight += 1
+            self.in_flight_by_class[event_class] += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted[event_class] += 1
+
+        return AdmissionDecision(True, event_class)
+
+    def release(self, decision, service_seconds=None):
+        """Return capacity taken by an admitted request"""
+
+        if not decision.admitted:
+            return
+
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_by_class[decision.event_class] -= 1
+            if service_seconds is not None:
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+
+    def _retry_after(self):
+        """Seconds until capacity is likely free again (caller holds the lock)"""
+
+        backlog = self.in_flight / self.max_in_flight
+        return max(1, min(30, math.ceil(self.avg_service_seconds * max(1.0, backlog))))
+
+    def get_metrics(self):
+        """Current load and per-class admit/shed counts"""
+
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'limits': dict(self.limits),
+                'in_flight': self.in_flight,
+                'in_flight_by_class': dict(self.in_flight_by_class),
+                'peak_in_flight': self.peak_in_flight,
+                'admitted': dict(self.admitted),
+                'rejected': dict(self.rejected),
+                'avg_service_seconds': round(self.avg_service_seconds, 3)
+            }
@@ -1,47 +1,105 @@
-import json
 import os
+import sys
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Shared integration modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_backend
+from app_config import get_config, getenv
+from deposit_ledger import DepositLedger
+from loopy_token_cache import get_token_cache
+from warm_state import STATE, begin_invocation, container_state_header
+from warmup import get_warmup
+
+# Set by a server that mounts these handlers itself (the container server)
+_deployment = None
+
+def set_deployment_info(platform, mode, **details):
+    """Report what is serving the handlers instead of Vercel's functions"""
+    global _deployment
+    _deployment = dict(platform=platform, mode=mode, **details)
+
+def deployment_info():
+    """Platform, mode and Python version of this process"""
+    if _deployment is not None:
+        info = dict(_deployment)
+    elif getenv('VERCEL'):
+        info = {'platform': 'vercel', 'mode': 'serverless_functions'}
+    else:
+        info = {'platform': 'local', 'mode': 'serverless_functions'}
+    info['runtime'] = f'python{sys.version_info[0]}.{sys.version_info[1]}'
+    return info
+
+def wants_pretty(path):
+    """Health is polled by probes, so it is compact unless ?pretty=1 is given"""
+    query = parse_qs(urlparse(path).query)
+    return query.get('pretty', ['0'])[0] not in ('0', 'false', '')
+
+def build_health_response():
+    """Build the health check JSON response"""
+    # Check environment variables (resolved once per process)
+    config = get_config()
+    env_checks = {
+        'munch_api_key': bool(config.munch_api_key),
+        'munch_org_id': bool(config.munch_org_id),
+        'webhook_url': bool(config.webhook_url),
+        'rewards_webhook_url': bool(config.rewards_webhook_url),
+        'campaign_id': bool(config.campaign_id),
+        # Deposits are refused unless the ledger survives restarts
+        'deposit_ledger_db': DepositLedger().persistent
+    }
+    
+    # Overall health status (not ready until the warm-up stage has finished)
+    all_configured = all(env_checks.values())
+    health_status = 'healthy' if all_configured else 'warning'
+    warmup = get_warmup().status()
+    if warmup['state'] == 'running':
+        health_status = 'warming_up'
+    
+    response = {
+        'status': health_status,
+        'service': 'loopy_munch_integration',
+        'version': '2.0.0',
+        'timestamp': datetime.now().isoformat(),
+        'environment_checks': env_checks,
+        'configuration_summary': {
+            'total_env_vars': len(env_checks),
+            'configured_count': sum(env_checks.values()),
+            'missing_count': len(env_checks) - sum(env_checks.values()),
+            'all_configured': all_configured
+        },
+        'deployment_info': deployment_info(),
+        'container': STATE.status(),
+        'loopy_token': get_token_cache().stats(),
+        'warmup': warmup,
+        'message': '✅ All systems operational!' if all_configured else '⚠️  Some environment variables missing'
+    }
+    
+    if health_status == 'warming_up':
+        response['message'] = f"🔥 Warming up ({warmup['completed']}/{warmup['total']} steps)"
+    
+    return response
+
+def health_status_code(response):
+    """503 while warming up, so load balancers hold traffic until ready"""
+    return 503 if response['status'] == 'warming_up' else 200
 
 class handler(BaseHTTPRequestHandler):
+    def send_response(self, code, message=None):
+        """Every response says whether this container was already warm"""
+        super().send_response(code, message)
+        self.send_header('X-Container-State', container_state_header(begin_invocation()))
+    
     def do_GET(self):
-        self.send_response(200)
+        response = build_health_response()
+        
+        self.send_response(health_status_code(response))
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         
-        # Check environment variables
-        env_checks = {
-            'munch_api_key': bool(os.getenv('MUNCH_API_KEY')),
-            'munch_org_id': bool(os.getenv('MUNCH_ORG_ID')),
-            'webhook_url': bool(os.getenv('WEBHOOK_URL')),
-            'rewards_webhook_url': bool(os.getenv('REWARDS_WEBHOOK_URL')),
-            'campaign_id': bool(os.getenv('CAMPAIGN_ID'))
-        }
-        
-        # Overall health status
-        all_configured = all(env_checks.values())
-        health_status = 'healthy' if all_configured else 'warning'
-        
-        response = {
-            'status': health_status,
-            'service': 'loopy_munch_integration',
-            'version': '2.0.0',
-            'timestamp': datetime.now().isoformat(),
-            'environment_checks': env_checks,
-            'configuration_summary': {
-                'total_env_vars': len(env_checks),
-                'configured_count': sum(env_checks.values()),
-                'missing_count': len(env_checks) - sum(env_checks.values()),
-                'all_configured': all_configured
-            },
-            'deployment_info': {
-                'platform': 'vercel',
-                'runtime': 'python3.9',
-                'mode': 'serverless_functions'
-            },
-            'message': '✅ All systems operational!' if all_configured else '⚠️  Some environment variables missing'
-        }
-        
-        self.wfile.write(json.dumps(response, indent=2).encode())
+        self.wfile.write(json_backend.dumps(response, pretty=wants_pretty(self.path)))
         return 
\ No newline at end of file
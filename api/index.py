@@ -1,48 +1,66 @@
 import json
 import os
+import sys
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
 
+# Shared integration modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_config import get_config
+from warm_state import begin_invocation, container_state_header
+
+def build_index_response(host):
+    """Build the API index JSON response for the requesting host"""
+    protocol = 'https' if 'vercel.app' in host else 'http'
+    base_url = f"{protocol}://{host}"
+    config = get_config()
+    
+    response = {
+        'status': 'healthy',
+        'service': 'loopy_munch_integration',
+        'version': '2.0.0',
+        'timestamp': datetime.now().isoformat(),
+        'message': 'Vercel deployment successful! ✅',
+        'base_url': base_url,
+        'endpoints': {
+            'health_check': f"{base_url}/health",
+            'api_root': f"{base_url}/api/index",
+            'webhook_handler': f"{base_url}/api/webhook",
+            'loopy_webhooks': {
+                'rewards': f"{base_url}/webhook/rewards", 
+                'enrolled': f"{base_url}/webhook/enrolled",
+                'stamp': f"{base_url}/webhook/stamp"
+            }
+        },
+        'configuration': {
+            'munch_api_configured': bool(config.munch_api_key),
+            'webhook_configured': bool(config.webhook_url),
+            'rewards_webhook_configured': bool(config.rewards_webhook_url),
+            'campaign_configured': bool(config.campaign_id)
+        },
+        'usage': {
+            'test_webhook': f"curl -X POST {base_url}/webhook/rewards -H 'Content-Type: application/json' -d '{{\"test\": true}}'",
+            'health_check': f"curl {base_url}/health"
+        }
+    }
+    
+    return response
+
 class handler(BaseHTTPRequestHandler):
+    def send_response(self, code, message=None):
+        """Every response says whether this container was already warm"""
+        super().send_response(code, message)
+        self.send_header('X-Container-State', container_state_header(begin_invocation()))
+    
     def do_GET(self):
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         
-        # Get base URL from request
-        host = self.headers.get('Host', 'localhost')
-        protocol = 'https' if 'vercel.app' in host else 'http'
-        base_url = f"{protocol}://{host}"
-        
-        response = {
-            'status': 'healthy',
-            'service': 'loopy_munch_integration',
-            'version': '2.0.0',
-            'timestamp': datetime.now().isoformat(),
-            'message': 'Vercel deployment successful! ✅',
-            'base_url': base_url,
-            'endpoints': {
-                'health_check': f"{base_url}/health",
-                'api_root': f"{base_url}/api/index",
-                'webhook_handler': f"{base_url}/api/webhook",
-                'loopy_webhooks': {
-                    'rewards': f"{base_url}/webhook/rewards", 
-                    'enrolled': f"{base_url}/webhook/enrolled",
-                    'stamp': f"{base_url}/webhook/stamp"
-                }
-            },
-            'configuration': {
-                'munch_api_configured': bool(os.getenv('MUNCH_API_KEY')),
-                'webhook_configured': bool(os.getenv('WEBHOOK_URL')),
-                'rewards_webhook_configured': bool(os.getenv('REWARDS_WEBHOOK_URL')),
-                'campaign_configured': bool(os.getenv('CAMPAIGN_ID'))
-            },
-            'usage': {
-                'test_webhook': f"curl -X POST {base_url}/webhook/rewards -H 'Content-Type: application/json' -d '{{\"test\": true}}'",
-                'health_check': f"curl {base_url}/health"
-            }
-        }
+        # Base URL comes from the request's Host header
+        response = build_index_response(self.headers.get('Host', 'localhost'))
         
         self.wfile.write(json.dumps(response, indent=2).encode())
         return 
\ No newline at end of file
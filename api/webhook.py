@@ -1,76 +1,347 @@
-import json
 import os
-import requests
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
+# Shared integration modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, classify_event
+from priority_lanes import LaneScheduler
+from deposit_ledger import DepositLedger
+from keyed_executor import KeyedExecutor
+import json_backend
+from loopy_schema import LoopySchemaError, webhook_validator
+from card_state_store import get_card_state_store, record_webhook_event
+from app_config import get_config, getenv
+from warm_state import STATE, begin_invocation, container_state_header
+
+# One controller and scheduler per process, shared by every request this instance serves
+ADMISSION = AdmissionController()
+LANES = LaneScheduler()
+LEDGER = DepositLedger()
+
+# Bulk ingestion: events in flight per request, and the per-card executor (started on first use)
+BULK_WINDOW = int(getenv('BULK_WINDOW', '256'))
+BULK_MAX_LINE_BYTES = 1024 * 1024
+# A gzip body may not inflate past this, however small it was on the wire
+BULK_MAX_INFLATED_BYTES = int(getenv('BULK_MAX_INFLATED_BYTES', str(512 * 1024 * 1024)))
+_bulk_executor = None
+
+def get_webhook_endpoint(path):
+    """Extract the endpoint after /webhook/ (e.g. "rewards", "enrolled", "stamp")"""
+    path_parts = urlparse(path).path.strip('/').split('/')
+    if 'webhook' in path_parts:
+        webhook_index = path_parts.index('webhook')
+        if webhook_index + 1 < len(path_parts):
+            return path_parts[webhook_index + 1]
+    return None
+
+def build_webhook_response(endpoint, event, path):
+    """Process a validated Loopy event and build the JSON response"""
+    # Basic webhook processing
+    response = {
+        'status': 'success',
+        'message': 'Webhook received',
+        'timestamp': datetime.now().isoformat(),
+        'endpoint': endpoint,
+        'data_received': bool(event.raw),
+        'path': path
+    }
+    
+    # Process if it's a rewards webhook
+    if event.has_card:
+        total_stamps = event.total_stamps
+        customer_email = event.email
+        
+        # Precompiled per-campaign rule kept warm (reloaded only if the rules file changes)
+        reward = STATE.get('rules').evaluate(event.campaign_id, total_stamps)
+        if reward is None:
+            response['warning'] = f'No reward rule for campaign {event.campaign_id}'
+        
+        if reward and reward.rewards > 0 and customer_email:
+            response.update({
+                'customer_email': customer_email,
+                'total_stamps': total_stamps,
+                'free_coffees': reward.rewards,
+                'credit_amount': reward.value_rands
+            })
+            
+            # Forward to Make.com
+            webhook_url = get_config().rewards_webhook_url
+            if webhook_url:
+                try:
+                    make_response = STATE.session('make').post(webhook_url, json=event.raw, timeout=10)
+                    response['forwarded_to_make'] = {
+                        'success': make_response.status_code == 200,
+                        'status_code': make_response.status_code
+                    }
+                except Exception as e:
+                    response['forwarded_to_make'] = {
+                        'success': False,
+                        'error': str(e)
+                    }
+    
+    return response
+
+def process_loopy_event(endpoint, data, path):
+    """Validation, dedup and processing shared by single and bulk webhooks"""
+    # One pass over the payload; every later stage reads the event, not the dict
+    try:
+        event = webhook_validator().validate(data)
+    except LoopySchemaError as e:
+        return {
+            'status': 'error',
+            'message': f'Invalid webhook: {e}',
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    # Keep the card's snapshot so later reads don't have to call Loopy
+    record_webhook_event(event)
+    
+    # Card events are processed at most once, however often Loopy sends them
+    event_key = None
+    if event.has_card:
+        event_key = LEDGER.event_key(endpoint, data)
+        if not LEDGER.claim_event(event_key, event.card_id):
+            return {
+                'status': 'duplicate',
+                'message': 'Event already processed',
+                'timestamp': datetime.now().isoformat(),
+                'endpoint': endpoint,
+                'card_id': event.card_id
+            }
+    
+    try:
+        response = build_webhook_response(endpoint, event, path)
+    except Exception:
+        if event_key:
+            LEDGER.release_event(event_key)
+        raise
+    
+    # A failed forward delivered nothing, so Loopy's retry must not be answered "duplicate"
+    if event_key and not response.get('forwarded_to_make', {}).get('success', True):
+        LEDGER.release_event(event_key)
+    return response
+
+def get_bulk_executor():
+    """Per-card executor for bulk ingestion, created on first use"""
+    global _bulk_executor
+    if _bulk_executor is None:
+        _bulk_executor = KeyedExecutor(int(getenv('BULK_WORKERS', '8')), name='bulk')
+    return _bulk_executor
+
+def iter_request_body(rfile, headers, chunk_size=65536):
+    """Yield the raw request body in chunks (Content-Length or chunked)"""
+    if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        while True:
+            size = int(rfile.readline().split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # Skip trailers
+                while rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            remaining = size
+            while remaining:
+                chunk = rfile.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            rfile.readline()
+    else:
+        remaining = int(headers.get('Content-Length', 0))
+        while remaining > 0:
+            chunk = rfile.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+def iter_inflated(chunks, max_bytes):
+    """Gunzip chunks at most one line's worth at a time, up to max_bytes in total"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    total = 0
+    for chunk in chunks:
+        while chunk:
+            piece = decompressor.decompress(chunk, BULK_MAX_LINE_BYTES)
+            chunk = decompressor.unconsumed_tail
+            total += len(piece)
+            if total > max_bytes:
+                raise ValueError(f'Decompressed body exceeds {max_bytes} bytes')
+            yield piece
+    yield decompressor.flush()
+
+def iter_ndjson_lines(chunks, gzipped, max_inflated_bytes=None):
+    """Incrementally decompress and split a body into NDJSON lines"""
+    if gzipped:
+        chunks = iter_inflated(chunks, BULK_MAX_INFLATED_BYTES if max_inflated_bytes is None else max_inflated_bytes)
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        if len(pending) > BULK_MAX_LINE_BYTES:
+            raise ValueError('NDJSON line exceeds 1 MB')
+        for line in lines:
+            yield line
+    for line in pending.split(b'\n'):
+        yield line
+
+def card_key(event):
+    """The Loopy card id of a decoded event, used to serialize work per card (None without one)"""
+    card_id = event['card'].get('id') if isinstance(event, dict) and isinstance(event.get('card'), dict) else None
+    return card_id if isinstance(card_id, (str, int)) and card_id != '' else None
+
+def run_bulk_event(line_number, event, path):
+    """Process one decoded NDJSON event through the shared pipeline"""
+    # Backfill lines carry their own endpoint, defaulting to rewards
+    endpoint = 'rewards'
+    if isinstance(event, dict) and isinstance(event.get('endpoint'), str):
+        endpoint = event.pop('endpoint')
+    
+    try:
+        result = process_loopy_event(endpoint, event, path)
+    except Exception as e:
+        result = {'status': 'error', 'message': str(e)}
+    result['line'] = line_number
+    return result
+
+def process_bulk_stream(lines, path):
+    """
+    Run NDJSON events through the pipeline and yield results in input order
+    Events for the same card run in order; different cards run in parallel
+    """
+    executor = get_bulk_executor()
+    window = deque()
+    summary = {'lines': 0, 'success': 0, 'duplicate': 0, 'error': 0}
+    started = time.monotonic()
+    
+    def finish(future):
+        result = future.result()
+        status = result.get('status')
+        summary[status if status in ('success', 'duplicate') else 'error'] += 1
+        return result
+    
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        summary['lines'] += 1
+        
+        try:
+            event = json_backend.loads(line)
+        except ValueError as e:
+            future = Future()
+            future.set_result({'line': line_number, 'status': 'error', 'message': f'Invalid JSON: {e}'})
+            window.append(future)
+        else:
+            # Shard by card id so one card's events never race each other
+            key = card_key(event) or line_number
+            window.append(executor.submit(key, run_bulk_event, line_number, event, path))
+        
+        while len(window) >= BULK_WINDOW or (window and window[0].done()):
+            yield finish(window.popleft())
+    
+    while window:
+        yield finish(window.popleft())
+    
+    elapsed = time.monotonic() - started
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['events_per_minute'] = round(summary['lines'] / elapsed * 60) if elapsed > 0 else 0
+    yield {'summary': summary}
+
+def decode_webhook_body(post_data):
+    """Decode a single-event webhook body"""
+    if not post_data:
+        return {}
+    return json_backend.loads(post_data)
+
+def is_gzip_body(headers):
+    """True when a bulk body is gzip-compressed"""
+    encoding = headers.get('Content-Encoding', '').lower()
+    content_type = headers.get('Content-Type', '').lower()
+    return 'gzip' in encoding or 'gzip' in content_type
+
+def build_error_response(error):
+    """JSON body for a webhook that failed with an exception"""
+    return {
+        'status': 'error',
+        'message': str(error),
+        'timestamp': datetime.now().isoformat()
+    }
+
+def build_rejection_response(decision):
+    """JSON body for a webhook shed by admission control"""
+    return {
+        'status': 'rejected',
+        'message': f'Webhook handler overloaded: {decision.reason}',
+        'event_class': decision.event_class,
+        'retry_after': decision.retry_after,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def build_webhook_info():
+    """Describe the webhook endpoint and its current load"""
+    response = {
+        'status': 'ready',
+        'service': 'loopy_webhook_handler',
+        'message': 'Webhook endpoint ready to receive POST requests',
+        'available_endpoints': [
+            '/api/webhook/rewards',
+            '/api/webhook/enrolled',
+            '/api/webhook/stamp',
+            '/api/webhook/bulk'
+        ],
+        'admission': ADMISSION.get_metrics(),
+        'lanes': LANES.get_metrics(),
+        'card_state': get_card_state_store().get_stats(),
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    return response
+
 class handler(BaseHTTPRequestHandler):
+    def send_response(self, code, message=None):
+        """Every response says whether this container was already warm"""
+        super().send_response(code, message)
+        self.send_header('X-Container-State', container_state_header(begin_invocation()))
+    
     def do_POST(self):
         """Handle POST requests for Loopy webhooks"""
+        # Shed load before reading the body so an overloaded instance answers fast
+        decision = ADMISSION.try_admit(classify_event(get_webhook_endpoint(self.path)))
+        if not decision.admitted:
+            self.send_rejection(decision)
+            return
+        
+        started = time.monotonic()
+        try:
+            self.process_webhook(decision.event_class)
+        finally:
+            ADMISSION.release(decision, time.monotonic() - started)
+    
+    def process_webhook(self, event_class):
+        """Read, process and answer an admitted webhook"""
+        if get_webhook_endpoint(self.path) == 'bulk':
+            self.process_bulk()
+            return
+        
         try:
             # Get content length
             content_length = int(self.headers.get('Content-Length', 0))
             
             # Read request body
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-            else:
-                data = {}
-            
-            # Parse path to get endpoint
-            parsed_path = urlparse(self.path)
-            path_parts = parsed_path.path.strip('/').split('/')
+            data = decode_webhook_body(self.rfile.read(content_length) if content_length > 0 else b'')
             
-            # Extract endpoint (e.g., "rewards", "enrolled", "stamp")
-            endpoint = None
-            if 'webhook' in path_parts:
-                webhook_index = path_parts.index('webhook')
-                if webhook_index + 1 < len(path_parts):
-                    endpoint = path_parts[webhook_index + 1]
-            
-            # Basic webhook processing
-            response = {
-                'status': 'success',
-                'message': 'Webhook received',
-                'timestamp': datetime.now().isoformat(),
-                'endpoint': endpoint,
-                'data_received': bool(data),
-                'path': self.path
-            }
-            
-            # Process if it's a rewards webhook
-            if 'card' in data:
-                card_data = data.get('card', {})
-                total_stamps = card_data.get('totalStampsEarned', 0)
-                customer_details = card_data.get('customerDetails', {})
-                customer_email = customer_details.get('email')
-                
-                free_coffees = total_stamps // 12  # 12 stamps per coffee
-                
-                if free_coffees > 0 and customer_email:
-                    response.update({
-                        'customer_email': customer_email,
-                        'total_stamps': total_stamps,
-                        'free_coffees': free_coffees,
-                        'credit_amount': free_coffees * 40
-                    })
-                    
-                    # Forward to Make.com
-                    webhook_url = os.getenv('REWARDS_WEBHOOK_URL')
-                    if webhook_url:
-                        try:
-                            make_response = requests.post(webhook_url, json=data, timeout=10)
-                            response['forwarded_to_make'] = {
-                                'success': make_response.status_code == 200,
-                                'status_code': make_response.status_code
-                            }
-                        except Exception as e:
-                            response['forwarded_to_make'] = {
-                                'success': False,
-                                'error': str(e)
-                            }
+            # Run the processing on the event's priority lane
+            endpoint = get_webhook_endpoint(self.path)
+            response = LANES.submit_keyed(event_class, card_key(data), process_loopy_event,
+                                          endpoint, data, self.path).result()
             
             # Send successful response
             self.send_response(200)
@@ -80,7 +351,7 @@ class handler(BaseHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Headers', 'Content-Type')
             self.end_headers()
             
-            self.wfile.write(json.dumps(response).encode())
+            self.wfile.write(json_backend.dumps(response))
             
         except Exception as e:
             # Send error response
@@ -89,13 +360,40 @@ class handler(BaseHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             
-            error_response = {
-                'status': 'error',
-                'message': str(e),
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self.wfile.write(json.dumps(error_response).encode())
+            self.wfile.write(json_backend.dumps(build_error_response(e)))
+    
+    def process_bulk(self):
+        """Ingest a (optionally gzip-compressed) NDJSON stream, streaming results back"""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        # Results are streamed without a length, so the connection ends the response
+        self.close_connection = True
+        
+        lines = iter_ndjson_lines(iter_request_body(self.rfile, self.headers), is_gzip_body(self.headers))
+        try:
+            for result in process_bulk_stream(lines, self.path):
+                self.wfile.write(json_backend.dumps_line(result))
+        except Exception as e:
+            error = {'status': 'error', 'message': f'Bulk ingestion aborted: {e}'}
+            self.wfile.write(json_backend.dumps_line(error))
+    
+    def send_rejection(self, decision):
+        """Answer a shed request with 429/503 and Retry-After"""
+        self.send_response(decision.status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Retry-After', str(decision.retry_after))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        # The unread body makes this connection unusable for another request
+        self.close_connection = True
+        
+        response = build_rejection_response(decision)
+        
+        self.wfile.write(json_backend.dumps(response))
     
     def do_GET(self):
         """Handle GET requests for webhook info"""
@@ -104,19 +402,9 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         
-        response = {
-            'status': 'ready',
-            'service': 'loopy_webhook_handler',
-            'message': 'Webhook endpoint ready to receive POST requests',
-            'available_endpoints': [
-                '/api/webhook/rewards',
-                '/api/webhook/enrolled',
-                '/api/webhook/stamp'
-            ],
-            'timestamp': datetime.now().isoformat()
-        }
+        response = build_webhook_info()
         
-        self.wfile.write(json.dumps(response).encode())
+        self.wfile.write(json_backend.dumps(response))
     
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Application Configuration
+=========================
+
+Credentials, URLs and campaign ids for the Munch and Loopy APIs,
+resolved once on first use and read-only afterwards.
+
+WHY:
+Every module used to call load_dotenv('production.env') when imported
+and read os.getenv() inside the functions that handle rewards. Importing
+python-dotenv and parsing the file slowed cold starts even for handlers
+that never needed it.
+
+HOW IT WORKS:
+1. Importing this module does nothing beyond defining the class
+2. The first get_config() call loads production.env (existing
+   environment variables win, as with load_dotenv) and snapshots the
+   values into an immutable AppConfig
+3. Every later call returns the same object
+4. Settings that are not part of AppConfig (store paths, pool sizes,
+   tuning knobs) are read with getenv(), which loads the env file first
+   so production.env reaches them however early they are read
+
+ENV_FILE overrides the env file path; reset_config() forces a reload.
+"""
+
+import os
+import threading
+import time
+
+DEFAULT_ENV_FILE = 'production.env'
+DEFAULT_MUNCH_BASE_URL = 'https://api.munch.cloud/api'
+DEFAULT_LOOPY_BASE_URL = 'https://app.loopyloyalty.com/api'
+
+
+class AppConfig:
+    """Immutable snapshot of the integration's configuration"""
+
+    __slots__ = ('munch_api_key', 'munch_org_id', 'munch_base_url',
+                 'loopy_base_url', 'loopy_username', 'loopy_api_key', 'loopy_api_secret',
+                 'campaign_ids', 'webhook_url', 'rewards_webhook_url',
+                 'env_file', 'loaded_at', 'load_seconds')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"AppConfig is read-only (tried to set {name})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"AppConfig is read-only (tried to delete {name})")
+
+    @property
+    def campaign_id(self):
+        """First configured campaign (the single CAMPAIGN_ID most scripts expect)"""
+        return self.campaign_ids[0] if self.campaign_ids else None
+
+    @property
+    def has_munch_credentials(self):
+        return bool(self.munch_api_key and self.munch_org_id)
+
+    @property
+    def has_loopy_credentials(self):
+        return bool(self.loopy_username and self.loopy_api_secret)
+
+    def __repr__(self):
+        return (f"AppConfig(munch_org_id={self.munch_org_id!r}, campaign_ids={self.campaign_ids!r}, "
+                f"env_file={self.env_file!r})")
+
+    @classmethod
+    def from_environ(cls, environ=None, env_file=None, load_seconds=0.0):
+        """Build from an environment mapping (os.environ by default)"""
+
+        environ = os.environ if environ is None else environ
+        campaign_ids = tuple(c.strip() for c in (environ.get('CAMPAIGN_ID') or '').split(',') if c.strip())
+
+        return cls(
+            munch_api_key=environ.get('MUNCH_API_KEY'),
+            munch_org_id=environ.get('MUNCH_ORG_ID'),
+            munch_base_url=environ.get('MUNCH_BASE_URL') or DEFAULT_MUNCH_BASE_URL,
+            loopy_base_url=environ.get('LOOPY_BASE_URL') or DEFAULT_LOOPY_BASE_URL,
+            loopy_username=environ.get('LOOPY_USERNAME'),
+            loopy_api_key=environ.get('LOOPY_API_KEY'),
+            loopy_api_secret=environ.get('LOOPY_API_SECRET'),
+            campaign_ids=campaign_ids,
+            webhook_url=environ.get('WEBHOOK_URL'),
+            rewards_webhook_url=environ.get('REWARDS_WEBHOOK_URL'),
+            env_file=env_file,
+            loaded_at=time.time(),
+            load_seconds=load_seconds
+        )
+
+
+_config = None
+_env_file = None
+_lock = threading.Lock()
+
+
+def load_env_file(path):
+    """
+    Load KEY=value lines into os.environ without overriding existing values
+    Returns whether the file was read
+    """
+
+    if not os.path.isfile(path):
+        return False
+
+    # Imported here so that importing this module stays free
+    from dotenv import load_dotenv
+    load_dotenv(path)
+    return True
+
+
+def _ensure_env_file():
+    """Load ENV_FILE once per process (caller holds _lock); returns its path, or None if it was missing"""
+
+    global _env_file
+    if _env_file is None:
+        env_file = os.getenv('ENV_FILE', DEFAULT_ENV_FILE)
+        _env_file = (env_file if load_env_file(env_file) else None,)
+    return _env_file[0]
+
+
+def get_config():
+    """The process-wide configuration, loaded on first call"""
+
+    global _config
+    config = _config
+    if config is not None:
+        return config
+
+    with _lock:
+        if _config is None:
+            started = time.perf_counter()
+            env_file = _ensure_env_file()
+            _config = AppConfig.from_environ(env_file=env_file, load_seconds=time.perf_counter() - started)
+        return _config
+
+
+def getenv(name, default=None):
+    """os.getenv() for settings outside AppConfig, after the env file is loaded"""
+
+    if _env_file is None:
+        with _lock:
+            _ensure_env_file()
+    return os.environ.get(name, default)
+
+
+def reset_config():
+    """Forget the loaded configuration; the next get_config() or getenv() reloads it"""
+
+    global _config, _env_file
+    with _lock:
+        _config = None
+        _env_file = None
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Historical Loopy Card Backfill
+==============================
+
+Credits every historical card of a campaign (e.g. when a store is
+onboarded), safely resumable after a crash or Ctrl+C.
+
+HOW IT WORKS:
+1. The campaign is split into chunks of `--chunk-size` cards (one Loopy
+   page each); a pool of `--workers` threads fetches, reconciles and
+   settles chunks in parallel
+2. The checkpoint file records the offset below which every chunk is
+   complete. Chunks finish out of order, so the checkpoint only moves
+   when the chunks before it are done, and is written atomically
+3. A restarted run continues from that offset. Chunks past it that had
+   already finished are processed again, which is safe: reconciliation
+   pays only earned minus credited and every deposit is claimed in the
+   deposit ledger before it is sent, so nothing is paid twice
+4. A progress line shows chunks, cards/s, deposits and an ETA
+
+Usage:
+    python backfill_loopy_cards.py [campaign_id] [--chunk-size 100] [--workers 4]
+                                   [--checkpoint FILE] [--restart] [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from app_config import get_config, getenv
+from deposit_ledger import NOT_PERSISTENT_ERROR
+from loopy_cards import LoopyCardPager, LoopyPageError
+from reconciliation import Reconciler, load_directory
+from reward_rules import cents_to_rands
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_WORKERS = 4
+PROGRESS_INTERVAL = 5.0
+
+
+class Checkpoint:
+    """Committed progress of one campaign's backfill, stored as JSON"""
+
+    def __init__(self, path, campaign_id, chunk_size):
+        self.path = path
+        self.campaign_id = campaign_id
+        self.chunk_size = chunk_size
+        self.data = {
+            'campaign_id': campaign_id,
+            'chunk_size': chunk_size,
+            'next_offset': 0,
+            'cards': 0,
+            'deposited': 0,
+            'deposited_cents': 0,
+            'failed': 0,
+            'started_at': datetime.now().isoformat(),
+            'updated_at': None,
+            'completed': False
+        }
+
+    def load(self):
+        """Adopt a saved checkpoint; returns whether one was found"""
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if saved.get('campaign_id') != self.campaign_id:
+            raise ValueError(f"Checkpoint {self.path} belongs to campaign {saved.get('campaign_id')}")
+        if saved.get('chunk_size') != self.chunk_size:
+            raise ValueError(f"Checkpoint {self.path} used --chunk-size {saved.get('chunk_size')}")
+
+        self.data.update(saved)
+        return True
+
+    def commit(self, **values):
+        self.data.update(values)
+        self.data['updated_at'] = datetime.now().isoformat()
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+class Backfill:
+    """Chunked, concurrent, resumable settlement of a campaign's cards"""
+
+    def __init__(self, campaign_id, integration, checkpoint, workers=DEFAULT_WORKERS, dry_run=False):
+        self.campaign_id = campaign_id
+        self.integration = integration
+        self.checkpoint = checkpoint
+        self.chunk_size = checkpoint.chunk_size
+        self.workers = workers
+        self.dry_run = dry_run
+
+        if not dry_run and not integration.ledger.persistent:
+            raise RuntimeError(NOT_PERSISTENT_ERROR)
+
+        directory = load_directory(integration)
+        if directory is None:
+            raise RuntimeError('Could not download the Munch customer directory')
+        self.directory = directory
+
+        self.pager = LoopyCardPager(campaign_id, page_size=self.chunk_size)
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        # Totals for this run (the checkpoint holds the committed ones)
+        self.cards = 0
+        self.owed = 0
+        self.deposited = 0
+        self.deposited_cents = 0
+        self.failed = 0
+        self.started = None
+        self._last_progress = 0.0
+
+    def process_chunk(self, offset):
+        """Fetch, reconcile and settle one chunk; returns (offset, rows, stats)"""
+
+        rows = self.pager.fetch_page(offset).get('rows') or []
+        reconciler = Reconciler(self.directory, ledger=self.integration.ledger)
+        deposited = deposited_cents = failed = 0
+
+        for owed in reconciler.reconcile(rows, self.campaign_id):
+            if self.dry_run:
+                continue
+            result = reconciler.settle(owed, self.integration)
+            if result['success']:
+                deposited += 1
+                # What was actually paid: a webhook may have credited part of it since the probe
+                deposited_cents += result['amount_cents']
+            elif not result.get('already_credited'):
+                failed += 1
+
+        with self._lock:
+            self.cards += len(rows)
+            self.owed += reconciler.stats['owed']
+            self.deposited += deposited
+            self.deposited_cents += deposited_cents
+            self.failed += failed
+
+        return offset, len(rows), {'deposited': deposited, 'deposited_cents': deposited_cents,
+                                   'failed': failed, 'cards': len(rows)}
+
+    def run(self):
+        """Process every chunk from the checkpoint onwards; returns the final checkpoint data"""
+
+        self.started = time.monotonic()
+        committed = self.checkpoint.data['next_offset']
+
+        # The first page tells how many cards there are
+        total_rows = self.pager.fetch_page(0).get('total_rows')
+        self.total_rows = int(total_rows) if total_rows is not None else None
+
+        next_offset = committed
+        finished = {}
+        end_offset = None
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as pool:
+            while True:
+                while (not self.stopping.is_set() and len(in_flight) < self.workers * 2
+                       and (end_offset is None or next_offset < end_offset)
+                       and (self.total_rows is None or next_offset < self.total_rows)):
+                    in_flight[pool.submit(self.process_chunk, next_offset)] = next_offset
+                    next_offset += self.chunk_size
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset = in_flight.pop(future)
+                    try:
+                        _, count, stats = future.result()
+                    except Exception as e:
+                        # Later chunks may finish, but the checkpoint stays below this one
+                        print(f"❌ Chunk at offset {offset} failed: {e}")
+                        self.stopping.set()
+                        continue
+
+                    finished[offset] = stats
+                    if count < self.chunk_size:
+                        end_offset = offset + self.chunk_size if end_offset is None else min(
+                            end_offset, offset + self.chunk_size)
+
+                # Advance the checkpoint over the contiguous run of finished chunks
+                advanced = False
+                totals = dict(self.checkpoint.data)
+                while committed in finished:
+                    stats = finished.pop(committed)
+                    for key in ('cards', 'deposited', 'deposited_cents', 'failed'):
+                        totals[key] += stats[key]
+                    committed += self.chunk_size
+                    advanced = True
+                if advanced and not self.dry_run:
+                    self.checkpoint.commit(next_offset=committed, cards=totals['cards'],
+                                           deposited=totals['deposited'],
+                                           deposited_cents=totals['deposited_cents'],
+                                           failed=totals['failed'])
+
+                self.report_progress(committed)
+
+        reached_end = ((end_offset is not None and committed >= end_offset)
+                       or (self.total_rows is not None and committed >= self.total_rows))
+        if reached_end and not self.stopping.is_set() and not self.dry_run:
+            self.checkpoint.commit(completed=True)
+        self.report_progress(committed, force=True)
+        return self.checkpoint.data
+
+    def report_progress(self, committed, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+
+        elapsed = now - self.started
+        rate = self.cards / elapsed if elapsed else 0.0
+        if self.total_rows:
+            remaining = max(self.total_rows - committed, 0)
+            eta = f"{remaining / rate:.0f}s" if rate else 'unknown'
+            position = f"{min(committed, self.total_rows)}/{self.total_rows} cards"
+        else:
+            eta = 'unknown'
+            position = f"{committed} cards"
+
+        print(f"   ⏳ {position} committed | {rate:.1f} cards/s | owed {self.owed} | "
+              f"deposited {self.deposited} (R{cents_to_rands(self.deposited_cents)}) | "
+              f"failed {self.failed} | ETA {eta}")
+
+
+def checkpoint_path(campaign_id):
+    return getenv('BACKFILL_CHECKPOINT') or f'backfill_{campaign_id}.checkpoint.json'
+
+
+def main():
+    from secure_munch_integration import SecureMunchIntegration
+
+    parser = argparse.ArgumentParser(description='Credit every historical card of a Loopy campaign')
+    parser.add_argument('campaign_id', nargs='?', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Cards per chunk (one Loopy page)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Chunks processed in parallel')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default backfill_<campaign>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    parser.add_argument('--dry-run', action='store_true', help='Reconcile and report without depositing')
+    args = parser.parse_args()
+
+    campaign_id = args.campaign_id or get_config().campaign_id
+    if not campaign_id:
+        print("❌ No campaign id given and CAMPAIGN_ID is not set")
+        return
+
+    print("📚 LOOPY HISTORICAL BACKFILL")
+    print("=" * 60)
+
+    checkpoint = Checkpoint(args.checkpoint or checkpoint_path(campaign_id), campaign_id, args.chunk_size)
+    try:
+        resumed = not args.restart and checkpoint.load()
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    if checkpoint.data.get('completed'):
+        print(f"✅ Campaign {campaign_id} was already backfilled ({checkpoint.data['cards']} cards); "
+              f"use --restart to run again")
+        return
+    if resumed:
+        print(f"↩️ Resuming from offset {checkpoint.data['next_offset']} ({checkpoint.path})")
+
+    try:
+        backfill = Backfill(campaign_id, SecureMunchIntegration(), checkpoint,
+                            workers=args.workers, dry_run=args.dry_run)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        return
+
+    def stop(signum, frame):
+        print("\n🛑 Stopping after the chunks in progress (checkpoint is kept)...")
+        backfill.stopping.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        data = backfill.run()
+    except LoopyPageError as e:
+        print(f"❌ {e}")
+        return
+
+    print()
+    print(f"📊 Campaign {campaign_id}: {data['cards']} cards committed, next offset {data['next_offset']}")
+    print(f"   ✅ Deposited: {data['deposited']} (R{cents_to_rands(data['deposited_cents'])})")
+    print(f"   ❌ Failed: {data['failed']} (deposits Munch refused are retried by the next run; "
+          f"ones without an answer stay claimed in the ledger: check Munch and review them manually)")
+    if args.dry_run:
+        print(f"🔍 Dry run: {backfill.owed} reward(s) owed in {backfill.cards} cards; checkpoint not written")
+    elif data.get('completed'):
+        print("🏁 Backfill complete")
+    else:
+        print(f"↩️ Run again to resume from {checkpoint.path}")
+
+
+if __name__ == "__main__":
+    main()
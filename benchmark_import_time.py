@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Import-Time Benchmark
+=====================
+
+Measures the cold-start cost of importing each service module, the way
+a fresh serverless container or worker process pays it.
+
+HOW IT WORKS:
+1. Every module is imported in a brand-new interpreter with
+   `python -X importtime`, several times, keeping the fastest run
+2. The cumulative import time of the module itself is reported, plus
+   the heaviest dependencies it pulled in
+3. Interpreter startup (`python -c pass`) is shown as the floor
+
+Usage:
+    python benchmark_import_time.py [--runs 5] [--top 3] [module ...]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODULES = [
+    'app_config',
+    'json_backend',
+    'loopy_schema',
+    'reward_rules',
+    'secure_munch_integration',
+    'api.health',
+    'api.index',
+    'api.webhook',
+    'loopy_make_integration',
+    'vercel_local_runtime'
+]
+
+
+def parse_importtime(stderr):
+    """Map module name -> (self us, cumulative us) from -X importtime output"""
+
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        timings[parts[2].strip()] = (self_us, cumulative_us)
+    return timings
+
+
+def measure_import(module, runs):
+    """
+    Fastest of `runs` cold imports
+    Returns (wall seconds, cumulative us, timings) or None if the import fails
+    """
+
+    best = None
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - started
+
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()
+            print(f"❌ {module}: {error[-1] if error else 'import failed'}")
+            return None
+
+        timings = parse_importtime(result.stderr)
+        cumulative = timings.get(module, (0, 0))[1]
+        if best is None or cumulative < best[1]:
+            best = (wall, cumulative, timings)
+
+    return best
+
+
+def interpreter_floor(runs):
+    """
+    Fastest `python -c pass` wall time, and the modules the interpreter
+    imports at startup (site, encodings...), which no module pays for
+    """
+
+    best = None
+    startup_modules = set()
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'],
+                                cwd=ROOT_DIR, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        startup_modules.update(parse_importtime(result.stderr))
+    return best, startup_modules
+
+
+def heaviest_dependencies(module, timings, top, startup_modules):
+    """Largest top-level imports the module pulled in (excluding its own package)"""
+
+    package = module.split('.')[0]
+    candidates = [
+        (cumulative, name) for name, (_, cumulative) in timings.items()
+        if name.split('.')[0] != package and '.' not in name and name not in startup_modules
+    ]
+    return sorted(candidates, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold import time of the service modules')
+    parser.add_argument('modules', nargs='*', help='Modules to measure (default: the service modules)')
+    parser.add_argument('--runs', type=int, default=5, help='Cold imports per module; the fastest is kept')
+    parser.add_argument('--top', type=int, default=3, help='Heaviest dependencies to list per module')
+    args = parser.parse_args()
+
+    modules = args.modules or DEFAULT_MODULES
+
+    print("⏱️ IMPORT-TIME BENCHMARK")
+    print("=" * 72)
+    floor, startup_modules = interpreter_floor(args.runs)
+    print(f"Interpreter startup (python -c pass): {floor * 1000:.1f}ms")
+    print()
+    print(f"{'module':<28} {'import':>10} {'process':>10}   heaviest dependencies")
+    print("-" * 72)
+
+    for module in modules:
+        measured = measure_import(module, args.runs)
+        if measured is None:
+            continue
+        wall, cumulative, timings = measured
+        heavy = ', '.join(f"{name} {us / 1000:.0f}ms"
+                          for us, name in heaviest_dependencies(module, timings, args.top, startup_modules))
+        print(f"{module:<28} {cumulative / 1000:>8.1f}ms {wall * 1000:>8.1f}ms   {heavy}")
+
+
+if __name__ == "__main__":
+    main()
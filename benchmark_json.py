@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+JSON Backend Microbenchmark
+===========================
+
+Compares the old webhook JSON handling with json_backend.py on
+realistic Loopy payloads:
+
+1. Decode: json.loads(body.decode('utf-8')) vs json_backend.loads(body)
+2. Encode: json.dumps(response).encode() / indent=2 vs json_backend.dumps()
+3. NDJSON: parse and re-encode a 10,000-line bulk backfill
+
+Usage:
+    python benchmark_json.py [--iterations 20000]
+    JSON_BACKEND=json python benchmark_json.py   # stdlib baseline
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import json_backend
+
+FIRST_NAMES = ['Thandi', 'Pieter', 'Aisha', 'Johan', 'Lerato', 'Sipho', 'Megan', 'Ravi']
+LAST_NAMES = ['Nkosi', 'van der Merwe', 'Patel', 'Botha', 'Dlamini', 'Smith', 'Naidoo']
+
+
+def make_card(rng, card_number):
+    """A card object shaped like the Loopy /card and webhook payloads"""
+
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    stamps = rng.randint(0, 60)
+    created = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 400000))
+
+    return {
+        'id': f'{card_number:08x}-1c2d-4e5f-9a8b-{rng.getrandbits(48):012x}',
+        'campaignID': '7sF2mQ9xTzK4pLw8vB3nYc',
+        'totalStampsEarned': stamps,
+        'totalRewardsEarned': stamps // 12,
+        'totalRewardsRedeemed': rng.randint(0, stamps // 12),
+        'currentStamps': stamps % 12,
+        'passStatus': rng.choice(['active', 'installed', 'uninstalled']),
+        'createdAt': created.isoformat() + 'Z',
+        'updatedAt': (created + timedelta(days=rng.randint(0, 90))).isoformat() + 'Z',
+        'customerDetails': {
+            'Name': f'{first} {last}',
+            'Email address': f'{first.lower()}.{last.lower().replace(" ", "")}{card_number}@example.co.za',
+            'Contact Number': f'+2782{rng.randint(1000000, 9999999)}',
+            'Birthday': f'{rng.randint(1970, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'Marketing opt-in': rng.choice(['Yes', 'No'])
+        },
+        'events': [
+            {
+                'type': 'stamp.added',
+                'stamps': 1,
+                'timestamp': (created + timedelta(hours=i * 30)).isoformat() + 'Z',
+                'location': 'Bird Coffee - Kloof Street'
+            }
+            for i in range(min(stamps, 8))
+        ]
+    }
+
+
+def make_webhook(rng, card_number):
+    return {
+        'event': 'rewards.updated',
+        'timestamp': datetime(2025, 6, 1).isoformat(),
+        'card': make_card(rng, card_number)
+    }
+
+
+def make_response(webhook_data):
+    """A webhook response like api/webhook.py returns for a reward"""
+
+    card = webhook_data['card']
+    return {
+        'status': 'success',
+        'endpoint': 'rewards',
+        'customer_name': card['customerDetails']['Name'],
+        'customer_email': card['customerDetails']['Email address'],
+        'total_stamps': card['totalStampsEarned'],
+        'free_coffees': card['totalStampsEarned'] // 12,
+        'credit_amount': card['totalStampsEarned'] // 12 * 40,
+        'forwarded_to_make': {'success': True, 'status_code': 200},
+        'timestamp': datetime(2025, 6, 1, 12, 0).isoformat()
+    }
+
+
+def measure(fn, iterations):
+    """Best-of-three operations per second"""
+
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return iterations / best
+
+
+def report(name, before, after):
+    print(f"{name:<34} {before:>12,.0f}/s {after:>12,.0f}/s {after / before:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark json_backend against the stdlib webhook path')
+    parser.add_argument('--iterations', type=int, default=20000, help='Operations per single-payload test')
+    parser.add_argument('--lines', type=int, default=10000, help='Lines in the NDJSON backfill test')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    webhook_data = make_webhook(rng, 1)
+    body = json.dumps(webhook_data).encode()
+    response = make_response(webhook_data)
+    health = {
+        'status': 'healthy',
+        'service': 'loopy_munch_integration',
+        'version': '2.0.0',
+        'timestamp': datetime.now().isoformat(),
+        'environment_checks': {name: True for name in ('munch_api_key', 'munch_org_id', 'webhook_url',
+                                                       'rewards_webhook_url', 'campaign_id')},
+        'message': '✅ All systems operational!'
+    }
+    ndjson_lines = [json.dumps(dict(make_webhook(rng, i), endpoint='rewards')).encode() for i in range(args.lines)]
+
+    print("⚡ JSON BACKEND BENCHMARK")
+    print("=" * 72)
+    print(f"Backend: {json_backend.BACKEND} | webhook body: {len(body)} bytes | "
+          f"NDJSON: {args.lines} lines, {sum(map(len, ndjson_lines)) // 1024} kB")
+    print()
+    print(f"{'':<34} {'before':>14} {'after':>14} {'speedup':>8}")
+    print("-" * 72)
+
+    iterations = args.iterations
+    report('decode webhook body',
+           measure(lambda: json.loads(body.decode('utf-8')), iterations),
+           measure(lambda: json_backend.loads(body), iterations))
+    report('encode webhook response',
+           measure(lambda: json.dumps(response).encode(), iterations),
+           measure(lambda: json_backend.dumps(response), iterations))
+    report('encode health (indent=2 -> compact)',
+           measure(lambda: json.dumps(health, indent=2).encode(), iterations),
+           measure(lambda: json_backend.dumps(health), iterations))
+
+    def ndjson_before():
+        for line in ndjson_lines:
+            json.dumps(json.loads(line)).encode() + b'\n'
+
+    def ndjson_after():
+        for line in ndjson_lines:
+            json_backend.dumps_line(json_backend.loads(line))
+
+    lines_per_run = len(ndjson_lines)
+    report('NDJSON backfill round-trip (lines)',
+           measure(ndjson_before, 1) * lines_per_run,
+           measure(ndjson_after, 1) * lines_per_run)
+
+    print()
+    print(f"Response size: {len(json.dumps(health, indent=2).encode())} bytes pretty -> "
+          f"{len(json_backend.dumps(health))} bytes compact (health)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Reward Computation Benchmark
+============================
+
+Compares the card-by-card reward computation (CompiledRule.evaluate per
+card, as reconciliation does) with reward_vectorized's NumPy path on
+synthetic campaigns of 100k and 1M cards, and checks both give the same
+totals.
+
+Usage:
+    python benchmark_rewards.py [--cards 100000 1000000] [--repeat 3]
+"""
+
+import argparse
+import random
+import time
+
+import reward_vectorized
+from reward_rules import STAMPS_PER_COFFEE, COFFEE_VALUE_CENTS, CompiledRule, cents_to_rands
+from reward_vectorized import CampaignColumns, compute_rewards_loop, compute_rewards_vectorized
+
+CAMPAIGN_ID = '7sF2mQ9xTzK4pLw8vB3nYc'
+
+
+def make_columns(rng, cards):
+    """A campaign like production: most cards short of a reward, some paid, a few inconsistent"""
+
+    card_ids, stamps, reported, redeemed, credited_rewards, credited_cents = [], [], [], [], [], []
+    for card_number in range(cards):
+        total_stamps = int(rng.expovariate(1 / 10))
+        earned = total_stamps // STAMPS_PER_COFFEE
+        paid = earned if rng.random() < 0.7 else rng.randint(0, earned)
+
+        card_ids.append(f'{card_number:08x}-card')
+        stamps.append(total_stamps)
+        # One card in a hundred disagrees with the rule; some have no count at all
+        reported.append(earned + 1 if rng.random() < 0.01 else (earned if rng.random() < 0.95 else -1))
+        redeemed.append(rng.randint(0, earned))
+        credited_rewards.append(paid)
+        credited_cents.append(paid * COFFEE_VALUE_CENTS)
+
+    return CampaignColumns(CAMPAIGN_ID, card_ids, stamps, reported, redeemed, credited_rewards, credited_cents,
+                           arrays=False)
+
+
+def best_of(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loop vs vectorized reward computation')
+    parser.add_argument('--cards', type=int, nargs='+', default=[100000, 1000000], help='Campaign sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is kept)')
+    args = parser.parse_args()
+
+    rule = CompiledRule(CAMPAIGN_ID, 'Coffee card', STAMPS_PER_COFFEE,
+                        [{'stamps': STAMPS_PER_COFFEE, 'value_cents': COFFEE_VALUE_CENTS, 'label': 'free coffee'}])
+    have_numpy = reward_vectorized.np is not None
+
+    print("🧮 REWARD COMPUTATION BENCHMARK")
+    print("=" * 72)
+    if not have_numpy:
+        print("⚠️ NumPy is not installed: only the loop path is measured (pip install -r requirements-benchmark.txt)")
+    print(f"{'cards':>10} {'loop':>12} {'numpy':>12} {'speedup':>9}   owed")
+    print("-" * 72)
+
+    rng = random.Random(42)
+    for cards in args.cards:
+        columns = make_columns(rng, cards)
+        loop_seconds, loop_summary = best_of(lambda: compute_rewards_loop(columns, rule), args.repeat)
+        loop_totals = loop_summary.totals()
+
+        if have_numpy:
+            arrays = CampaignColumns(CAMPAIGN_ID, columns.card_ids, columns.stamps, columns.reported_rewards,
+                                     columns.redeemed_rewards, columns.credited_rewards, columns.credited_cents)
+            numpy_seconds, numpy_summary = best_of(lambda: compute_rewards_vectorized(arrays, rule), args.repeat)
+            numpy_totals = numpy_summary.totals()
+            mismatched = [key for key in loop_totals if key != 'backend' and loop_totals[key] != numpy_totals[key]]
+            if mismatched:
+                print(f"❌ Results differ at {cards} cards: {mismatched}")
+                return
+            vectorized = f"{numpy_seconds * 1000:>10.1f}ms {loop_seconds / numpy_seconds:>8.1f}x"
+        else:
+            vectorized = f"{'-':>12} {'-':>9}"
+
+        print(f"{cards:>10,} {loop_seconds * 1000:>10.1f}ms {vectorized}   "
+              f"{loop_totals['owed_cards']:,} cards, R{cents_to_rands(loop_totals['owed_cents']):,}")
+
+    if have_numpy:
+        print()
+        print("Both paths agree on every total (earned, owed, discrepancies)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Loopy Campaign Metadata Cache
+=============================
+
+Campaign list and details kept on disk and looked up in memory by id.
+
+WHY:
+The scripts downloaded the whole /v1/campaigns list and then each
+campaign's details on every run, although campaign configuration
+changes about once a month.
+
+HOW IT WORKS:
+1. Campaigns are kept in LOOPY_CAMPAIGN_CACHE (default
+   loopy_campaigns.json) together with the response's ETag and
+   Last-Modified headers, and loaded into an id -> campaign dict
+2. Within LOOPY_CAMPAIGN_TTL (default 24h) reads never touch the network
+3. After the TTL the list (or a campaign's details) is revalidated with
+   If-None-Match / If-Modified-Since; a 304 only renews the entry, so
+   nothing is downloaded when the API supports conditional requests
+4. If Loopy cannot be reached the stale entry is served with a warning
+   rather than failing the caller
+5. peek() answers from memory or disk only and never makes a request -
+   that is what the reward rule engine uses at startup
+
+Usage:
+    python campaign_cache.py [campaign_id] [--refresh]
+"""
+
+import json
+import os
+import threading
+import time
+
+from app_config import getenv
+from loopy_cards import LOOPY_API_URL
+from loopy_token_cache import get_token_cache
+
+DEFAULT_CACHE_FILE = 'loopy_campaigns.json'
+DEFAULT_TTL = 24 * 3600
+
+
+class CampaignCache:
+    """Disk-backed /v1/campaigns list and per-campaign details"""
+
+    def __init__(self, path=None, ttl=None, session=None, token_cache=None, base_url=LOOPY_API_URL):
+        self.path = path or getenv('LOOPY_CAMPAIGN_CACHE', DEFAULT_CACHE_FILE)
+        self.ttl = ttl if ttl is not None else float(getenv('LOOPY_CAMPAIGN_TTL', DEFAULT_TTL))
+        self.session = session
+        self.token_cache = token_cache
+        self.base_url = base_url
+
+        self._lock = threading.RLock()
+        self._data = None
+        self._by_id = {}
+        self.stats = {'hits': 0, 'downloaded': 0, 'not_modified': 0, 'stale_served': 0}
+
+    def _http(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    # ------------------------------------------------------------------
+    # Disk
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        """The cache file's contents (read once per process)"""
+
+        if self._data is None:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if not isinstance(data, dict) or data.get('base_url') != self.base_url:
+                data = {}
+            data.setdefault('base_url', self.base_url)
+            data.setdefault('list', None)
+            data.setdefault('details', {})
+            self._data = data
+            self._index()
+        return self._data
+
+    def _index(self):
+        entry = self._data.get('list')
+        rows = (entry or {}).get('data', {}).get('rows') or []
+        self._by_id = {campaign.get('id'): campaign for campaign in rows if isinstance(campaign, dict)}
+
+    def _write(self):
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    # ------------------------------------------------------------------
+    # Network
+    # ------------------------------------------------------------------
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() - entry.get('validated_at', 0) <= self.ttl
+
+    def _revalidate(self, url, entry):
+        """
+        Conditional GET of url against a cached entry; returns the entry to keep
+        (the old one on 304 or on failure, a new one on 200)
+        """
+
+        token_cache = self.token_cache or get_token_cache()
+        headers = {'Content-Type': 'application/json'}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = None
+        error = None
+        for force_refresh in (False, True):
+            token = token_cache.get_token(force_refresh=force_refresh)
+            if not token:
+                error = f"no Loopy token: {token_cache.last_error}"
+                break
+            try:
+                response = self._http().get(url, headers={**headers, 'Authorization': token}, timeout=10)
+            except Exception as e:
+                error = str(e)
+                break
+            if response.status_code != 401:
+                break
+
+        if response is not None and response.status_code == 304 and entry is not None:
+            self.stats['not_modified'] += 1
+            return {**entry, 'validated_at': time.time()}
+
+        if response is not None and response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError:
+                error = 'non-JSON response'
+            else:
+                self.stats['downloaded'] += 1
+                return {
+                    'data': data,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'fetched_at': time.time(),
+                    'validated_at': time.time()
+                }
+        elif response is not None:
+            error = f"HTTP {response.status_code}"
+
+        if entry is not None:
+            self.stats['stale_served'] += 1
+            print(f"⚠️ Using cached campaign data for {url} ({error})")
+        else:
+            print(f"❌ Could not load {url}: {error}")
+        return entry
+
+    def _refresh_list(self, force=False):
+        data = self._load()
+        entry = data['list']
+        if not force and self._fresh(entry):
+            self.stats['hits'] += 1
+            return
+
+        new_entry = self._revalidate(f'{self.base_url}/campaigns', entry)
+        if new_entry is not None and new_entry is not entry:
+            data['list'] = new_entry
+            self._index()
+            self._write()
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def all(self, refresh=False):
+        """Every campaign of the account (revalidated once the TTL has passed)"""
+
+        with self._lock:
+            self._refresh_list(force=refresh)
+            return list(self._by_id.values())
+
+    def get(self, campaign_id, refresh=False):
+        """A campaign from the list, or None if the account has no such campaign"""
+
+        with self._lock:
+            self._refresh_list(force=refresh)
+            return self._by_id.get(campaign_id)
+
+    def peek(self, campaign_id):
+        """A campaign from memory or disk only, never from the network (may be stale or None)"""
+
+        with self._lock:
+            self._load()
+            return self._by_id.get(campaign_id)
+
+    def details(self, campaign_id, refresh=False):
+        """/campaigns/{id} (cached and revalidated separately from the list)"""
+
+        with self._lock:
+            data = self._load()
+            entry = data['details'].get(campaign_id)
+            if not refresh and self._fresh(entry):
+                self.stats['hits'] += 1
+                return entry['data']
+
+            new_entry = self._revalidate(f'{self.base_url}/campaigns/{campaign_id}', entry)
+            if new_entry is None:
+                return None
+            if new_entry is not entry:
+                data['details'][campaign_id] = new_entry
+                self._write()
+            return new_entry['data']
+
+    def info(self):
+        """Cache age and counters, for the scripts' summaries"""
+
+        with self._lock:
+            entry = self._load()['list']
+        return {
+            'campaigns': len(self._by_id),
+            'age_seconds': round(time.time() - entry['fetched_at'], 1) if entry else None,
+            'etag': bool(entry and entry.get('etag')),
+            'last_modified': bool(entry and entry.get('last_modified')),
+            **self.stats
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_campaign_cache():
+    """The process-wide campaign cache"""
+
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CampaignCache()
+    return _cache
+
+
+def set_campaign_cache(cache):
+    global _cache
+    _cache = cache
+
+
+def main():
+    import argparse
+
+    from app_config import get_config
+
+    parser = argparse.ArgumentParser(description='Show cached Loopy campaign metadata')
+    parser.add_argument('campaign_id', nargs='?', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--refresh', action='store_true', help='Revalidate now, ignoring the TTL')
+    args = parser.parse_args()
+
+    cache = get_campaign_cache()
+    campaign_id = args.campaign_id or get_config().campaign_id
+
+    for campaign in cache.all(refresh=args.refresh):
+        marker = ' 🎯' if campaign.get('id') == campaign_id else ''
+        print(f"   {campaign.get('id')}: {campaign.get('name', 'Unnamed')}{marker}")
+
+    info = cache.info()
+    print(f"📊 {info['campaigns']} campaign(s), {info['age_seconds']}s old "
+          f"({info['downloaded']} downloaded, {info['not_modified']} not modified, {info['hits']} cache hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Loopy Card-State Store
+======================
+
+A local copy of every card's latest state, kept current by webhooks.
+
+WHY:
+Each Loopy webhook carries the card's snapshot (stamps, rewards earned
+and redeemed, pass status) and we threw it away, then asked the Loopy
+API again whenever monitoring, reconciliation or a dispute needed it.
+
+HOW IT WORKS:
+1. The webhook handler saves the snapshot of every validated card
+   event; cards fetched from the API are saved the same way
+2. Snapshots are ordered by (lifetime stamps, rewards redeemed), which
+   Loopy only ever increases. A snapshot replaces the stored one only if
+   it is strictly newer, so retried or out-of-order webhooks never roll
+   a card back; a repeat of the stored version only renews updated_at
+3. Rows are indexed by card id, customer email and campaign, in SQLite
+   (CARD_STATE_DB) shared by every worker on the host
+4. get_card_state() reads the store first and only calls the Loopy API
+   on a miss (or when the entry is older than max_age); the hit rate is
+   reported by get_stats()
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app_config import getenv
+from loopy_schema import LoopySchemaError, webhook_validator
+
+DEFAULT_CARD_STATE_DB = os.path.join(tempfile.gettempdir(), 'loopy_card_state.db')
+
+_COLUMNS = ('card_id', 'campaign_id', 'email', 'name', 'phone', 'total_stamps',
+            'rewards_earned', 'rewards_redeemed', 'pass_status', 'last_event', 'source', 'updated_at')
+
+
+class CardState:
+    """Latest known state of one Loopy card"""
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(_COLUMNS, values):
+            setattr(self, name, value)
+
+    @property
+    def age_seconds(self):
+        return time.time() - self.updated_at
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in _COLUMNS}
+
+    def to_card(self):
+        """The card in Loopy's API shape (what the reconciliation engine reads)"""
+
+        return {
+            'id': self.card_id,
+            'campaignID': self.campaign_id,
+            'totalStampsEarned': self.total_stamps,
+            'totalRewardsEarned': self.rewards_earned,
+            'totalRewardsRedeemed': self.rewards_redeemed,
+            'passStatus': self.pass_status,
+            'customerDetails': {'email': self.email, 'name': self.name, 'phone': self.phone}
+        }
+
+    def __repr__(self):
+        return f"CardState({self.card_id}, {self.email}, {self.total_stamps} stamps, {self.source})"
+
+
+class CardStateStore:
+    """SQLite-backed card states indexed by card, email and campaign"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or getenv('CARD_STATE_DB', DEFAULT_CARD_STATE_DB)
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'writes': 0, 'stale_writes': 0, 'reads': 0, 'hits': 0, 'misses': 0, 'api_fetches': 0}
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS card_state (
+                    card_id TEXT PRIMARY KEY,
+                    campaign_id TEXT,
+                    email TEXT,
+                    name TEXT,
+                    phone TEXT,
+                    total_stamps INTEGER NOT NULL DEFAULT 0,
+                    rewards_earned INTEGER,
+                    rewards_redeemed INTEGER,
+                    pass_status TEXT,
+                    last_event TEXT,
+                    source TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS card_state_email ON card_state (email)')
+            conn.execute('CREATE INDEX IF NOT EXISTS card_state_campaign ON card_state (campaign_id)')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, **increments):
+        with self._metrics_lock:
+            for name, value in increments.items():
+                self._metrics[name] += value
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def update_from_event(self, event, source='webhook'):
+        """
+        Save a validated LoopyEvent's card snapshot
+        Returns False if the stored state is as new or newer and was kept
+        """
+
+        if not event.card_id:
+            return False
+
+        conn = self._connection()
+        now = time.time()
+        cursor = conn.execute(
+            """
+            INSERT INTO card_state (card_id, campaign_id, email, name, phone, total_stamps,
+                                    rewards_earned, rewards_redeemed, pass_status, last_event, source, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (card_id) DO UPDATE SET
+                campaign_id = COALESCE(excluded.campaign_id, campaign_id),
+                email = COALESCE(excluded.email, email),
+                name = COALESCE(excluded.name, name),
+                phone = COALESCE(excluded.phone, phone),
+                total_stamps = excluded.total_stamps,
+                rewards_earned = COALESCE(excluded.rewards_earned, rewards_earned),
+                rewards_redeemed = COALESCE(excluded.rewards_redeemed, rewards_redeemed),
+                pass_status = COALESCE(excluded.pass_status, pass_status),
+                last_event = COALESCE(excluded.last_event, last_event),
+                source = excluded.source,
+                updated_at = excluded.updated_at
+            WHERE excluded.total_stamps > card_state.total_stamps
+               OR (excluded.total_stamps = card_state.total_stamps
+                   AND excluded.rewards_redeemed > COALESCE(card_state.rewards_redeemed, -1))
+            """,
+            (event.card_id, event.campaign_id, event.email, event.name, event.phone, event.total_stamps or 0,
+             event.rewards_earned, event.rewards_redeemed, event.pass_status, event.event_type, source, now)
+        )
+
+        written = cursor.rowcount == 1
+        if not written:
+            # Same version again (a retry or an unchanged API read): still current, nothing to replace
+            conn.execute(
+                'UPDATE card_state SET updated_at = ? WHERE card_id = ? AND total_stamps = ? '
+                'AND (? IS NULL OR rewards_redeemed IS ?)',
+                (now, event.card_id, event.total_stamps or 0, event.rewards_redeemed, event.rewards_redeemed)
+            )
+        self._count(writes=1 if written else 0, stale_writes=0 if written else 1)
+        return written
+
+    def update_from_card(self, card, campaign_id=None, source='api'):
+        """Save a card as returned by the Loopy API; returns False if invalid or stale"""
+
+        try:
+            event = webhook_validator().validate({'card': card, 'campaign': {'id': campaign_id} if campaign_id else None})
+        except LoopySchemaError:
+            return False
+        return self.update_from_event(event, source=source)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _select(self, where, params):
+        return [CardState(*row) for row in self._connection().execute(
+            f'SELECT {", ".join(_COLUMNS)} FROM card_state WHERE {where}', params)]
+
+    def get(self, card_id, max_age=None):
+        """Stored state of a card, or None if unknown or older than max_age seconds"""
+
+        rows = self._select('card_id = ?', (card_id,))
+        state = rows[0] if rows else None
+        if state is not None and max_age is not None and state.age_seconds > max_age:
+            state = None
+
+        self._count(reads=1, hits=1 if state else 0, misses=0 if state else 1)
+        return state
+
+    def find_by_email(self, email):
+        """Every card of a customer (email is matched case-insensitively)"""
+
+        if not email:
+            return []
+        return self._select('email = ? ORDER BY updated_at DESC', (email.strip().lower(),))
+
+    def iter_campaign(self, campaign_id, batch_size=1000):
+        """Every stored card of a campaign, read in batches"""
+
+        last_id = ''
+        while True:
+            rows = self._select('campaign_id = ? AND card_id > ? ORDER BY card_id LIMIT ?',
+                                (campaign_id, last_id, batch_size))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1].card_id
+
+    def get_stats(self):
+        conn = self._connection()
+        row = conn.execute('SELECT COUNT(*), COUNT(DISTINCT email), MAX(updated_at) FROM card_state').fetchone()
+        by_source = dict(conn.execute('SELECT source, COUNT(*) FROM card_state GROUP BY source'))
+
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['hit_rate'] = round(metrics['hits'] / metrics['reads'], 3) if metrics['reads'] else None
+
+        return {
+            'cards': row[0],
+            'customers': row[1],
+            'last_update_age_seconds': round(time.time() - row[2], 1) if row[2] else None,
+            'by_source': by_source,
+            **metrics
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_card_state_store():
+    """The process-wide store (opened on first use)"""
+
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CardStateStore()
+    return _store
+
+
+def record_webhook_event(event):
+    """Save a webhook's card snapshot; never lets a store problem fail the webhook"""
+
+    if not event.has_card:
+        return False
+    try:
+        return get_card_state_store().update_from_event(event)
+    except sqlite3.Error as e:
+        print(f"⚠️ Card state not saved for {event.card_id}: {e}")
+        return False
+
+
+def get_card_state(card_id, max_age=None, fetch=True):
+    """
+    Card state from the local store, falling back to the Loopy API on a
+    miss (the fetcher stores the card for next time). None if unavailable
+    """
+
+    store = get_card_state_store()
+    state = store.get(card_id, max_age)
+    if state is not None or not fetch:
+        return state
+
+    from loopy_card_details import CardDetailFetcher
+
+    detail = CardDetailFetcher(concurrency=1).fetch_one(card_id)
+    store._count(api_fetches=1)
+    return store.get(card_id) if detail.ok else None
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Host-Wide Customer Deposit Lock
+===============================
+
+Stops two processes (gunicorn workers, or several containers sharing a
+volume on one host) from depositing to the same Munch customer at the
+same moment.
+
+HOW IT WORKS:
+1. Locks are leases stored in a shared SQLite file, keyed by a hash of
+   the customer email (no customer data is written to disk)
+2. Acquiring waits with backoff up to a timeout, then gives up
+3. A lease that outlives `lease_seconds` is treated as stale (its
+   holder crashed or hung) and is taken over by the next caller
+4. Contention, waits, timeouts and stale recoveries are counted
+"""
+
+import hashlib
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from app_config import getenv
+
+DEFAULT_LOCK_DB = os.path.join(tempfile.gettempdir(), 'loopy_munch_customer_locks.db')
+
+
+class CustomerLockTimeout(Exception):
+    """Raised when a customer lock cannot be acquired in time"""
+
+
+class CustomerLock:
+    """Cross-process lock keyed by customer, backed by SQLite leases"""
+
+    def __init__(self, db_path=None, lease_seconds=60.0, timeout=15.0, poll_interval=0.02):
+        """Configure lock storage and timing"""
+
+        self.db_path = db_path or getenv('CUSTOMER_LOCK_DB', DEFAULT_LOCK_DB)
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.owner_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'acquired': 0,
+            'contended': 0,
+            'timeouts': 0,
+            'stale_recovered': 0,
+            'lost_leases': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0
+        }
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS customer_locks (
+                    lock_key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    acquired_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def lock_key(customer):
+        """Hash a customer identifier (email or Munch user ID) into a lock key"""
+
+        return hashlib.sha256(str(customer).strip().lower().encode('utf-8')).hexdigest()
+
+    def _try_acquire(self, lock_key, owner):
+        """Single attempt; returns (acquired, recovered_stale)"""
+
+        conn = self._connection()
+        now = time.time()
+        recovered = False
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return False, False
+
+        try:
+            row = conn.execute(
+                'SELECT expires_at FROM customer_locks WHERE lock_key = ?',
+                (lock_key,)
+            ).fetchone()
+
+            if row and row[0] <= now:
+                conn.execute('DELETE FROM customer_locks WHERE lock_key = ?', (lock_key,))
+                recovered = True
+                row = None
+
+            if row is None:
+                conn.execute(
+                    'INSERT INTO customer_locks (lock_key, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?)',
+                    (lock_key, owner, now, now + self.lease_seconds)
+                )
+                conn.execute('COMMIT')
+                return True, recovered
+
+            conn.execute('COMMIT')
+            return False, False
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, customer, timeout=None):
+        """
+        Acquire the lock for a customer
+        Returns an owner token for release(); raises CustomerLockTimeout
+        """
+
+        lock_key = self.lock_key(customer)
+        owner = f'{self.owner_prefix}:{threading.get_ident()}:{uuid.uuid4().hex}'
+        timeout = self.timeout if timeout is None else timeout
+
+        started = time.monotonic()
+        deadline = started + timeout
+        delay = self.poll_interval
+        contended = False
+
+        while True:
+            acquired, recovered = self._try_acquire(lock_key, owner)
+
+            if acquired:
+                waited = time.monotonic() - started
+                with self._metrics_lock:
+                    self._metrics['acquired'] += 1
+                    self._metrics['contended'] += int(contended)
+                    self._metrics['stale_recovered'] += int(recovered)
+                    self._metrics['total_wait_seconds'] += waited
+                    self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], waited)
+                if recovered:
+                    print(f"⚠️ Recovered stale customer lock {lock_key[:12]}")
+                return owner
+
+            contended = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._metrics_lock:
+                    self._metrics['timeouts'] += 1
+                    self._metrics['contended'] += 1
+                raise CustomerLockTimeout(f"Timed out after {timeout}s waiting for customer lock")
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+    def release(self, customer, owner):
+        """Release a lock previously acquired with acquire()"""
+
+        cursor = self._connection().execute(
+            'DELETE FROM customer_locks WHERE lock_key = ? AND owner = ?',
+            (self.lock_key(customer), owner)
+        )
+
+        if cursor.rowcount == 0:
+            # Our lease expired and someone else took it over
+            with self._metrics_lock:
+                self._metrics['lost_leases'] += 1
+            print(f"⚠️ Customer lock lease expired before release")
+
+    @contextmanager
+    def hold(self, customer, timeout=None):
+        """Context manager around acquire()/release()"""
+
+        owner = self.acquire(customer, timeout=timeout)
+        try:
+            yield
+        finally:
+            self.release(customer, owner)
+
+    def get_metrics(self):
+        """Contention metrics for this process plus current host-wide holders"""
+
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+
+        acquired = metrics['acquired']
+        metrics['avg_wait_seconds'] = round(metrics['total_wait_seconds'] / acquired, 4) if acquired else 0.0
+        metrics['total_wait_seconds'] = round(metrics['total_wait_seconds'], 4)
+        metrics['max_wait_seconds'] = round(metrics['max_wait_seconds'], 4)
+
+        try:
+            metrics['held_locks'] = self._connection().execute(
+                'SELECT COUNT(*) FROM customer_locks WHERE expires_at > ?',
+                (time.time(),)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            metrics['held_locks'] = None
+
+        return metrics
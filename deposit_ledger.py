@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Deposit Ledger - Webhook Dedup Store
+====================================
+
+Loopy retries webhooks and backfills replay whole days of events, so
+the same event can reach us many times. The ledger remembers every
+event we have processed (by a hash of its content) so each one is
+acted on exactly once, whichever path it arrives on.
+
+It also records every reward credited to Munch per Loopy card, so a
+card's lifetime stamps can be turned into what is still owed
+(earned minus credited) instead of paying the full total again.
+
+Stored in SQLite (DEPOSIT_LEDGER_DB) so every worker process on the
+host shares the same view. Without DEPOSIT_LEDGER_DB the database lives
+in the temp dir, which a restart or redeploy can wipe: that is enough
+for webhook dedup, but nothing is deposited against such a ledger
+because every credit it forgot would be paid again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app_config import getenv
+
+DEFAULT_LEDGER_DB = os.path.join(tempfile.gettempdir(), 'loopy_munch_ledger.db')
+
+NOT_PERSISTENT_ERROR = 'DEPOSIT_LEDGER_DB is not set: refusing to deposit against a ledger in the temp dir'
+
+
+class DepositLedger:
+    """SQLite-backed record of processed Loopy events"""
+
+    def __init__(self, db_path=None):
+        """Open (or create) the ledger database"""
+
+        configured = db_path or getenv('DEPOSIT_LEDGER_DB')
+        self.db_path = configured or DEFAULT_LEDGER_DB
+        # Only an explicitly placed ledger is trusted to remember credits across restarts
+        self.persistent = bool(configured)
+        self._local = threading.local()
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS processed_events (
+                    event_key TEXT PRIMARY KEY,
+                    card_id TEXT,
+                    processed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS credits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    card_id TEXT NOT NULL,
+                    campaign_id TEXT,
+                    rewards INTEGER NOT NULL,
+                    value_cents INTEGER NOT NULL,
+                    customer_id TEXT,
+                    customer_email TEXT,
+                    deposit_id TEXT,
+                    credited_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS credits_card ON credits (card_id)')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def event_key(endpoint, data):
+        """Content hash identifying one Loopy event"""
+
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(f'{endpoint}|{canonical}'.encode('utf-8')).hexdigest()
+
+    def claim_event(self, event_key, card_id=None):
+        """
+        Mark an event as processed
+        Returns False if it was already claimed (a duplicate)
+        """
+
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO processed_events (event_key, card_id, processed_at) VALUES (?, ?, ?)',
+            (event_key, card_id, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def release_event(self, event_key):
+        """Forget a claim whose processing failed, so a retry can run"""
+
+        self._connection().execute('DELETE FROM processed_events WHERE event_key = ?', (event_key,))
+
+    def record_credit(self, card_id, campaign_id, rewards, value_cents,
+                      customer_id=None, customer_email=None, deposit_id=None):
+        """Record rewards deposited to Munch for a Loopy card"""
+
+        self._connection().execute(
+            'INSERT INTO credits (card_id, campaign_id, rewards, value_cents, customer_id, '
+            'customer_email, deposit_id, credited_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (card_id, campaign_id, rewards, value_cents, customer_id, customer_email, deposit_id, time.time())
+        )
+
+    def credited(self, card_id):
+        """(rewards, cents) already credited for one card"""
+        return self.credited_many([card_id]).get(card_id, (0, 0))
+
+    def credited_many(self, card_ids):
+        """card_id -> (rewards, cents) credited, for cards that have any credit"""
+
+        card_ids = list(card_ids)
+        totals = {}
+        conn = self._connection()
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(card_ids), 500):
+            chunk = card_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for card_id, rewards, cents in conn.execute(
+                f'SELECT card_id, SUM(rewards), SUM(value_cents) FROM credits '
+                f'WHERE card_id IN ({placeholders}) GROUP BY card_id', chunk
+            ):
+                totals[card_id] = (rewards, cents)
+        return totals
+
+    def get_stats(self):
+        """Ledger size summary"""
+
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT card_id) FROM processed_events'
+        ).fetchone()
+        credits = conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT card_id), COALESCE(SUM(value_cents), 0) FROM credits'
+        ).fetchone()
+
+        return {
+            'processed_events': row[0],
+            'distinct_cards': row[1],
+            'credits': credits[0],
+            'credited_cards': credits[1],
+            'credited_cents': credits[2]
+        }
@@ -1,47 +1,39 @@
-import os
 import requests
 import json
-from dotenv import load_dotenv
-
-load_dotenv('production.env')
+from app_config import get_config
+from campaign_cache import get_campaign_cache
+from loopy_token_cache import get_loopy_token
 
 # Setup Loopy API
-base_url = os.getenv('LOOPY_BASE_URL')
-username = os.getenv('LOOPY_USERNAME')
-password = os.getenv('LOOPY_API_SECRET')
-campaign_id = os.getenv('CAMPAIGN_ID')
+config = get_config()
+base_url = config.loopy_base_url
+campaign_id = config.campaign_id
 
 print('📋 EXAMINING LOOPY CAMPAIGNS DATA')
 print('=' * 50)
 
-# Authenticate first
+# Authenticate first (reuses a cached token when there is one)
 session = requests.Session()
-auth_response = session.post(f'{base_url}/v1/account/login', json={
-    'username': username,
-    'password': password
-}, timeout=10)
+token = get_loopy_token()
 
-if auth_response.status_code != 200:
+if not token:
     print('❌ Authentication failed!')
     exit(1)
 
-token = auth_response.json().get('token')
 session.headers.update({'Authorization': token})
 
 print(f'✅ Authenticated successfully')
 print()
 
-# Get campaigns data
+# Get campaigns data (from the local campaign cache; Loopy is asked only once the TTL has passed)
+cache = get_campaign_cache()
 try:
-    response = session.get(f'{base_url}/v1/campaigns', timeout=10)
+    rows = cache.all()
     
-    if response.status_code == 200:
-        data = response.json()
+    if rows:
+        info = cache.info()
         print(f'📊 Campaigns response structure:')
-        print(f'   Total rows: {data.get("total_rows", "unknown")}')
-        print(f'   Offset: {data.get("offset", "unknown")}')
-        
-        rows = data.get('rows', [])
+        print(f'   Cache age: {info["age_seconds"]}s (ETag: {info["etag"]}, Last-Modified: {info["last_modified"]})')
         print(f'   Number of campaigns: {len(rows)}')
         print()
         
@@ -69,12 +61,16 @@ try:
             print()
             
     else:
-        print(f'❌ Failed to get campaigns: {response.status_code}')
-        print(f'Response: {response.text[:200]}')
+        print(f'❌ Failed to get campaigns')
         
 except Exception as e:
     print(f'❌ Error: {e}')
 
+# Campaign details are cached and revalidated the same way
+details = cache.details(campaign_id)
+if isinstance(details, dict):
+    print(f'/campaigns/{campaign_id}: ✅ Keys: {list(details.keys())}')
+
 print()
 print('🔍 Testing alternative customer access approaches...')
 
@@ -82,7 +78,6 @@ print('🔍 Testing alternative customer access approaches...')
 try:
     # Sometimes you need to access campaign details differently
     alt_endpoints = [
-        f'/v1/campaigns/{campaign_id}',
         f'/v1/campaign/{campaign_id}',  # Singular form
         f'/v1/campaigns/{campaign_id}/details',
         f'/v1/campaigns/{campaign_id}/stats',
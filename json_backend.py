@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+JSON Backend
+============
+
+One place to encode and decode JSON on the hot paths (webhook bodies,
+NDJSON bulk lines, health checks).
+
+HOW IT WORKS:
+1. orjson is used when it is installed; otherwise the standard library
+2. loads() takes bytes directly, so bodies are never decoded to str first
+3. dumps() returns bytes, compact by default (pretty=True for humans)
+4. JSON_BACKEND=json forces the standard library (e.g. to compare output)
+
+Both backends raise ValueError subclasses on bad input and TypeError
+subclasses on unserializable objects, so callers handle them the same way.
+"""
+
+import json
+
+from app_config import getenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if getenv('JSON_BACKEND', '').lower() in ('json', 'stdlib'):
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+# Error raised by loads() for malformed input (orjson's is a json.JSONDecodeError subclass)
+JSONDecodeError = json.JSONDecodeError
+
+_COMPACT_SEPARATORS = (',', ':')
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj, pretty=False):
+    if pretty:
+        return json.dumps(obj, indent=2).encode()
+    return json.dumps(obj, separators=_COMPACT_SEPARATORS).encode()
+
+
+if orjson:
+    def loads(data):
+        """Parse JSON from bytes, bytearray, memoryview or str"""
+        return orjson.loads(data)
+
+    def dumps(obj, pretty=False):
+        """
+        Serialize to UTF-8 bytes (compact unless pretty)
+        Values orjson rejects but json accepts (e.g. integers wider than
+        64 bits, non-string keys) fall back to the standard library
+        """
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:
+            return _stdlib_dumps(obj, pretty)
+else:
+    def loads(data):
+        """Parse JSON from bytes, bytearray or str"""
+        return _stdlib_loads(data)
+
+    def dumps(obj, pretty=False):
+        """Serialize to UTF-8 bytes (compact unless pretty)"""
+        return _stdlib_dumps(obj, pretty)
+
+
+def dumps_line(obj):
+    """One NDJSON line (compact, newline-terminated)"""
+    return dumps(obj) + b'\n'
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Keyed Executor - Per-Card Ordering, Cross-Card Parallelism
+==========================================================
+
+Runs reward work on a fixed pool of worker threads sharded by key
+(normally the Loopy card ID):
+
+1. Every key always maps to the same shard, so events for one card
+   run strictly in submission order - two rewards for the same card
+   can never both compute `totalStampsEarned // 12` at the same time
+2. Different cards land on different shards and run in parallel
+3. Each shard tracks its queue depth and pending keys, so hot cards
+   show up in the metrics
+"""
+
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future
+
+
+class _Shard:
+    """One worker thread with its own FIFO queue"""
+
+    def __init__(self, index, name):
+        self.index = index
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.pending_keys = Counter()
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run,
+            name=f'{name}-shard-{index}',
+            daemon=True
+        )
+        self.thread.start()
+
+    def put(self, key, future, fn, args, kwargs):
+        """Queue a work item on this shard"""
+
+        with self.condition:
+            if not self.running:
+                raise RuntimeError('cannot submit after shutdown')
+            self.queue.append((key, future, fn, args, kwargs))
+            self.pending_keys[key] += 1
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify()
+
+    def stop(self):
+        """Stop accepting work; the worker drains what is already queued"""
+
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and self.running:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                key, future, fn, args, kwargs = self.queue.popleft()
+
+            ran = future.set_running_or_notify_cancel()
+            failed = False
+            started = time.monotonic()
+            if ran:
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+                    failed = True
+
+            with self.condition:
+                if ran:
+                    self.processed += 1
+                    self.failed += int(failed)
+                    self.busy_seconds += time.monotonic() - started
+                self.pending_keys[key] -= 1
+                if self.pending_keys[key] <= 0:
+                    del self.pending_keys[key]
+
+    def snapshot(self, hot_keys):
+        """Metrics for this shard"""
+
+        with self.condition:
+            depth = len(self.queue)
+            top_keys = self.pending_keys.most_common(hot_keys)
+            max_depth, processed, failed, busy_seconds = self.max_depth, self.processed, self.failed, self.busy_seconds
+
+        return {
+            'shard': self.index,
+            'queue_depth': depth,
+            'max_queue_depth': max_depth,
+            'processed': processed,
+            'failed': failed,
+            'busy_seconds': round(busy_seconds, 3),
+            'hot_keys': [{'key': key, 'pending': count} for key, count in top_keys]
+        }
+
+
+class KeyedExecutor:
+    """Thread pool that serializes work per key and parallelizes across keys"""
+
+    def __init__(self, num_shards=8, name='keyed'):
+        """Start one worker thread per shard"""
+
+        if num_shards < 1:
+            raise ValueError("❌ num_shards must be at least 1")
+
+        self.name = name
+        self.shards = [_Shard(i, name) for i in range(num_shards)]
+
+    def shard_for(self, key):
+        """Stable shard index for a key (same in every process)"""
+
+        return zlib.crc32(str(key).encode('utf-8')) % len(self.shards)
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) after all earlier work for the same key
+        Returns a concurrent.futures.Future
+        """
+
+        future = Future()
+        self.shards[self.shard_for(key)].put(key, future, fn, args, kwargs)
+        return future
+
+    def get_metrics(self, hot_keys=3):
+        """Per-shard queue depth, throughput and hottest pending keys"""
+
+        shards = [shard.snapshot(hot_keys) for shard in self.shards]
+
+        return {
+            'executor': self.name,
+            'shards': len(shards),
+            'total_queue_depth': sum(s['queue_depth'] for s in shards),
+            'total_processed': sum(s['processed'] for s in shards),
+            'total_failed': sum(s['failed'] for s in shards),
+            'per_shard': shards
+        }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; optionally wait for queued work to finish"""
+
+        for shard in self.shards:
+            shard.stop()
+
+        if wait:
+            for shard in self.shards:
+                shard.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Loopy Card Details
+==================
+
+Fetches card details with their event history for many cards at once,
+for dispute audits.
+
+WHY:
+Audits fetched /card/{id}?includeEvents=true one card at a time, and
+fetched it again on every re-audit.
+
+HOW IT WORKS:
+1. fetch() takes any iterable of card ids and keeps at most
+   LOOPY_DETAIL_CONCURRENCY (default 8) requests in flight
+2. Results are yielded as they complete, one CardDetail per card; a
+   failing card carries its error and never stops the others
+3. Every fetched card is written to a local SQLite store
+   (LOOPY_CARD_DETAILS_DB); later fetches are answered from it unless
+   the entry is older than `max_age` or `refresh` is set
+4. Fetched cards also refresh the card-state store (card_state_store),
+   so monitoring and reconciliation see them without another request
+
+Usage:
+    python loopy_card_details.py CARD_ID [CARD_ID ...] [--file ids.txt]
+                                 [--concurrency 8] [--refresh] [--jsonl]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app_config import getenv
+from card_state_store import get_card_state_store
+from loopy_cards import LOOPY_API_URL, LoopyPageError, loopy_get_json
+from loopy_token_cache import get_token_cache
+
+DEFAULT_DETAILS_DB = os.path.join(tempfile.gettempdir(), 'loopy_card_details.db')
+DEFAULT_CONCURRENCY = 8
+
+
+class CardDetail:
+    """One card's fetch outcome"""
+
+    __slots__ = ('card_id', 'details', 'error', 'source', 'fetched_at')
+
+    def __init__(self, card_id, details=None, error=None, source='api', fetched_at=None):
+        self.card_id = card_id
+        self.details = details
+        self.error = error
+        self.source = source
+        self.fetched_at = fetched_at or time.time()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def events(self):
+        return (self.details or {}).get('events') or []
+
+    def to_dict(self):
+        return {
+            'card_id': self.card_id,
+            'source': self.source,
+            'fetched_at': self.fetched_at,
+            'error': self.error,
+            'details': self.details
+        }
+
+
+class CardDetailStore:
+    """SQLite store of fetched card details"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or getenv('LOOPY_CARD_DETAILS_DB', DEFAULT_DETAILS_DB)
+        self._local = threading.local()
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS card_details (
+                    card_id TEXT PRIMARY KEY,
+                    details TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get(self, card_id, max_age=None):
+        """Stored CardDetail, or None if missing or older than max_age seconds"""
+
+        row = self._connection().execute(
+            'SELECT details, fetched_at FROM card_details WHERE card_id = ?', (card_id,)
+        ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return CardDetail(card_id, json.loads(row[0]), source='store', fetched_at=row[1])
+
+    def put(self, card_id, details, fetched_at=None):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO card_details (card_id, details, fetched_at) VALUES (?, ?, ?)',
+            (card_id, json.dumps(details, separators=(',', ':')), fetched_at or time.time())
+        )
+
+    def get_stats(self):
+        row = self._connection().execute(
+            'SELECT COUNT(*), MIN(fetched_at), MAX(fetched_at) FROM card_details'
+        ).fetchone()
+        return {
+            'cards': row[0],
+            'oldest_age_seconds': round(time.time() - row[1], 1) if row[1] else None,
+            'newest_age_seconds': round(time.time() - row[2], 1) if row[2] else None
+        }
+
+
+class CardDetailFetcher:
+    """Concurrent /card/{id}?includeEvents=true fetcher backed by the store"""
+
+    def __init__(self, concurrency=None, store=None, max_age=None, refresh=False,
+                 session=None, token_cache=None, base_url=LOOPY_API_URL):
+        self.concurrency = concurrency or int(getenv('LOOPY_DETAIL_CONCURRENCY', DEFAULT_CONCURRENCY))
+        self.store = store or CardDetailStore()
+        self.max_age = max_age
+        self.refresh = refresh
+        self.session = session
+        self.token_cache = token_cache or get_token_cache()
+        self.base_url = base_url
+
+        self._lock = threading.Lock()
+        self.stats = {'requested': 0, 'from_store': 0, 'fetched': 0, 'errors': 0}
+
+    def _http(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def fetch_one(self, card_id):
+        """Fetch one card from the API and store it; errors are returned, not raised"""
+
+        try:
+            details = loopy_get_json(self._http(), f'{self.base_url}/card/{card_id}', self.token_cache,
+                                     params={'includeEvents': 'true'})
+        except LoopyPageError as e:
+            error = 'card not found' if e.status_code == 404 else str(e)
+            return CardDetail(card_id, error=error)
+        except Exception as e:
+            return CardDetail(card_id, error=str(e))
+
+        result = CardDetail(card_id, details)
+        try:
+            self.store.put(card_id, details, result.fetched_at)
+            get_card_state_store().update_from_card(details)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not store card {card_id}: {e}")
+        return result
+
+    def _count(self, result):
+        with self._lock:
+            if result.error:
+                self.stats['errors'] += 1
+            elif result.source == 'store':
+                self.stats['from_store'] += 1
+            else:
+                self.stats['fetched'] += 1
+
+    def fetch(self, card_ids):
+        """Yield a CardDetail for every card id, in completion order"""
+
+        in_flight = set()
+        seen = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='loopy-cards') as pool:
+            for card_id in card_ids:
+                if not card_id or card_id in seen:
+                    continue
+                seen.add(card_id)
+                self.stats['requested'] += 1
+
+                if not self.refresh:
+                    stored = self.store.get(card_id, self.max_age)
+                    if stored is not None:
+                        self._count(stored)
+                        yield stored
+                        continue
+
+                in_flight.add(pool.submit(self.fetch_one, card_id))
+                if len(in_flight) >= self.concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        self._count(result)
+                        yield result
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self._count(result)
+                    yield result
+
+
+def fetch_card_details(card_ids, **options):
+    """Details for many cards (store first, then the API); see CardDetailFetcher"""
+    return CardDetailFetcher(**options).fetch(card_ids)
+
+
+def main():
+    import argparse
+
+    import json_backend
+
+    parser = argparse.ArgumentParser(description='Fetch Loopy card details with event history')
+    parser.add_argument('card_ids', nargs='*', help='Card ids')
+    parser.add_argument('--file', help='File with one card id per line ("-" for stdin)')
+    parser.add_argument('--concurrency', type=int, default=None, help='Requests in flight (LOOPY_DETAIL_CONCURRENCY)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local store')
+    parser.add_argument('--max-age', type=float, default=None, help='Refetch stored cards older than this (seconds)')
+    parser.add_argument('--jsonl', action='store_true', help='Write one JSON line per card to stdout')
+    args = parser.parse_args()
+
+    def card_ids():
+        yield from args.card_ids
+        if args.file:
+            source = sys.stdin if args.file == '-' else open(args.file)
+            with source:
+                for line in source:
+                    yield line.strip()
+
+    fetcher = CardDetailFetcher(concurrency=args.concurrency, max_age=args.max_age, refresh=args.refresh)
+    started = time.monotonic()
+
+    for result in fetcher.fetch(card_ids()):
+        if args.jsonl:
+            sys.stdout.buffer.write(json_backend.dumps_line(result.to_dict()))
+            sys.stdout.flush()
+        elif result.ok:
+            details = result.details or {}
+            print(f"✅ {result.card_id}: {details.get('totalStampsEarned', '?')} stamps, "
+                  f"{len(result.events)} events [{result.source}]")
+        else:
+            print(f"❌ {result.card_id}: {result.error}")
+
+    elapsed = time.monotonic() - started
+    stats = fetcher.stats
+    print(f"📊 {stats['requested']} cards in {elapsed:.1f}s: {stats['fetched']} fetched, "
+          f"{stats['from_store']} from store, {stats['errors']} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Loopy Card Iterator
+===================
+
+Streams every card of a campaign from the Loopy v1 API.
+
+WHY:
+The search scripts read one `rows` page from the cards endpoints, so
+any campaign larger than a page was silently cut off.
+
+HOW IT WORKS:
+1. Pages are requested with `offset`/`limit` and answer with the
+   `rows`, `total_rows`, `offset` envelope of the /campaigns endpoint
+2. The first page gives `total_rows`; later pages are fetched by a
+   bounded thread pool (LOOPY_PAGE_CONCURRENCY, default 4) with up to
+   `prefetch` pages in flight (default twice the concurrency)
+3. Cards are yielded as soon as their page arrives and pages are
+   dropped once yielded, so memory stays at the prefetch window no
+   matter how large the campaign is
+4. Without `total_rows` the iterator keeps fetching until a short page
+5. 401 refreshes the cached token once; 429/5xx are retried with backoff
+6. `stats` reports pages, rows, pages per second and rows per second
+
+iter_pages() yields whole pages (with their offset) for callers that
+decide page by page, e.g. to stop() once sorted cards get too old.
+
+Usage:
+    python loopy_cards.py [campaign_id] [--page-size 100] [--concurrency 4]
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app_config import get_config, getenv
+from loopy_token_cache import get_token_cache
+
+LOOPY_API_URL = 'https://api.loopyloyalty.com/v1'
+DEFAULT_CARDS_PATH = '/campaigns/{campaign_id}/cards'
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+MAX_ATTEMPTS = 3
+
+
+class LoopyPageError(Exception):
+    """A Loopy request failed (after retrying where that makes sense)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def loopy_get_json(http, url, token_cache, params=None, on_retry=None):
+    """
+    GET a Loopy v1 resource with the cached token
+    401 forces one token refresh; 429/5xx and network errors are retried
+    with backoff. Raises LoopyPageError
+    """
+
+    refreshed = False
+    error = None
+    for attempt in range(MAX_ATTEMPTS):
+        token = token_cache.get_token(force_refresh=refreshed)
+        if not token:
+            raise LoopyPageError(f"No Loopy token: {token_cache.last_error}")
+
+        try:
+            response = http.get(
+                url,
+                headers={'Authorization': token, 'Content-Type': 'application/json'},
+                params=params,
+                timeout=15
+            )
+        except Exception as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 401 and not refreshed:
+                refreshed = True
+                continue
+            if response.status_code != 429 and response.status_code < 500:
+                raise LoopyPageError(f"GET {url}: HTTP {response.status_code}", response.status_code)
+            error = f"HTTP {response.status_code}"
+
+        if on_retry:
+            on_retry()
+        time.sleep(0.5 * 2 ** attempt)
+
+    raise LoopyPageError(f"GET {url} failed after {MAX_ATTEMPTS} attempts: {error}")
+
+
+class LoopyCardPager:
+    """Concurrent, bounded-memory iterator over a campaign's cards"""
+
+    def __init__(self, campaign_id, page_size=None, concurrency=None, prefetch=None,
+                 session=None, token_cache=None, base_url=LOOPY_API_URL, path=None, params=None):
+        self.campaign_id = campaign_id
+        self.page_size = page_size or int(getenv('LOOPY_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+        self.concurrency = concurrency or int(getenv('LOOPY_PAGE_CONCURRENCY', DEFAULT_CONCURRENCY))
+        self.prefetch = max(prefetch or self.concurrency * 2, self.concurrency)
+        self.session = session
+        self.token_cache = token_cache or get_token_cache()
+        self.url = base_url + (path or getenv('LOOPY_CARDS_PATH') or DEFAULT_CARDS_PATH).format(
+            campaign_id=campaign_id)
+        self.params = dict(params or {})
+
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.rows = 0
+        self.total_rows = None
+        self.retries = 0
+        self.stopped = False
+        self.started_at = None
+        self.finished_at = None
+
+    def _http(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def fetch_page(self, offset):
+        """One page envelope ({'rows': [...], 'total_rows': n, 'offset': n})"""
+
+        data = loopy_get_json(self._http(), self.url, self.token_cache,
+                              params={**self.params, 'offset': offset, 'limit': self.page_size},
+                              on_retry=self._count_retry)
+        if isinstance(data, list):
+            data = {'rows': data}
+        return data
+
+    def _count_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def _record(self, rows):
+        with self._lock:
+            self.pages += 1
+            self.rows += len(rows)
+
+    def stop(self):
+        """Request no further pages; pages already in flight are still yielded"""
+        self.stopped = True
+
+    def __iter__(self):
+        for _, rows in self.iter_pages():
+            yield from rows
+
+    def iter_pages(self):
+        """(offset, rows) for every page, in completion order"""
+
+        self.started_at = time.monotonic()
+        try:
+            first = self.fetch_page(0)
+            rows = first.get('rows') or []
+            self._record(rows)
+            if first.get('total_rows') is not None:
+                self.total_rows = int(first['total_rows'])
+            yield 0, rows
+
+            if self.total_rows is not None:
+                exhausted = len(rows) >= self.total_rows
+            else:
+                exhausted = len(rows) < self.page_size
+            if exhausted or self.stopped:
+                return
+
+            yield from self._iter_remaining()
+        finally:
+            self.finished_at = time.monotonic()
+
+    def _iter_remaining(self):
+        next_offset = self.page_size
+        in_flight = {}
+        end_seen = False
+
+        def more_pages():
+            if end_seen or self.stopped:
+                return False
+            if self.total_rows is not None:
+                return next_offset < self.total_rows
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='loopy-pages') as pool:
+            try:
+                while True:
+                    while len(in_flight) < self.prefetch and more_pages():
+                        in_flight[pool.submit(self.fetch_page, next_offset)] = next_offset
+                        next_offset += self.page_size
+
+                    if not in_flight:
+                        return
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        offset = in_flight.pop(future)
+                        rows = future.result().get('rows') or []
+                        self._record(rows)
+                        if self.total_rows is None and len(rows) < self.page_size:
+                            # A short page marks the end; pages past it come back empty
+                            end_seen = True
+                        yield offset, rows
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def stats(self):
+        end = self.finished_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'campaign_id': self.campaign_id,
+            'pages': self.pages,
+            'rows': self.rows,
+            'total_rows': self.total_rows,
+            'retries': self.retries,
+            'stopped_early': self.stopped,
+            'seconds': round(elapsed, 2),
+            'pages_per_second': round(self.pages / elapsed, 1) if elapsed else None,
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None
+        }
+
+
+def iter_campaign_cards(campaign_id=None, **options):
+    """Every card of a campaign (default: the configured campaign)"""
+    return LoopyCardPager(campaign_id or get_config().campaign_id, **options)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Stream every card of a Loopy campaign')
+    parser.add_argument('campaign_id', nargs='?', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--page-size', type=int, default=None, help='Cards per page (LOOPY_PAGE_SIZE)')
+    parser.add_argument('--concurrency', type=int, default=None, help='Pages fetched in parallel')
+    parser.add_argument('--prefetch', type=int, default=None, help='Pages in flight')
+    args = parser.parse_args()
+
+    pager = iter_campaign_cards(args.campaign_id, page_size=args.page_size,
+                                concurrency=args.concurrency, prefetch=args.prefetch)
+    print(f"📇 Streaming cards of campaign {pager.campaign_id}")
+
+    try:
+        stamps = 0
+        for card in pager:
+            stamps += card.get('totalStampsEarned') or 0
+    except LoopyPageError as e:
+        print(f"❌ {e}")
+        return
+
+    stats = pager.stats()
+    print(f"✅ {stats['rows']} cards ({stats['total_rows']} reported) in {stats['pages']} pages, "
+          f"{stats['seconds']}s")
+    print(f"   {stats['pages_per_second']} pages/s, {stats['rows_per_second']} rows/s, "
+          f"{stats['retries']} retries, {stamps} stamps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Loopy Endpoint Discovery
+========================
+
+Finds out which Loopy endpoints work, once, and remembers it.
+
+WHY:
+The search scripts probed a dozen or more candidate endpoints one after
+another on every run, each with a 10s timeout, only to rediscover the
+same working few.
+
+HOW IT WORKS:
+1. Every candidate path is probed with every auth scheme (the cached
+   JWT and the X-API-Key header) in parallel (LOOPY_DISCOVERY_CONCURRENCY,
+   default 8) with a short timeout (LOOPY_DISCOVERY_TIMEOUT, default 5s)
+2. For each path the capability file (LOOPY_CAPABILITIES_FILE, default
+   loopy_capabilities.json) records whether it works, which auth scheme
+   it accepted, the response shape (list, rows envelope, data envelope
+   or object) and the pagination style (offset, page, cursor or none)
+3. Entries younger than LOOPY_CAPABILITY_TTL (default 24h) are trusted:
+   later runs skip the probing and go straight to the working endpoints.
+   Timeouts, 429s and 5xx say nothing about the endpoint, so they are
+   never recorded and the path is probed again next run
+4. fetch() calls a known-good endpoint with its recorded auth scheme,
+   reusing the probe's response when it was probed in this run
+
+Usage:
+    python loopy_discovery.py PATH [PATH ...] [--refresh]
+    (paths may contain {campaign_id})
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app_config import get_config, getenv
+from loopy_cards import LOOPY_API_URL
+from loopy_token_cache import get_token_cache
+
+DEFAULT_CAPABILITIES_FILE = 'loopy_capabilities.json'
+DEFAULT_TTL = 24 * 3600
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 5.0
+
+# Preferred first when a path accepts more than one
+AUTH_SCHEMES = ('jwt', 'api_key')
+
+
+def response_shape(data):
+    """How a JSON response holds its items"""
+
+    if isinstance(data, list):
+        return 'list'
+    if isinstance(data, dict):
+        if isinstance(data.get('rows'), list):
+            return 'rows'
+        if isinstance(data.get('data'), list):
+            return 'data'
+        return 'object'
+    return 'scalar'
+
+
+def pagination_style(data):
+    """How a JSON response is paged, judged from its envelope"""
+
+    if not isinstance(data, dict):
+        return 'none'
+    keys = set(data)
+    if keys & {'cursor', 'next_cursor', 'nextCursor'}:
+        return 'cursor'
+    if keys & {'total_rows', 'offset'}:
+        return 'offset'
+    if keys & {'page', 'total_pages', 'next', 'next_page'}:
+        return 'page'
+    return 'none'
+
+
+class Capability:
+    """What is known about one endpoint path"""
+
+    __slots__ = ('path', 'ok', 'auth', 'status', 'shape', 'pagination', 'keys', 'seconds', 'probed_at', 'body')
+
+    def __init__(self, path, ok=False, auth=None, status=None, shape=None, pagination=None,
+                 keys=None, seconds=None, probed_at=None, body=None):
+        self.path = path
+        self.ok = ok
+        self.auth = auth
+        self.status = status
+        self.shape = shape
+        self.pagination = pagination
+        self.keys = keys or []
+        self.seconds = seconds
+        self.probed_at = probed_at or time.time()
+        self.body = body
+
+    @property
+    def age_seconds(self):
+        return time.time() - self.probed_at
+
+    def to_dict(self):
+        """The persisted fields (the response body is kept in memory only)"""
+        return {name: getattr(self, name) for name in self.__slots__ if name not in ('path', 'body')}
+
+    @classmethod
+    def from_dict(cls, path, data):
+        return cls(path, **{name: data.get(name) for name in cls.__slots__ if name not in ('path', 'body')})
+
+    def __repr__(self):
+        state = f"{self.auth}, {self.shape}, {self.pagination} pagination" if self.ok else f"status {self.status}"
+        return f"Capability({self.path}: {state})"
+
+
+class EndpointDiscovery:
+    """Parallel endpoint probing with a persisted, expiring capability file"""
+
+    def __init__(self, campaign_id=None, base_url=LOOPY_API_URL, path=None, ttl=None,
+                 concurrency=None, timeout=None, session=None, token_cache=None):
+        self.campaign_id = campaign_id or get_config().campaign_id
+        self.base_url = base_url
+        self.path = path or getenv('LOOPY_CAPABILITIES_FILE', DEFAULT_CAPABILITIES_FILE)
+        self.ttl = ttl if ttl is not None else float(getenv('LOOPY_CAPABILITY_TTL', DEFAULT_TTL))
+        self.concurrency = concurrency or int(getenv('LOOPY_DISCOVERY_CONCURRENCY', DEFAULT_CONCURRENCY))
+        self.timeout = timeout or float(getenv('LOOPY_DISCOVERY_TIMEOUT', DEFAULT_TIMEOUT))
+        self.session = session
+        self.token_cache = token_cache or get_token_cache()
+
+        self._lock = threading.Lock()
+        self._endpoints = self._read()
+        self.stats = {'probed': 0, 'from_file': 0}
+
+    def _http(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Capabilities probed against another Loopy host say nothing about this one
+        if not isinstance(data, dict) or data.get('base_url') != self.base_url:
+            return {}
+        endpoints = data.get('endpoints', {})
+        return {path: Capability.from_dict(path, entry) for path, entry in endpoints.items()}
+
+    def _write(self):
+        with self._lock:
+            data = {'base_url': self.base_url,
+                    'endpoints': {path: cap.to_dict() for path, cap in sorted(self._endpoints.items())}}
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_path, self.path)
+
+    def resolve(self, template):
+        return template.format(campaign_id=self.campaign_id)
+
+    def _headers(self, auth):
+        headers = {'Content-Type': 'application/json'}
+        if auth == 'jwt':
+            token = self.token_cache.get_token()
+            if not token:
+                return None
+            headers['Authorization'] = token
+        else:
+            api_key = get_config().loopy_api_key
+            if not api_key:
+                return None
+            headers['X-API-Key'] = api_key
+        return headers
+
+    def _probe(self, path, auth, params):
+        """One request; returns a Capability, or None if the outcome says nothing about the endpoint"""
+
+        headers = self._headers(auth)
+        if headers is None:
+            return None
+
+        started = time.monotonic()
+        try:
+            response = self._http().get(f'{self.base_url}{path}', headers=headers, params=params,
+                                        timeout=self.timeout)
+        except Exception:
+            return None
+        seconds = round(time.monotonic() - started, 3)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            return None
+        if response.status_code != 200:
+            return Capability(path, status=response.status_code, seconds=seconds)
+
+        try:
+            data = response.json()
+        except ValueError:
+            return Capability(path, status=200, shape='non_json', seconds=seconds)
+
+        return Capability(path, ok=True, auth=auth, status=200, shape=response_shape(data),
+                          pagination=pagination_style(data),
+                          keys=sorted(data)[:20] if isinstance(data, dict) else [],
+                          seconds=seconds, body=data)
+
+    def probe(self, paths, params=None):
+        """Probe resolved paths with every auth scheme in parallel; returns {path: Capability}"""
+
+        attempts = [(path, auth) for path in paths for auth in AUTH_SCHEMES]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(attempts) or 1),
+                                thread_name_prefix='loopy-discovery') as pool:
+            outcomes = list(pool.map(lambda attempt: self._probe(*attempt, params), attempts))
+        self.stats['probed'] += len(attempts)
+
+        results = {}
+        for (path, auth), capability in zip(attempts, outcomes):
+            if capability is None:
+                continue
+            current = results.get(path)
+            # A working scheme beats a refusal; otherwise the preferred scheme (first probed) wins
+            if current is None or (capability.ok and not current.ok):
+                results[path] = capability
+        return results
+
+    def discover(self, templates, params=None, refresh=False):
+        """
+        Capabilities of the candidate paths (templates may use {campaign_id}),
+        probing only those not known or expired. Returns [Capability] in
+        candidate order; paths that could not be judged this run are omitted
+        """
+
+        paths = [self.resolve(template) for template in templates]
+        stale = [path for path in paths
+                 if refresh or path not in self._endpoints or self._endpoints[path].age_seconds > self.ttl]
+        self.stats['from_file'] += len(paths) - len(stale)
+
+        if stale:
+            found = self.probe(stale, params)
+            if found:
+                with self._lock:
+                    self._endpoints.update(found)
+                self._write()
+
+        return [self._endpoints[path] for path in paths if path in self._endpoints]
+
+    def working(self, templates, params=None, refresh=False):
+        """Only the candidates known to work"""
+        return [capability for capability in self.discover(templates, params, refresh) if capability.ok]
+
+    def fetch(self, capability, params=None):
+        """JSON of a working endpoint (the probe's body if it was probed this run), or None"""
+
+        if capability.body is not None:
+            body, capability.body = capability.body, None
+            return body
+
+        headers = self._headers(capability.auth)
+        if headers is None:
+            return None
+        try:
+            response = self._http().get(f'{self.base_url}{capability.path}', headers=headers,
+                                        params=params, timeout=self.timeout)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            print(f"⚠️ {capability.path}: {e}")
+            return None
+
+        if response.status_code in (401, 403, 404):
+            # It stopped working: forget it so the next run probes again
+            with self._lock:
+                self._endpoints.pop(capability.path, None)
+            self._write()
+        return None
+
+
+def discover_endpoints(templates, campaign_id=None, params=None, refresh=False):
+    """Shortcut: the EndpointDiscovery and its [Capability] for the candidates"""
+
+    discovery = EndpointDiscovery(campaign_id)
+    return discovery, discovery.discover(templates, params, refresh)
+
+
+def print_capabilities(capabilities, discovery=None):
+    """One line per endpoint, as the search scripts show them"""
+
+    for capability in capabilities:
+        if capability.ok:
+            print(f"   ✅ {capability.path}: {capability.auth} auth, {capability.shape}, "
+                  f"{capability.pagination} pagination ({capability.seconds}s)")
+        else:
+            print(f"   ❌ {capability.path}: {capability.status}")
+    if discovery is not None:
+        print(f"   📊 {discovery.stats['from_file']} from {discovery.path}, {discovery.stats['probed']} probe(s)")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find out which Loopy endpoints work')
+    parser.add_argument('paths', nargs='+', help='Candidate paths, e.g. /campaigns/{campaign_id}/cards')
+    parser.add_argument('--campaign', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--refresh', action='store_true', help='Probe again even if the file is fresh')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    discovery, capabilities = discover_endpoints(args.paths, args.campaign, refresh=args.refresh)
+    print(f"🔍 {len(args.paths)} candidate(s) in {time.monotonic() - started:.1f}s")
+    print_capabilities(capabilities, discovery)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Loopy-Munch Integration Server
+==============================
+
+Container entry point (Dockerfile, railway.json). A single asyncio
+process serves the same endpoints and JSON contracts as the Vercel
+functions in api/:
+
+- GET  /health, /api/health             -> api/health.py
+- GET  /, /api/index                    -> api/index.py
+- *    /webhook/*, /api/webhook[/*]     -> api/webhook.py
+  (admission control, priority lanes, dedup and bulk ingestion included)
+
+FEATURES:
+1. HTTP/1.1 keep-alive with an idle timeout
+2. Bounded concurrency: a connection cap plus a concurrent-request cap
+3. Graceful drain on SIGTERM/SIGINT: stop accepting, close idle
+   connections, let in-flight requests finish (up to a deadline)
+4. Optional pre-fork mode (--workers N, see prefork.py) sharing one
+   copy-on-write Munch directory between worker processes
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import signal
+import time
+from http import HTTPStatus
+
+from app_config import getenv
+from api import health, index, webhook
+from admission import classify_event
+from deposit_ledger import NOT_PERSISTENT_ERROR, DepositLedger
+import json_backend
+from warmup import Warmup, set_warmup
+
+# Largest single-event webhook body we accept (bulk bodies are streamed)
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*'
+}
+
+WEBHOOK_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+
+class HTTPError(Exception):
+    """Protocol error answered with a status code before closing"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RequestHeaders(dict):
+    """Case-insensitive header lookup (keys stored lower-case)"""
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class Request:
+    """Parsed HTTP request head"""
+
+    __slots__ = ('method', 'path', 'version', 'headers')
+
+    def __init__(self, method, path, version, headers):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+
+    @property
+    def keep_alive(self):
+        connection = (self.headers.get('Connection') or '').lower()
+        if self.version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+
+def route_for(path):
+    """Map a request path to a handler name, following vercel.json"""
+
+    path = path.split('?', 1)[0].rstrip('/') or '/'
+
+    if path in ('/health', '/api/health'):
+        return 'health'
+    if path in ('/', '/api/index'):
+        return 'index'
+    if path in ('/webhook', '/api/webhook') or path.startswith(('/webhook/', '/api/webhook/')):
+        return 'webhook'
+    return None
+
+
+class IntegrationServer:
+    """Asyncio HTTP/1.1 server hosting the integration handlers"""
+
+    def __init__(self, host='0.0.0.0', port=5008, max_connections=10000,
+                 max_concurrency=1000, keepalive_timeout=15.0, drain_timeout=30.0,
+                 warmup=None):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.keepalive_timeout = keepalive_timeout
+        self.drain_timeout = drain_timeout
+        # Warm-up stage run alongside serving; /health is 503 until it finishes
+        self.warmup = warmup
+
+        self.connections = 0
+        self.active_requests = 0
+        self.requests_served = 0
+        self.draining = False
+
+        self._idle_connections = set()
+        self._connection_tasks = set()
+        self._request_slots = None
+        self._stop = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def serve(self, sock=None):
+        """Serve until SIGTERM/SIGINT, then drain gracefully"""
+
+        loop = asyncio.get_running_loop()
+        self._request_slots = asyncio.Semaphore(self.max_concurrency)
+        self._stop = asyncio.Event()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stop.set)
+
+        if sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=sock, limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port,
+                backlog=1024, limit=MAX_HEADER_BYTES
+            )
+
+        print(f"🚀 Loopy-Munch integration server listening on {self.host}:{self.port} (pid {os.getpid()})")
+        print(f"   Max connections: {self.max_connections}")
+        print(f"   Max concurrent requests: {self.max_concurrency}")
+
+        if self.warmup is not None:
+            set_warmup(self.warmup)
+            self.warmup.start()
+            print(f"🔥 Warm-up started: {', '.join(self.warmup.steps)} (budget {self.warmup.budget_seconds:g}s)")
+
+        await self._stop.wait()
+        await self.drain(server)
+
+    async def drain(self, server):
+        """Stop accepting, close idle keep-alive connections, finish in-flight work"""
+
+        print(f"🛑 Draining: {self.active_requests} request(s) in flight, {self.connections} connection(s)")
+        self.draining = True
+        server.close()
+
+        # Waking an idle reader with EOF ends its keep-alive loop cleanly
+        for reader, writer in list(self._idle_connections):
+            reader.feed_eof()
+            writer.close()
+
+        deadline = time.monotonic() + self.drain_timeout
+        while self.active_requests and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        for task in list(self._connection_tasks):
+            task.cancel()
+        if self._connection_tasks:
+            await asyncio.gather(*self._connection_tasks, return_exceptions=True)
+
+        print(f"👋 Server stopped after {self.requests_served} request(s)")
+
+    # ------------------------------------------------------------------
+    # Connections and protocol
+    # ------------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connection_tasks.add(task)
+        self.connections += 1
+
+        try:
+            if self.connections > self.max_connections or self.draining:
+                await self._send_json(writer, 503, {'status': 'error', 'message': 'Server busy'},
+                                      keep_alive=False, extra_headers={'Retry-After': '1'})
+                return
+
+            keep_alive = True
+            while keep_alive and not self.draining:
+                self._idle_connections.add((reader, writer))
+                try:
+                    request = await asyncio.wait_for(self._read_head(reader), self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except HTTPError as e:
+                    await self._send_json(writer, e.status_code, {'status': 'error', 'message': str(e)}, keep_alive=False)
+                    return
+                finally:
+                    self._idle_connections.discard((reader, writer))
+
+                if request is None:
+                    return
+
+                async with self._request_slots:
+                    self.active_requests += 1
+                    try:
+                        keep_alive = await self._dispatch(request, reader, writer)
+                    finally:
+                        self.active_requests -= 1
+                        self.requests_served += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Drain deadline passed with this request still running
+            pass
+        finally:
+            self.connections -= 1
+            self._connection_tasks.discard(task)
+            writer.close()
+
+    async def _read_head(self, reader):
+        """Read and parse the request line and headers"""
+
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, 'Request headers too large')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'Malformed request line')
+
+        headers = RequestHeaders()
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        return Request(method.upper(), path, version.strip(), headers)
+
+    async def _iter_body(self, request, reader, limit=None):
+        """Yield the request body in chunks (Content-Length or chunked)"""
+
+        received = 0
+
+        if (request.headers.get('Transfer-Encoding') or '').lower() == 'chunked':
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    return
+                received += size
+                if limit and received > limit:
+                    raise HTTPError(413, 'Request body too large')
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        else:
+            remaining = int(request.headers.get('Content-Length') or 0)
+            if limit and remaining > limit:
+                raise HTTPError(413, 'Request body too large')
+            while remaining > 0:
+                chunk = await reader.read(min(65536, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+
+    async def _read_body(self, request, reader):
+        chunks = [chunk async for chunk in self._iter_body(request, reader, limit=MAX_BODY_BYTES)]
+        return b''.join(chunks)
+
+    def _response_head(self, status_code, headers, keep_alive):
+        lines = [f'HTTP/1.1 {status_code} {HTTPStatus(status_code).phrase}']
+        for name, value in headers.items():
+            lines.append(f'{name}: {value}')
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send(self, writer, status_code, headers, body, keep_alive):
+        headers = dict(headers, **{'Content-Length': str(len(body))})
+        writer.write(self._response_head(status_code, headers, keep_alive) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status_code, response, keep_alive=True,
+                         extra_headers=None, pretty=False, cors=CORS_HEADERS):
+        headers = {'Content-type': 'application/json'}
+        headers.update(cors)
+        headers.update(extra_headers or {})
+        body = json_backend.dumps(response, pretty=pretty)
+        await self._send(writer, status_code, headers, body, keep_alive)
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    async def _dispatch(self, request, reader, writer):
+        """Handle one request; returns whether the connection stays open"""
+
+        keep_alive = request.keep_alive and not self.draining
+        route = route_for(request.path)
+
+        if route is None:
+            await self._send_json(writer, 404, {'status': 'error', 'message': f'Not found: {request.path}'}, keep_alive=False)
+            return False
+
+        if request.method == 'OPTIONS':
+            await self._send(writer, 200, WEBHOOK_CORS_HEADERS, b'', keep_alive)
+            return keep_alive
+
+        if route == 'health' and request.method == 'GET':
+            response = health.build_health_response()
+            await self._send_json(writer, health.health_status_code(response), response, keep_alive,
+                                  pretty=health.wants_pretty(request.path))
+            return keep_alive
+
+        if route == 'index' and request.method == 'GET':
+            host = request.headers.get('Host', 'localhost')
+            await self._send_json(writer, 200, index.build_index_response(host), keep_alive, pretty=True)
+            return keep_alive
+
+        if route == 'webhook' and request.method == 'GET':
+            await self._send_json(writer, 200, webhook.build_webhook_info(), keep_alive)
+            return keep_alive
+
+        if route == 'webhook' and request.method == 'POST':
+            return await self._webhook_post(request, reader, writer, keep_alive)
+
+        await self._send_json(writer, 405, {'status': 'error', 'message': f'Method not allowed: {request.method}'}, keep_alive=False)
+        return False
+
+    async def _webhook_post(self, request, reader, writer, keep_alive):
+        """POST /webhook/*: same admission, lanes and pipeline as api/webhook.py"""
+
+        endpoint = webhook.get_webhook_endpoint(request.path)
+        decision = webhook.ADMISSION.try_admit(classify_event(endpoint))
+
+        if not decision.admitted:
+            # The body is left unread, so this connection cannot be reused
+            await self._send_json(writer, decision.status_code, webhook.build_rejection_response(decision),
+                                  keep_alive=False, extra_headers={'Retry-After': str(decision.retry_after)})
+            return False
+
+        started = time.monotonic()
+        try:
+            if endpoint == 'bulk':
+                await self._webhook_bulk(request, reader, writer)
+                return False
+
+            try:
+                data = webhook.decode_webhook_body(await self._read_body(request, reader))
+                future = webhook.LANES.submit_keyed(decision.event_class, webhook.card_key(data),
+                                                    webhook.process_loopy_event, endpoint, data, request.path)
+                response = await asyncio.wrap_future(future)
+            except HTTPError as e:
+                await self._send_json(writer, e.status_code, {'status': 'error', 'message': str(e)}, keep_alive=False)
+                return False
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                await self._send_json(writer, 500, webhook.build_error_response(e), keep_alive)
+                return keep_alive
+
+            await self._send_json(writer, 200, response, keep_alive, cors=WEBHOOK_CORS_HEADERS)
+            return keep_alive
+        finally:
+            webhook.ADMISSION.release(decision, time.monotonic() - started)
+
+    async def _webhook_bulk(self, request, reader, writer):
+        """Stream NDJSON in, run it through the bulk pipeline in a thread, stream results out"""
+
+        loop = asyncio.get_running_loop()
+        chunks = queue.Queue(maxsize=16)
+        results = asyncio.Queue()
+        gzipped = webhook.is_gzip_body(request.headers)
+
+        def run_pipeline():
+            try:
+                lines = webhook.iter_ndjson_lines(iter(chunks.get, None), gzipped)
+                for result in webhook.process_bulk_stream(lines, request.path):
+                    loop.call_soon_threadsafe(results.put_nowait, result)
+            except Exception as e:
+                error = {'status': 'error', 'message': f'Bulk ingestion aborted: {e}'}
+                loop.call_soon_threadsafe(results.put_nowait, error)
+            finally:
+                loop.call_soon_threadsafe(results.put_nowait, None)
+
+        def put_chunk(chunk):
+            # Gives up once the pipeline has stopped consuming
+            while not pipeline.done():
+                try:
+                    chunks.put(chunk, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        async def feed():
+            try:
+                async for chunk in self._iter_body(request, reader):
+                    await loop.run_in_executor(None, put_chunk, chunk)
+            finally:
+                await loop.run_in_executor(None, put_chunk, None)
+
+        pipeline = loop.run_in_executor(None, run_pipeline)
+        feeder = asyncio.ensure_future(feed())
+
+        headers = {'Content-type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked'}
+        headers.update(CORS_HEADERS)
+        writer.write(self._response_head(200, headers, keep_alive=False))
+
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                line = json_backend.dumps_line(result)
+                writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+                await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            feeder.cancel()
+            await asyncio.gather(feeder, pipeline, return_exceptions=True)
+
+
+def main():
+    """Parse arguments and run the server"""
+
+    parser = argparse.ArgumentParser(description='Loopy-Munch integration server (asyncio)')
+    parser.add_argument('--host', default=getenv('HOST', '0.0.0.0'), help='Bind address (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(getenv('PORT', '5008')), help='Port (default: $PORT or 5008)')
+    parser.add_argument('--max-connections', type=int, default=int(getenv('SERVER_MAX_CONNECTIONS', '10000')),
+                        help='Open connection cap (default: 10000)')
+    parser.add_argument('--max-concurrency', type=int, default=int(getenv('SERVER_MAX_CONCURRENCY', '1000')),
+                        help='Concurrent request cap (default: 1000)')
+    parser.add_argument('--keepalive-timeout', type=float, default=15.0, help='Idle keep-alive timeout in seconds (default: 15)')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='Graceful drain deadline in seconds (default: 30)')
+    parser.add_argument('--warmup-budget', type=float, default=float(getenv('WARMUP_BUDGET', '20')),
+                        help='Warm-up time budget in seconds (default: $WARMUP_BUDGET or 20)')
+    parser.add_argument('--no-warmup', action='store_true', help='Report ready immediately without warming up')
+    parser.add_argument('--workers', type=int, default=int(getenv('WEB_CONCURRENCY', '1')),
+                        help='Pre-forked worker processes sharing the Munch directory (default: $WEB_CONCURRENCY or 1)')
+
+    args = parser.parse_args()
+
+    if not DepositLedger().persistent:
+        print(f"⚠️ {NOT_PERSISTENT_ERROR}; every deposit will be refused (set it to a file on a persistent volume)")
+
+    # /health reports this server rather than Vercel's functions (workers inherit it on fork)
+    health.set_deployment_info('container', 'prefork_server' if args.workers > 1 else 'asyncio_server',
+                               workers=args.workers)
+
+    def make_server():
+        return IntegrationServer(
+            host=args.host,
+            port=args.port,
+            max_connections=args.max_connections,
+            max_concurrency=args.max_concurrency,
+            keepalive_timeout=args.keepalive_timeout,
+            drain_timeout=args.drain_timeout,
+            warmup=None if args.no_warmup else Warmup(budget_seconds=args.warmup_budget)
+        )
+
+    if args.workers > 1:
+        from prefork import PreforkMaster
+        PreforkMaster(make_server, args.host, args.port, workers=args.workers).run()
+    else:
+        asyncio.run(make_server().serve())
+
+
+if __name__ == "__main__":
+    main()
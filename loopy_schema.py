@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Loopy Webhook Schema
+====================
+
+One declarative description of the Loopy webhook payload, compiled once
+into a validator that checks, normalizes and extracts every field in a
+single pass.
+
+WHY:
+Validation used to be repeated in the webhook handler, the deposit path
+and the integration scripts, each walking card/customerDetails/campaign
+on its own and reading CAMPAIGN_ID on every request. Loopy also names
+some fields differently between payloads (`email` vs `Email address`).
+
+HOW IT WORKS:
+1. LOOPY_FIELDS lists each field once: the attribute it becomes, the
+   payload paths it may arrive under (aliases) and its type
+2. compile_schema() turns that into a flat tuple of extractors and
+   freezes the required fields and accepted campaigns
+3. validate() returns a slotted LoopyEvent or raises LoopySchemaError
+   listing every problem at once
+
+webhook_validator() and deposit_validator() are built on first use and
+shared by every request in the process; deposit_validator() is rebuilt
+when a new rule engine is installed (e.g. warm_state reloading the rules).
+"""
+
+from reward_rules import get_rule_engine
+
+
+# Declarative schema: attribute, accepted payload paths (first non-empty match wins), type
+LOOPY_FIELDS = (
+    ('event_type', (('event',), ('type',)), 'str'),
+    ('card_id', (('card', 'id'),), 'str'),
+    ('total_stamps', (('card', 'totalStampsEarned'),), 'int'),
+    ('rewards_earned', (('card', 'totalRewardsEarned'),), 'int'),
+    ('rewards_redeemed', (('card', 'totalRewardsRedeemed'),), 'int'),
+    ('pass_status', (('card', 'passStatus'),), 'str'),
+    ('email', (('card', 'customerDetails', 'email'),
+               ('card', 'customerDetails', 'Email address'),
+               ('card', 'customerDetails', 'Email')), 'email'),
+    ('name', (('card', 'customerDetails', 'Name'),
+              ('card', 'customerDetails', 'name')), 'str'),
+    ('phone', (('card', 'customerDetails', 'phone'),
+               ('card', 'customerDetails', 'Contact Number'),
+               ('card', 'customerDetails', 'Phone')), 'str'),
+    ('campaign_id', (('campaign', 'id'),
+                     ('card', 'campaignID'),
+                     ('card', 'campaignId')), 'str'),
+)
+
+
+class LoopySchemaError(ValueError):
+    """Payload failed validation; .errors lists every problem found"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+class LoopyEvent:
+    """Validated, normalized Loopy webhook event"""
+
+    __slots__ = ('event_type', 'card_id', 'total_stamps', 'rewards_earned', 'rewards_redeemed',
+                 'pass_status', 'email', 'name', 'phone', 'campaign_id', 'has_card', 'raw')
+
+    def __init__(self, values, has_card, raw):
+        for attribute in self.__slots__:
+            setattr(self, attribute, None)
+        for attribute, value in values.items():
+            setattr(self, attribute, value)
+        self.has_card = has_card
+        self.raw = raw
+
+    def to_dict(self):
+        """Plain dict of the extracted fields (without the raw payload)"""
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'raw'}
+
+    def __repr__(self):
+        return f"LoopyEvent(card_id={self.card_id!r}, email={self.email!r}, total_stamps={self.total_stamps})"
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError('expected a string')
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise TypeError('expected an integer')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    raise TypeError('expected an integer')
+
+
+def _to_email(value):
+    value = _to_str(value)
+    if value is None:
+        return None
+    if '@' not in value:
+        raise TypeError('expected an email address')
+    return value.lower()
+
+
+_CASTERS = {
+    'str': _to_str,
+    'int': _to_int,
+    'email': _to_email
+}
+
+# Fields left as None are given these values instead
+_DEFAULTS = {
+    'total_stamps': 0
+}
+
+
+class LoopyValidator:
+    """A compiled schema; build with compile_schema()"""
+
+    def __init__(self, extractors, required, campaigns):
+        self._extractors = extractors
+        self.required = required
+        self.campaigns = campaigns
+
+    def validate(self, data):
+        """Check, normalize and extract a payload in one pass"""
+
+        if not isinstance(data, dict):
+            raise LoopySchemaError(['webhook event must be a JSON object'])
+
+        errors = []
+        values = {}
+
+        for attribute, paths, cast in self._extractors:
+            for path in paths:
+                value = data
+                for depth, key in enumerate(path):
+                    if not isinstance(value, dict):
+                        if value is not None:
+                            errors.append(f"{'.'.join(path[:depth])} must be an object")
+                        value = None
+                        break
+                    value = value.get(key)
+                if isinstance(value, str) and not value.strip():
+                    # An empty alias falls through to the next one
+                    value = None
+                if value is not None:
+                    break
+
+            if value is not None:
+                try:
+                    value = cast(value)
+                except TypeError as e:
+                    errors.append(f"{'.'.join(path)}: {e}")
+                    value = None
+
+            if value is None:
+                value = _DEFAULTS.get(attribute)
+                if attribute in self.required:
+                    errors.append(f"missing {attribute}")
+            elif cast is _to_int and value < 0:
+                errors.append(f"{'.'.join(path)} must not be negative")
+
+            values[attribute] = value
+
+        campaign_id = values.get('campaign_id')
+        if self.campaigns is not None and campaign_id is not None and campaign_id not in self.campaigns:
+            errors.append(f"unknown campaign {campaign_id}")
+
+        if errors:
+            # One malformed container is reported once, not per field under it
+            raise LoopySchemaError(list(dict.fromkeys(errors)))
+
+        return LoopyEvent(values, isinstance(data.get('card'), dict), data)
+
+
+def compile_schema(fields=LOOPY_FIELDS, required=(), campaigns=None):
+    """
+    Compile a declarative field list into a LoopyValidator
+    required: attributes that must be present
+    campaigns: accepted campaign ids; None accepts any, an empty
+               collection accepts none (fails closed)
+    """
+
+    extractors = []
+    for attribute, paths, type_name in fields:
+        if attribute not in LoopyEvent.__slots__:
+            raise ValueError(f"Unknown event attribute in schema: {attribute}")
+        extractors.append((attribute, tuple(tuple(path) for path in paths), _CASTERS[type_name]))
+
+    return LoopyValidator(tuple(extractors), frozenset(required),
+                          None if campaigns is None else frozenset(campaigns))
+
+
+def configured_campaigns():
+    """Campaign ids accepted for deposits: those with a reward rule"""
+    return get_rule_engine().campaign_ids
+
+
+_webhook_validator = None
+# (rule engine, validator): rebuilt when the rules are reloaded
+_deposit_validator = None
+
+
+def webhook_validator():
+    """Lenient validator for incoming webhooks: types are checked, nothing is required"""
+
+    global _webhook_validator
+    if _webhook_validator is None:
+        _webhook_validator = compile_schema()
+    return _webhook_validator
+
+
+def deposit_validator():
+    """
+    Strict validator for deposits: card, email and a configured campaign
+    are required. With no campaigns configured every campaign is rejected
+    """
+
+    global _deposit_validator
+    engine = get_rule_engine()
+    if _deposit_validator is None or _deposit_validator[0] is not engine:
+        _deposit_validator = (engine, compile_schema(
+            required=('card_id', 'email', 'campaign_id'),
+            campaigns=engine.campaign_ids
+        ))
+    return _deposit_validator[1]
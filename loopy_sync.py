@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Incremental Loopy Sync
+======================
+
+Fetches only the cards that changed since the previous run.
+
+WHY:
+The search scripts looked for "today's" rewards by matching date
+strings (one even hard-coded a date) and re-read the whole campaign on
+every run, so each run cost time proportional to the campaign size.
+
+HOW IT WORKS:
+1. A high-watermark per campaign (the newest lastStampEarnedDate seen)
+   is kept in LOOPY_SYNC_STATE (default loopy_sync_state.json)
+2. A run asks for cards sorted newest first and stops requesting pages
+   once everything read so far, joined in page order, is sorted and
+   ends before the cutoff, so it reads roughly only the cards that
+   changed. Pages arrive out of order, so a page is checked against the
+   one before it, and a run that has not yet compared two dates never
+   stops early. If the API turns out not to sort, the run keeps reading
+   every page and filters locally instead
+3. The cutoff is the watermark minus an overlap (LOOPY_SYNC_OVERLAP,
+   default 300s), which covers clock skew between Loopy's servers and
+   stamps written late. The watermark is Loopy's own timestamp, never
+   our clock, and dates further than the overlap in the future are not
+   allowed to move it
+4. Cards in the overlap window that the previous run already delivered
+   (same card, same stamp date) are skipped, so overlapping windows do
+   not hand the same change over twice
+5. Cards with stamps but no stamp date cannot be placed against the
+   watermark; they are delivered whenever their stamp count differs
+   from the one last delivered. Every LOOPY_SYNC_SWEEP_EVERY seconds
+   (default a day) a run reads every page without stopping early, so
+   such cards on pages past the cutoff are found too
+6. The new watermark is saved only after the handler has processed the
+   whole run, so a crash means the changes are delivered again
+
+Usage:
+    python loopy_sync.py [campaign_id] [--full]
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from app_config import get_config, getenv
+from loopy_cards import LoopyCardPager
+
+DEFAULT_STATE_FILE = 'loopy_sync_state.json'
+DEFAULT_OVERLAP_SECONDS = 300
+DEFAULT_SWEEP_SECONDS = 24 * 3600
+
+# Newest cards first (verified page by page before relying on it)
+SORT_PARAMS = {'sort': 'lastStampEarnedDate', 'order': 'desc'}
+DATE_FIELD = 'lastStampEarnedDate'
+
+
+def parse_loopy_date(value):
+    """Loopy ISO timestamp ('2025-06-03T10:22:11.000Z') as an aware UTC datetime"""
+
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def format_loopy_date(value):
+    return value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z') if value else None
+
+
+class SyncState:
+    """Per-campaign watermarks persisted as JSON"""
+
+    def __init__(self, path=None):
+        self.path = path or getenv('LOOPY_SYNC_STATE', DEFAULT_STATE_FILE)
+        self._lock = threading.Lock()
+        self._campaigns = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data.get('campaigns', {}) if isinstance(data, dict) else {}
+
+    def get(self, campaign_id):
+        with self._lock:
+            return dict(self._campaigns.get(campaign_id) or {})
+
+    def watermark(self, campaign_id):
+        return parse_loopy_date(self.get(campaign_id).get('watermark'))
+
+    def update(self, campaign_id, **values):
+        """Merge values into a campaign's entry and write the file atomically"""
+
+        with self._lock:
+            entry = self._campaigns.setdefault(campaign_id, {})
+            entry.update(values)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({'campaigns': self._campaigns}, f, indent=2)
+            os.replace(temp_path, self.path)
+
+
+class IncrementalSync:
+    """One campaign's changed-since-watermark card stream"""
+
+    def __init__(self, campaign_id=None, state=None, overlap_seconds=None, pager_options=None, sweep_seconds=None):
+        self.campaign_id = campaign_id or get_config().campaign_id
+        self.state = state or SyncState()
+        if overlap_seconds is None:
+            overlap_seconds = float(getenv('LOOPY_SYNC_OVERLAP', DEFAULT_OVERLAP_SECONDS))
+        self.overlap = timedelta(seconds=overlap_seconds)
+        if sweep_seconds is None:
+            sweep_seconds = float(getenv('LOOPY_SYNC_SWEEP_EVERY', DEFAULT_SWEEP_SECONDS))
+        self.sweep_every = timedelta(seconds=sweep_seconds)
+        self.pager_options = dict(pager_options or {})
+
+    def run(self, handler, full=False):
+        """
+        Call handler(card) for every card changed since the last run
+        Returns the run's statistics; the watermark moves only if handler never raised
+        """
+
+        entry = {} if full else self.state.get(self.campaign_id)
+        watermark = parse_loopy_date(entry.get('watermark'))
+        cutoff = watermark - self.overlap if watermark else None
+        delivered_before = set(entry.get('boundary') or [])
+        undated_before = dict(entry.get('undated') or {})
+
+        now = datetime.now(timezone.utc)
+        # Never trust stamp dates further ahead than the overlap allows
+        latest_allowed = now + self.overlap
+        swept_at = parse_loopy_date(entry.get('swept_at'))
+        sweep = cutoff is None or swept_at is None or now - swept_at >= self.sweep_every
+
+        pager = LoopyCardPager(self.campaign_id, params=SORT_PARAMS, **self.pager_options)
+        sorted_pages = True
+        compared = 0
+        # Pages complete out of order: (first, last) stamp date of those not yet
+        # joined to the contiguous run of pages read from offset 0
+        spans = {}
+        joined_until = 0
+        oldest_joined = None
+        new_watermark = watermark
+        changed = skipped_old = skipped_duplicate = undated = 0
+        boundary = []
+        undated_delivered = {}
+
+        for offset, rows in pager.iter_pages():
+            dates = [parse_loopy_date(card.get(DATE_FIELD)) for card in rows]
+
+            known = [date for date in dates if date is not None]
+            compared += max(len(known) - 1, 0)
+            if any(a < b for a, b in zip(known, known[1:])):
+                # The API ignored the sort: every page has to be read
+                sorted_pages = False
+
+            spans[offset] = (known[0], known[-1]) if known else None
+            while joined_until in spans:
+                span = spans.pop(joined_until)
+                joined_until += pager.page_size
+                if span is None:
+                    continue
+                if oldest_joined is not None:
+                    compared += 1
+                    if span[0] > oldest_joined:
+                        sorted_pages = False
+                oldest_joined = span[1]
+
+            for card, date in zip(rows, dates):
+                if date is None:
+                    # No stamp date: deliver only stamps not delivered before
+                    undated += 1
+                    stamps = card.get('totalStampsEarned') or 0
+                    if cutoff is not None and (not stamps or undated_before.get(str(card.get('id'))) == stamps):
+                        continue
+                    if stamps:
+                        undated_delivered[str(card.get('id'))] = stamps
+                elif cutoff is not None and date < cutoff:
+                    skipped_old += 1
+                    continue
+
+                key = f"{card.get('id')}@{card.get(DATE_FIELD)}"
+                if date is not None and key in delivered_before:
+                    skipped_duplicate += 1
+                    continue
+
+                handler(card)
+                changed += 1
+
+                if date is not None and date <= latest_allowed:
+                    if new_watermark is None or date > new_watermark:
+                        new_watermark = date
+                    boundary.append((date, key))
+
+            if (cutoff is not None and not sweep and sorted_pages and compared
+                    and oldest_joined is not None and oldest_joined < cutoff):
+                pager.stop()
+
+        # Remember what was delivered inside the next run's overlap window
+        keep = delivered_before
+        if new_watermark is not None:
+            next_cutoff = new_watermark - self.overlap
+            delivered = [(parse_loopy_date(key.rsplit('@', 1)[1]), key) for key in delivered_before] + boundary
+            keep = {key for date, key in delivered if date is not None and date >= next_cutoff}
+
+        stats = pager.stats()
+        stats.update({
+            'cutoff': format_loopy_date(cutoff),
+            'previous_watermark': format_loopy_date(watermark),
+            'watermark': format_loopy_date(new_watermark),
+            'changed': changed,
+            'skipped_old': skipped_old,
+            'skipped_duplicate': skipped_duplicate,
+            'undated': undated,
+            'server_sorted': sorted_pages,
+            'swept': sweep
+        })
+
+        values = {'swept_at': now.isoformat()} if sweep else {}
+        self.state.update(
+            self.campaign_id,
+            watermark=format_loopy_date(new_watermark),
+            boundary=sorted(keep),
+            undated={**undated_before, **undated_delivered},
+            synced_at=datetime.now(timezone.utc).isoformat(),
+            last_run={key: stats[key] for key in ('pages', 'rows', 'changed', 'seconds', 'server_sorted')},
+            **values
+        )
+        return stats
+
+
+def main():
+    import argparse
+
+    from loopy_cards import LoopyPageError
+    from reward_rules import get_rule_engine
+
+    parser = argparse.ArgumentParser(description='Fetch Loopy cards changed since the last sync')
+    parser.add_argument('campaign_id', nargs='?', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--full', action='store_true', help='Ignore the watermark and read every card')
+    args = parser.parse_args()
+
+    sync = IncrementalSync(args.campaign_id)
+    engine = get_rule_engine()
+    print(f"🔄 Syncing campaign {sync.campaign_id} (watermark {sync.state.get(sync.campaign_id).get('watermark')})")
+
+    def report(card):
+        reward = engine.evaluate(sync.campaign_id, card.get('totalStampsEarned') or 0)
+        if reward and reward.rewards:
+            print(f"   🎉 {card.get('id')}: {reward.total_stamps} stamps -> {reward}")
+
+    try:
+        stats = sync.run(report, full=args.full)
+    except LoopyPageError as e:
+        print(f"❌ {e}")
+        return
+
+    print(f"✅ {stats['changed']} changed card(s); read {stats['rows']} cards in {stats['pages']} pages "
+          f"({stats['seconds']}s), new watermark {stats['watermark']}")
+    if not stats['server_sorted']:
+        print("⚠️ Loopy did not sort by stamp date; every page was read")
+
+
+if __name__ == "__main__":
+    main()
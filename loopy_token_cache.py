@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Loopy Token Cache
+=================
+
+Keeps the Loopy JWT between calls instead of logging in every time.
+
+WHY:
+Every script and handler POSTed to /v1/account/login before each run of
+API calls. That is a full round trip per call and hammering the login
+endpoint risks the account being locked out.
+
+HOW IT WORKS:
+1. The token's expiry is read from its JWT `exp` claim (tokens without
+   one are kept for LOOPY_TOKEN_TTL seconds, default 3000)
+2. get_token() returns the cached token while it is valid. Inside the
+   refresh margin (LOOPY_TOKEN_REFRESH_MARGIN, default 300s) the cached
+   token is still returned and one background refresh is started, so
+   callers never wait for a login while the token is still good
+3. Only one login runs at a time; concurrent callers that need a token
+   wait for that login instead of starting their own
+4. With LOOPY_TOKEN_CACHE_FILE set, the token is also written to that
+   file (mode 600) so other processes and later runs reuse it
+5. stats() reports the hit rate and login latency
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+
+from app_config import get_config, getenv
+
+LOOPY_LOGIN_URL = 'https://api.loopyloyalty.com/v1/account/login'
+
+DEFAULT_TOKEN_TTL = 3000
+DEFAULT_REFRESH_MARGIN = 300
+
+
+def decode_jwt_expiry(token):
+    """Unix `exp` claim of a JWT, or None if the token has none"""
+
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        exp = claims.get('exp')
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+
+class LoopyTokenCache:
+    """Process-wide Loopy JWT with proactive, single-flight refresh"""
+
+    def __init__(self, username=None, password=None, session=None,
+                 refresh_margin=None, default_ttl=None, persist_path=None):
+        config = get_config()
+        self.username = username if username is not None else config.loopy_username
+        self.password = password if password is not None else config.loopy_api_secret
+        self.session = session
+
+        if refresh_margin is None:
+            refresh_margin = float(getenv('LOOPY_TOKEN_REFRESH_MARGIN', DEFAULT_REFRESH_MARGIN))
+        if default_ttl is None:
+            default_ttl = float(getenv('LOOPY_TOKEN_TTL', DEFAULT_TOKEN_TTL))
+        if persist_path is None:
+            persist_path = getenv('LOOPY_TOKEN_CACHE_FILE') or None
+
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.persist_path = persist_path
+
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._refreshing = False
+        self._loaded_file = False
+
+        self.hits = 0
+        self.misses = 0
+        self.logins = 0
+        self.proactive_refreshes = 0
+        self.coalesced_waits = 0
+        self.file_loads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_login_seconds = 0.0
+        self.total_login_seconds = 0.0
+        self.max_login_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get_token(self, force_refresh=False):
+        """A valid token, logging in only when needed (None if login fails)"""
+
+        with self._lock:
+            if not self._loaded_file:
+                self._loaded_file = True
+                self._load_file()
+
+            now = time.time()
+            if not force_refresh and self._valid(now):
+                self.hits += 1
+                if now >= self._expires_at - self.refresh_margin and not self._refreshing:
+                    # Still good: refresh in the background, answer immediately
+                    self._refreshing = True
+                    self.proactive_refreshes += 1
+                    threading.Thread(target=self._refresh, name='loopy-token-refresh', daemon=True).start()
+                return self._token
+
+            self.misses += 1
+            if self._refreshing:
+                # Someone is already logging in: wait for their token
+                self.coalesced_waits += 1
+                while self._refreshing:
+                    self._refreshed.wait()
+                return self._token if self._valid(time.time()) else None
+
+            self._refreshing = True
+
+        self._refresh()
+        with self._lock:
+            return self._token if self._valid(time.time()) else None
+
+    def peek(self):
+        """Cached token without validating or refreshing it"""
+        return self._token
+
+    def is_valid(self, token):
+        """Whether `token` is the cached token and has not entered the refresh margin"""
+
+        with self._lock:
+            return (token is not None and token == self._token
+                    and time.time() < self._expires_at - self.refresh_margin)
+
+    def invalidate(self):
+        """Drop the token (e.g. after Loopy answered 401)"""
+
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+        self._remove_file()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            expires_in = self._expires_at - time.time() if self._token else None
+            return {
+                'cached': self._token is not None,
+                'expires_in_seconds': round(expires_in, 1) if expires_in is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'logins': self.logins,
+                'proactive_refreshes': self.proactive_refreshes,
+                'coalesced_waits': self.coalesced_waits,
+                'file_loads': self.file_loads,
+                'failures': self.failures,
+                'last_login_ms': round(self.last_login_seconds * 1000, 1),
+                'avg_login_ms': round(self.total_login_seconds / self.logins * 1000, 1) if self.logins else None,
+                'max_login_ms': round(self.max_login_seconds * 1000, 1),
+                'persist_path': self.persist_path,
+                'last_error': self.last_error
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _valid(self, now):
+        return self._token is not None and now < self._expires_at
+
+    def _refresh(self):
+        """Log in (or adopt a newer token from the cache file) and wake waiters"""
+
+        token, expires_at, error = None, 0.0, None
+        try:
+            token, expires_at = self._newer_file_token() or self._login()
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            if token:
+                self._token = token
+                self._expires_at = expires_at
+                self.last_error = None
+            else:
+                self.failures += 1
+                self.last_error = error or 'no token in login response'
+            self._refreshing = False
+            self._refreshed.notify_all()
+
+    def _login(self):
+        if not (self.username and self.password):
+            raise RuntimeError('Loopy credentials are not configured')
+
+        http = self.session
+        if http is None:
+            import requests
+            http = requests
+
+        started = time.perf_counter()
+        response = http.post(
+            LOOPY_LOGIN_URL,
+            json={'username': self.username, 'password': self.password},
+            headers={'Content-Type': 'application/json'},
+            timeout=10
+        )
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.logins += 1
+            self.last_login_seconds = elapsed
+            self.total_login_seconds += elapsed
+            self.max_login_seconds = max(self.max_login_seconds, elapsed)
+
+        if response.status_code != 200:
+            raise RuntimeError(f'Loopy login failed: {response.status_code}')
+        token = response.json().get('token')
+        if not token:
+            return None, 0.0
+
+        expires_at = decode_jwt_expiry(token) or time.time() + self.default_ttl
+        self._save_file(token, expires_at)
+        return token, expires_at
+
+    def _read_file(self):
+        if not self.persist_path:
+            return None
+        try:
+            with open(self.persist_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('username') != self.username or not data.get('token'):
+            return None
+        return data['token'], float(data.get('expires_at') or 0)
+
+    def _load_file(self):
+        """Adopt a persisted token on first use (caller holds the lock)"""
+
+        cached = self._read_file()
+        if cached and cached[1] > time.time():
+            self._token, self._expires_at = cached
+            self.file_loads += 1
+
+    def _newer_file_token(self):
+        """A token another process saved that outlives ours and is outside the refresh margin"""
+
+        cached = self._read_file()
+        if cached and cached[1] > max(self._expires_at, time.time() + self.refresh_margin):
+            with self._lock:
+                self.file_loads += 1
+            return cached
+        return None
+
+    def _save_file(self, token, expires_at):
+        if not self.persist_path:
+            return
+        temp_path = f'{self.persist_path}.{os.getpid()}.tmp'
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'username': self.username, 'token': token, 'expires_at': expires_at}, f)
+            os.replace(temp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ Could not persist Loopy token: {e}")
+
+    def _remove_file(self):
+        if self.persist_path:
+            try:
+                os.remove(self.persist_path)
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_token_cache(session=None):
+    """The process-wide token cache (`session` is used when it is first created)"""
+
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LoopyTokenCache(session=session)
+    return _cache
+
+
+def set_token_cache(cache):
+    global _cache
+    _cache = cache
+
+
+def get_loopy_token(force_refresh=False):
+    """Cached Loopy JWT for the configured account (None if login fails)"""
+    return get_token_cache().get_token(force_refresh)
@@ -94,6 +94,24 @@ class SystemMonitor:
         except Exception as e:
             return {"error": str(e), "success": False}
 
+    def show_card(self, query):
+        """Print a card's state from the local store (Loopy is asked only on a miss)"""
+        from card_state_store import get_card_state, get_card_state_store
+
+        if '@' in query:
+            states = get_card_state_store().find_by_email(query)
+        else:
+            state = get_card_state(query)
+            states = [state] if state else []
+
+        if not states:
+            print(f"❌ No card found for {query}")
+            return
+        for state in states:
+            print(f"💳 {state.card_id} ({state.email}): {state.total_stamps} stamps, "
+                  f"{state.rewards_earned} earned, {state.rewards_redeemed} redeemed, "
+                  f"{state.pass_status} [{state.source}, {state.age_seconds:.0f}s old]")
+
     def print_status_line(self):
         """Print a single status line"""
         local = self.get_service_status()
@@ -111,6 +129,7 @@ class SystemMonitor:
         print("  'test' - Send test enrollment webhook") 
         print("  'stamp' - Send test stamp webhook")
         print("  'logs' - Show recent logs")
+        print("  'card <id|email>' - Show card state")
         print("  'quit' - Exit monitor")
         print("=" * 50)
         
@@ -130,7 +149,8 @@ class SystemMonitor:
                 
                 # Simple input handling
                 try:
-                    cmd = input().strip().lower()
+                    raw = input().strip()
+                    cmd = raw.lower()
                     
                     if cmd == 'quit' or cmd == 'q':
                         break
@@ -159,6 +179,10 @@ class SystemMonitor:
                         print(logs)
                         print("-" * 40)
                     
+                    elif cmd.startswith('card '):
+                        print()
+                        self.show_card(raw[5:].strip())
+                    
                     elif cmd == '':
                         # Just refresh status
                         continue
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Munch Customer Directory
+========================
+
+Downloading `/account/retrieve-users` and scanning every customer on
+each lookup is the slowest part of a reward. The directory downloads
+the customer list once and indexes it by email.
+
+MEMORY LAYOUT:
+Each customer is stored as one tuple of strings in a single dict, so
+the index is a small number of compact, never-mutated objects. A
+pre-fork master can build it, freeze it out of the garbage collector's
+reach (gc.freeze) and let every worker share the pages copy-on-write.
+"""
+
+import time
+
+# Tuple layout of one indexed customer
+ID, EMAIL, FIRST_NAME, LAST_NAME, PHONE = range(5)
+
+# Directory shared by every lookup in this process (set by the pre-fork master or warm-up)
+_shared_directory = None
+
+
+class MunchDirectory:
+    """Email-indexed snapshot of the Munch customer list"""
+
+    __slots__ = ('by_email', 'loaded_at', 'load_seconds')
+
+    def __init__(self, by_email, loaded_at=None, load_seconds=0.0):
+        self.by_email = by_email
+        self.loaded_at = loaded_at or time.time()
+        self.load_seconds = load_seconds
+
+    @classmethod
+    def from_users(cls, users, load_seconds=0.0):
+        """Index raw Munch user records by lower-cased email"""
+
+        by_email = {}
+        for user in users:
+            entry = index_entry(user)
+            if entry is not None:
+                # Several accounts can share an email: the first one Munch lists wins
+                by_email.setdefault(entry[EMAIL], entry)
+
+        return cls(by_email, load_seconds=load_seconds)
+
+    @classmethod
+    def download(cls, integration):
+        """
+        Download and index the directory using a SecureMunchIntegration
+        Returns None if the download fails
+        """
+
+        started = time.monotonic()
+        users = integration.fetch_users()
+        if users is None:
+            return None
+
+        return cls.from_users(users, load_seconds=time.monotonic() - started)
+
+    def __len__(self):
+        return len(self.by_email)
+
+    def age_seconds(self):
+        return time.time() - self.loaded_at
+
+    def find_by_email(self, email):
+        """Customer record for an email, in SecureMunchIntegration's format"""
+
+        if not email:
+            return None
+
+        entry = self.by_email.get(email.strip().lower())
+        if entry is None:
+            return None
+
+        return {
+            'id': entry[ID],
+            'email': entry[EMAIL],
+            'name': f"{entry[FIRST_NAME]} {entry[LAST_NAME]}",
+            'phone': entry[PHONE],
+            'firstName': entry[FIRST_NAME],
+            'lastName': entry[LAST_NAME]
+        }
+
+
+def index_entry(user):
+    """A raw Munch user record as a directory tuple, or None without an email"""
+
+    email = (user.get('email') or '').strip().lower()
+    if not email:
+        return None
+    return (
+        user.get('id'),
+        email,
+        user.get('firstName') or '',
+        user.get('lastName') or '',
+        user.get('phone') or ''
+    )
+
+
+def get_shared_directory():
+    """The process-wide directory, or None if none has been loaded"""
+
+    return _shared_directory
+
+
+def set_shared_directory(directory):
+    """Install the process-wide directory"""
+
+    global _shared_directory
+    _shared_directory = directory
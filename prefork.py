@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Pre-Fork Worker Mode
+====================
+
+Runs the integration server as one master plus N forked workers that
+share a single listening socket.
+
+WHY:
+Without pre-forking, every worker downloads and indexes the Munch
+customer directory itself, multiplying memory and startup cost.
+
+HOW IT WORKS:
+1. The master binds the socket and loads the directory once
+2. gc.freeze() moves everything allocated so far into the permanent
+   generation, so collections in the workers never touch (and never
+   copy) those pages
+3. Workers are forked and share the directory copy-on-write
+4. SIGTERM drains all workers; crashed workers are replaced;
+   SIGHUP reloads the directory and replaces workers one by one;
+   SIGUSR1 prints a per-worker memory sharing report
+"""
+
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from munch_directory import MunchDirectory, set_shared_directory
+
+
+def read_memory_usage(pid):
+    """
+    Memory breakdown of a process in kB from /proc/<pid>/smaps_rollup
+    Shared_* pages are still shared with the master or other workers
+    """
+
+    fields = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+    usage = dict.fromkeys(fields, 0)
+
+    for path in (f'/proc/{pid}/smaps_rollup', f'/proc/{pid}/smaps'):
+        try:
+            with open(path) as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    if name in usage:
+                        usage[name] += int(value.split()[0])
+            break
+        except (OSError, ValueError):
+            continue
+    else:
+        return None
+
+    shared = usage['Shared_Clean'] + usage['Shared_Dirty']
+    usage['shared_percent'] = round(shared / usage['Rss'] * 100, 1) if usage['Rss'] else 0.0
+    return usage
+
+
+def preload_directory():
+    """Download the Munch directory in the master (skipped without credentials)"""
+
+    try:
+        from secure_munch_integration import SecureMunchIntegration
+        integration = SecureMunchIntegration()
+    except ValueError as e:
+        print(f"⚠️ Directory not preloaded: {e}")
+        return None
+
+    directory = MunchDirectory.download(integration)
+    if directory is None:
+        print("⚠️ Directory download failed; workers will search Munch live")
+        return None
+
+    print(f"📇 Munch directory loaded: {len(directory)} customers in {directory.load_seconds:.2f}s")
+    return directory
+
+
+class PreforkMaster:
+    """Owns the listening socket, the shared directory and the workers"""
+
+    def __init__(self, server_factory, host, port, workers=2):
+        self.server_factory = server_factory
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.workers = {}
+        self.sock = None
+        self.stopping = False
+        self.reload_requested = False
+        self.report_requested = False
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(1024)
+        sock.setblocking(False)
+        self.sock = sock
+
+    def load_shared_state(self):
+        """Load the directory and freeze it out of the collector's reach"""
+
+        set_shared_directory(preload_directory())
+        gc.collect()
+        gc.freeze()
+
+    def spawn_worker(self):
+        # Unflushed output would otherwise be printed again by the child
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.workers[pid] = time.time()
+        return pid
+
+    def _run_worker(self):
+        """Child process body; never returns"""
+
+        exit_code = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+                signal.signal(signum, signal.SIG_DFL)
+            gc.enable()
+            asyncio.run(self.server_factory().serve(sock=self.sock))
+        except BaseException as e:
+            print(f"❌ Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def memory_report(self):
+        """Per-worker memory sharing, as a list of dicts"""
+
+        report = []
+        for pid in sorted(self.workers):
+            usage = read_memory_usage(pid)
+            if usage:
+                report.append(dict(usage, pid=pid))
+        return report
+
+    def print_memory_report(self):
+        print("📊 WORKER MEMORY SHARING (kB)")
+        master = read_memory_usage(os.getpid())
+        if master:
+            print(f"   master {os.getpid()}: RSS {master['Rss']} | PSS {master['Pss']}")
+        for usage in self.memory_report():
+            print(f"   worker {usage['pid']}: RSS {usage['Rss']} | PSS {usage['Pss']} | "
+                  f"shared {usage['Shared_Clean'] + usage['Shared_Dirty']} ({usage['shared_percent']}%) | "
+                  f"private {usage['Private_Clean'] + usage['Private_Dirty']}")
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _on_report(self, signum, frame):
+        self.report_requested = True
+
+    def rolling_reload(self):
+        """Reload the directory, then replace workers one at a time"""
+
+        print("🔄 Reloading Munch directory and replacing workers...")
+        gc.unfreeze()
+        self.load_shared_state()
+
+        for pid in list(self.workers):
+            self.spawn_worker()
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+
+    def run(self):
+        """Bind, preload, fork and supervise until SIGTERM/SIGINT"""
+
+        # Keep the collector from touching shared objects until they are frozen
+        gc.disable()
+        self.bind()
+        self.load_shared_state()
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGUSR1, self._on_report)
+
+        print(f"🍴 Pre-fork master {os.getpid()} starting {self.num_workers} workers on {self.host}:{self.port}")
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+
+        while not self.stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+
+            if pid and pid in self.workers:
+                self.workers.pop(pid)
+                if not self.stopping:
+                    print(f"⚠️ Worker {pid} exited ({status}); starting a replacement")
+                    self.spawn_worker()
+
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_reload()
+
+            if self.report_requested:
+                self.report_requested = False
+                self.print_memory_report()
+
+            time.sleep(0.2)
+
+        print(f"🛑 Stopping {len(self.workers)} workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.sock.close()
+        print("👋 Pre-fork master stopped")
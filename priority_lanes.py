@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Priority Lanes - Weighted Scheduling for Webhook Events
+=======================================================
+
+Reward events move money; stamp and enrolled events do not. A flood of
+stamps must never delay a reward, but stamps must not starve either.
+
+HOW IT WORKS:
+1. Each event class has its own FIFO lane (rewards, stamp, enrolled)
+2. Worker threads pick the next lane by smooth weighted round-robin
+   over the lanes that have work, so with weights 6:3:1 a busy enrolled
+   lane is still guaranteed 1 in every 10 dispatches
+3. Every item records how long it waited in its lane; the metrics
+   report p50/p90/p99 wait times per lane
+4. Items submitted with a key (the Loopy card id) never run
+   concurrently: an item whose key is already running is parked behind
+   it and run by the same worker next, in dispatch order, like the
+   shards of keyed_executor
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from app_config import getenv
+
+DEFAULT_WEIGHTS = {
+    'rewards': 6,
+    'stamp': 3,
+    'enrolled': 1
+}
+
+# Wait-time samples kept per lane for percentiles
+WAIT_SAMPLES = 1000
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class _Lane:
+    """One FIFO lane with its weight and statistics"""
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.current_weight = 0
+        self.items = deque()
+        self.dispatched = 0
+        self.max_depth = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+
+class LaneScheduler:
+    """Worker pool that drains per-class lanes by weighted round-robin"""
+
+    def __init__(self, weights=None, workers=None, name='lanes'):
+        """
+        Configure lanes and worker count (defaults to WEBHOOK_WORKERS or 4)
+        Threads start on the first submit, so a pre-fork master can
+        import this safely
+        """
+
+        if workers is None:
+            workers = int(getenv('WEBHOOK_WORKERS', '4'))
+
+        weights = weights or DEFAULT_WEIGHTS
+        self.lanes = {lane: _Lane(lane, weight) for lane, weight in weights.items()}
+        self.total_weight = sum(weights.values())
+        self.default_lane = list(self.lanes)[-1]
+
+        self.name = name
+        self.workers = max(1, workers)
+        self._condition = threading.Condition()
+        self._running = True
+        self._threads = []
+        # Key -> items parked behind the one running for that key
+        self._keys_running = {}
+
+    def submit(self, lane, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on a lane; returns a Future"""
+
+        return self.submit_keyed(lane, None, fn, *args, **kwargs)
+
+    def submit_keyed(self, lane, key, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on a lane, never running it alongside
+        other work for the same key (None = no key); returns a Future
+        """
+
+        future = Future()
+        lane = self.lanes.get(lane) or self.lanes[self.default_lane]
+
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('cannot submit after shutdown')
+            if not self._threads:
+                self._start_workers()
+            lane.items.append((time.monotonic(), key, future, fn, args, kwargs))
+            lane.max_depth = max(lane.max_depth, len(lane.items))
+            self._condition.notify()
+
+        return future
+
+    def _start_workers(self):
+        """Start the worker threads (caller holds the condition lock)"""
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f'{self.name}-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _next_item(self):
+        """
+        Smooth weighted round-robin over non-empty lanes
+        Caller holds the condition lock
+        """
+
+        ready = [lane for lane in self.lanes.values() if lane.items]
+        if not ready:
+            return None
+
+        total = 0
+        chosen = None
+        for lane in ready:
+            lane.current_weight += lane.weight
+            total += lane.weight
+            if chosen is None or lane.current_weight > chosen.current_weight:
+                chosen = lane
+        chosen.current_weight -= total
+
+        enqueued, key, future, fn, args, kwargs = chosen.items.popleft()
+        chosen.dispatched += 1
+        chosen.waits.append(time.monotonic() - enqueued)
+        return key, future, fn, args, kwargs
+
+    def _next_runnable(self):
+        """
+        Next dispatched item whose key is not running, parking the others
+        Caller holds the condition lock
+        """
+
+        while True:
+            item = self._next_item()
+            if item is None or item[0] is None:
+                return item
+            parked = self._keys_running.get(item[0])
+            if parked is None:
+                self._keys_running[item[0]] = deque()
+                return item
+            parked.append(item)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                item = self._next_runnable()
+                while item is None:
+                    if not self._running:
+                        return
+                    self._condition.wait()
+                    item = self._next_runnable()
+
+            # Run the item, then whatever was parked behind its key meanwhile
+            while item is not None:
+                key, future, fn, args, kwargs = item
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+
+                item = None
+                if key is not None:
+                    with self._condition:
+                        parked = self._keys_running[key]
+                        if parked:
+                            item = parked.popleft()
+                        else:
+                            del self._keys_running[key]
+
+    def get_metrics(self):
+        """Depth, dispatch share and wait-time percentiles per lane"""
+
+        with self._condition:
+            snapshot = [
+                (lane.name, lane.weight, len(lane.items), lane.max_depth, lane.dispatched, sorted(lane.waits))
+                for lane in self.lanes.values()
+            ]
+            keys_running = len(self._keys_running)
+            parked = sum(len(items) for items in self._keys_running.values())
+
+        total_dispatched = sum(item[4] for item in snapshot)
+        lanes = {}
+
+        for name, weight, depth, max_depth, dispatched, waits in snapshot:
+            lanes[name] = {
+                'weight': weight,
+                'guaranteed_share': round(weight / self.total_weight, 3),
+                'queue_depth': depth,
+                'max_queue_depth': max_depth,
+                'dispatched': dispatched,
+                'dispatch_share': round(dispatched / total_dispatched, 3) if total_dispatched else 0.0,
+                'wait_ms': {
+                    'p50': round(percentile(waits, 0.50) * 1000, 2),
+                    'p90': round(percentile(waits, 0.90) * 1000, 2),
+                    'p99': round(percentile(waits, 0.99) * 1000, 2),
+                    'max': round(waits[-1] * 1000, 2) if waits else 0.0
+                }
+            }
+
+        return {
+            'workers': self.workers,
+            'keys_running': keys_running,
+            'parked_behind_key': parked,
+            'lanes': lanes
+        }
+
+    def shutdown(self, wait=True):
+        """Stop workers after the lanes drain"""
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
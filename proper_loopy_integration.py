@@ -7,14 +7,14 @@ CORRECT approach: Only process rewards from actual Loopy webhook data.
 NEVER use hardcoded customer IDs or deposit without verification.
 """
 
-import os
 import requests
 import json
 from datetime import datetime
-from dotenv import load_dotenv
+from app_config import get_config
 from munch_loyalty_integration_final import deposit_loyalty_reward
+from loopy_schema import LoopySchemaError, webhook_validator, deposit_validator
+from reward_rules import get_rule_engine
 
-load_dotenv('production.env')
 
 def process_real_loopy_webhook(webhook_data):
     """
@@ -27,15 +27,21 @@ def process_real_loopy_webhook(webhook_data):
     print(f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
     
-    # Extract data from the actual Loopy webhook
-    card_data = webhook_data.get('card', {})
-    customer_details = card_data.get('customerDetails', {})
+    # Extract data from the actual Loopy webhook (one schema pass, email/"Email address" aliases)
+    try:
+        event = webhook_validator().validate(webhook_data)
+    except LoopySchemaError as e:
+        print(f"❌ INVALID WEBHOOK: {e}")
+        return {
+            'success': False,
+            'error': f'Invalid webhook from Loopy: {e}'
+        }
     
     # Get the actual customer information from Loopy
-    loopy_card_id = card_data.get('id')
-    customer_email = customer_details.get('email')
-    customer_phone = customer_details.get('phone')
-    total_stamps = card_data.get('totalStampsEarned', 0)
+    loopy_card_id = event.card_id
+    customer_email = event.email
+    customer_phone = event.phone
+    total_stamps = event.total_stamps
     
     print(f"📊 LOOPY WEBHOOK DATA:")
     print(f"   Card ID: {loopy_card_id}")
@@ -52,18 +58,24 @@ def process_real_loopy_webhook(webhook_data):
             'error': 'Missing required customer information from Loopy'
         }
     
-    # Calculate rewards ONLY if customer has earned them
-    STAMPS_PER_COFFEE = 12
-    COFFEE_VALUE_CENTS = 4000  # R40
+    # Calculate rewards ONLY if customer has earned them (campaign's precompiled rule)
+    reward = get_rule_engine().evaluate(event.campaign_id, total_stamps)
     
-    free_coffees = total_stamps // STAMPS_PER_COFFEE
+    if reward is None:
+        print(f"❌ No reward rule for campaign {event.campaign_id}")
+        return {
+            'success': False,
+            'error': f'No reward rule for campaign {event.campaign_id}'
+        }
+    
+    free_coffees = reward.rewards
     
     if free_coffees == 0:
-        print(f"ℹ️ Customer has {total_stamps} stamps, needs {STAMPS_PER_COFFEE - (total_stamps % STAMPS_PER_COFFEE)} more")
+        print(f"ℹ️ Customer has {total_stamps} stamps, needs {reward.stamps_to_next} more")
         return {
             'success': True,
             'free_coffees': 0,
-            'message': f'Customer needs {STAMPS_PER_COFFEE - (total_stamps % STAMPS_PER_COFFEE)} more stamps'
+            'message': f'Customer needs {reward.stamps_to_next} more stamps'
         }
     
     print(f"🎉 Customer has earned {free_coffees} free coffee(s)!")
@@ -80,7 +92,7 @@ def process_real_loopy_webhook(webhook_data):
         }
     
     # Process the legitimate reward
-    total_credit = free_coffees * COFFEE_VALUE_CENTS
+    total_credit = reward.value_cents
     
     print(f"💰 PROCESSING LEGITIMATE REWARD:")
     print(f"   Loopy Card: {loopy_card_id}")
@@ -124,8 +136,9 @@ def find_munch_customer_by_loopy_data(email, phone):
     print()
     
     # API Configuration
-    munch_api_key = os.getenv('MUNCH_API_KEY')
-    munch_org_id = os.getenv('MUNCH_ORG_ID')
+    config = get_config()
+    munch_api_key = config.munch_api_key
+    munch_org_id = config.munch_org_id
     munch_base_url = 'https://api.munch.cloud/api'
     
     headers = {
@@ -193,25 +206,19 @@ def validate_webhook_authenticity(webhook_data):
     
     print("🔒 VALIDATING WEBHOOK AUTHENTICITY...")
     
-    # Check required fields
-    required_fields = ['event', 'card', 'campaign']
-    for field in required_fields:
-        if field not in webhook_data:
-            print(f"❌ Invalid webhook: Missing {field}")
-            return False
-    
-    # Validate card data
-    card = webhook_data.get('card', {})
-    if not card.get('id') or not card.get('totalStampsEarned'):
-        print("❌ Invalid webhook: Missing card data")
+    # Card, customer email and a configured campaign are required by the deposit schema
+    try:
+        event = deposit_validator().validate(webhook_data)
+    except LoopySchemaError as e:
+        print(f"❌ Invalid webhook: {e}")
         return False
     
-    # Validate campaign matches our expected campaign
-    campaign = webhook_data.get('campaign', {})
-    expected_campaign = os.getenv('CAMPAIGN_ID')
+    if not event.event_type:
+        print("❌ Invalid webhook: Missing event")
+        return False
     
-    if campaign.get('id') != expected_campaign:
-        print(f"❌ Invalid webhook: Wrong campaign {campaign.get('id')}")
+    if not event.total_stamps:
+        print("❌ Invalid webhook: Missing card data")
         return False
     
     print("✅ Webhook validated")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Multi-Campaign Reconciliation Scheduler
+=======================================
+
+Reconciles every Loopy campaign of the account in parallel, for the
+nightly run.
+
+WHY:
+The search scripts reconcile the single campaign in CAMPAIGN_ID. With
+more stores, reconciling campaigns one after another no longer fits the
+nightly window.
+
+HOW IT WORKS:
+1. Campaigns come from /v1/campaigns (through the campaign cache);
+   campaigns without a reward rule are skipped and reported
+2. Campaigns run on a process pool (`--processes`); inside each process
+   a campaign is settled by backfill_loopy_cards.Backfill with its own
+   chunk threads (`--threads`)
+3. Every campaign has its own checkpoint in the run directory
+   (reconcile_runs/<run id>/, run id defaults to today's date), so a run
+   that is interrupted or crashes resumes each campaign where it
+   stopped, and campaigns already completed tonight are not read again
+4. The Munch API budget (MUNCH_RATE_LIMIT requests/s, default 10) is
+   shared fairly: each process paces its Munch requests at the budget
+   divided by the number of campaigns running at that moment, so one
+   large campaign cannot starve the others and a lone campaign gets the
+   whole budget
+5. The Munch customer directory is downloaded once and handed to every
+   process
+6. Each campaign's output goes to <campaign>.log in the run directory,
+   and one aggregated report (report.json plus a printed summary) covers
+   the whole run
+
+Duplicate payments are impossible across processes for the same reasons
+as in a single backfill: the deposit ledger and customer locks are
+host-wide SQLite files.
+
+Usage:
+    python reconcile_all_campaigns.py [--processes 4] [--threads 2] [--campaign ID ...]
+                                      [--run-id 2025-06-03] [--munch-rate 10] [--dry-run]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import requests
+
+from app_config import getenv
+from backfill_loopy_cards import DEFAULT_CHUNK_SIZE, Backfill, Checkpoint
+from reward_rules import cents_to_rands, get_rule_engine
+
+DEFAULT_PROCESSES = 4
+DEFAULT_THREADS = 2
+DEFAULT_MUNCH_RATE = 10.0
+DEFAULT_RUNS_DIR = 'reconcile_runs'
+STOP_POLL_SECONDS = 1.0
+
+
+class FairRateBudget:
+    """
+    One process's share of a request budget shared by every running campaign
+    Requests are spaced `active / rate` seconds apart, where `active` is a
+    counter of running campaigns shared by all processes
+    """
+
+    def __init__(self, rate, active):
+        self.rate = rate
+        self.active = active
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self.waited = 0.0
+        self.requests = 0
+
+    def join(self):
+        with self.active.get_lock():
+            self.active.value += 1
+
+    def leave(self):
+        with self.active.get_lock():
+            self.active.value -= 1
+
+    def acquire(self):
+        """Block until this process may send its next request"""
+
+        if not self.rate:
+            return
+        with self._lock:
+            interval = max(self.active.value, 1) / self.rate
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + interval
+            self.requests += 1
+            if delay > 0:
+                self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BudgetedSession(requests.Session):
+    """requests.Session that takes every request out of a FairRateBudget"""
+
+    def __init__(self, budget):
+        super().__init__()
+        self.budget = budget
+
+    def request(self, *args, **kwargs):
+        self.budget.acquire()
+        return super().request(*args, **kwargs)
+
+
+# Set in each pool process by _init_worker
+_budget = None
+_stop = None
+
+
+def _init_worker(active, stop, rate, directory):
+    """Pool initializer: shared counters, the stop flag and the Munch directory"""
+
+    global _budget, _stop
+    from munch_directory import set_shared_directory
+
+    # The parent decides when to stop; workers finish their chunks first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _budget = FairRateBudget(rate, active)
+    _stop = stop
+    set_shared_directory(directory)
+
+
+def _watch_stop(done, stopping):
+    """Pass the parent's stop request on to a running backfill; returns once the campaign is done"""
+
+    while not done.is_set():
+        if _stop.wait(STOP_POLL_SECONDS):
+            stopping.set()
+            return
+
+
+def campaign_slug(campaign_id):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in campaign_id)
+
+
+def reconcile_campaign_job(campaign_id, run_dir, chunk_size, threads, dry_run):
+    """Settle one campaign from its checkpoint (runs in a pool process); returns its report entry"""
+
+    from secure_munch_integration import SecureMunchIntegration
+
+    slug = campaign_slug(campaign_id)
+    log_path = os.path.join(run_dir, f'{slug}.log')
+    entry = {'campaign_id': campaign_id, 'log': log_path, 'pid': os.getpid()}
+    if _stop.is_set():
+        entry.update(status='interrupted', seconds=0)
+        return entry
+
+    started = time.monotonic()
+    requests_before, waited_before = _budget.requests, _budget.waited
+
+    _budget.join()
+    try:
+        with open(log_path, 'a') as log, redirect_stdout(log):
+            print(f"📚 {datetime.now().isoformat()} reconciling campaign {campaign_id}")
+
+            checkpoint = Checkpoint(os.path.join(run_dir, f'{slug}.checkpoint.json'), campaign_id, chunk_size)
+            checkpoint.load()
+            if checkpoint.data.get('completed'):
+                print("✅ Already completed in this run")
+                entry.update(status='completed', resumed=True, **_checkpoint_totals(checkpoint.data))
+                return entry
+
+            integration = SecureMunchIntegration(session=BudgetedSession(_budget))
+            backfill = Backfill(campaign_id, integration, checkpoint, workers=threads, dry_run=dry_run)
+
+            # Stop between chunks once the parent asks (Ctrl+C, SIGTERM)
+            done = threading.Event()
+            watcher = threading.Thread(target=_watch_stop, args=(done, backfill.stopping), daemon=True)
+            watcher.start()
+            try:
+                data = backfill.run()
+            finally:
+                done.set()
+                watcher.join()
+            if dry_run:
+                status = 'dry_run'
+            elif data.get('completed'):
+                status = 'completed'
+            else:
+                status = 'interrupted' if _stop.is_set() else 'failed'
+
+            entry.update(status=status, owed=backfill.owed, **_checkpoint_totals(data))
+            if dry_run:
+                entry.update(cards=backfill.cards, deposited=0, deposited_cents=0, failed=0)
+    except Exception as e:
+        entry.update(status='failed', error=str(e))
+    finally:
+        _budget.leave()
+        entry['seconds'] = round(time.monotonic() - started, 1)
+        entry['munch_requests'] = _budget.requests - requests_before
+        entry['munch_wait_seconds'] = round(_budget.waited - waited_before, 1)
+
+    return entry
+
+
+def _checkpoint_totals(data):
+    return {key: data.get(key, 0) for key in ('cards', 'deposited', 'deposited_cents', 'failed', 'next_offset')}
+
+
+def discover_campaigns(selected=None):
+    """(campaigns to reconcile, campaigns skipped with the reason)"""
+
+    if selected:
+        campaign_ids = list(selected)
+    else:
+        from campaign_cache import get_campaign_cache
+
+        campaign_ids = [campaign.get('id') for campaign in get_campaign_cache().all() if campaign.get('id')]
+
+    engine = get_rule_engine()
+    runnable, skipped = [], []
+    for campaign_id in campaign_ids:
+        if engine.rule_for(campaign_id) is None:
+            skipped.append({'campaign_id': campaign_id, 'status': 'skipped', 'error': 'no reward rule'})
+        else:
+            runnable.append(campaign_id)
+    return runnable, skipped
+
+
+def build_report(run_id, entries, started_at, seconds, options):
+    totals = {key: sum(entry.get(key) or 0 for entry in entries)
+              for key in ('cards', 'deposited', 'deposited_cents', 'failed', 'munch_requests')}
+    by_status = {}
+    for entry in entries:
+        by_status[entry['status']] = by_status.get(entry['status'], 0) + 1
+
+    return {
+        'run_id': run_id,
+        'started_at': started_at,
+        'finished_at': datetime.now(timezone.utc).isoformat(),
+        'seconds': round(seconds, 1),
+        'options': options,
+        'campaigns': len(entries),
+        'by_status': by_status,
+        'totals': totals,
+        'results': sorted(entries, key=lambda entry: entry['campaign_id'])
+    }
+
+
+def write_report(path, report):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def main():
+    from reconciliation import load_directory
+    from secure_munch_integration import SecureMunchIntegration
+
+    parser = argparse.ArgumentParser(description='Reconcile every Loopy campaign in parallel')
+    parser.add_argument('--campaign', action='append', help='Only this campaign (repeatable; default: all)')
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES, help='Campaigns reconciled at once')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='Chunk threads per campaign')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Cards per chunk')
+    parser.add_argument('--run-id', help="Run id; reusing one resumes that run (default: today's date)")
+    parser.add_argument('--runs-dir', default=getenv('RECONCILE_RUNS_DIR', DEFAULT_RUNS_DIR),
+                        help='Where run directories are kept')
+    parser.add_argument('--munch-rate', type=float,
+                        default=float(getenv('MUNCH_RATE_LIMIT', DEFAULT_MUNCH_RATE)),
+                        help='Munch requests per second shared by all campaigns (0 = unlimited)')
+    parser.add_argument('--dry-run', action='store_true', help='Reconcile and report without depositing')
+    args = parser.parse_args()
+
+    run_id = args.run_id or datetime.now().strftime('%Y-%m-%d')
+    run_dir = os.path.join(args.runs_dir, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    print("🌙 MULTI-CAMPAIGN RECONCILIATION")
+    print("=" * 60)
+
+    campaigns, skipped = discover_campaigns(args.campaign)
+    print(f"🎯 {len(campaigns)} campaign(s) to reconcile, {len(skipped)} skipped (run {run_id})")
+    for entry in skipped:
+        print(f"   ⏭️ {entry['campaign_id']}: {entry['error']}")
+    if not campaigns:
+        return
+
+    # One directory download for the whole run, through the same budget
+    active = multiprocessing.Value('i', 0)
+    stop = multiprocessing.Event()
+    try:
+        directory = load_directory(SecureMunchIntegration(session=BudgetedSession(
+            FairRateBudget(args.munch_rate, active))))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if directory is None:
+        print("❌ Could not download the Munch customer directory")
+        return
+
+    def request_stop(signum, frame):
+        print("\n🛑 Stopping after the chunks in progress (checkpoints are kept)...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.monotonic()
+    entries = list(skipped)
+
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker,
+                             initargs=(active, stop, args.munch_rate, directory)) as pool:
+        futures = {
+            pool.submit(reconcile_campaign_job, campaign_id, run_dir, args.chunk_size, args.threads, args.dry_run):
+                campaign_id
+            for campaign_id in campaigns
+        }
+        for future in as_completed(futures):
+            campaign_id = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                # The worker process itself died
+                entry = {'campaign_id': campaign_id, 'status': 'failed', 'error': str(e)}
+            entries.append(entry)
+
+            icon = {'completed': '✅', 'dry_run': '🔍', 'interrupted': '🛑'}.get(entry['status'], '❌')
+            print(f"   {icon} {campaign_id}: {entry['status']}, {entry.get('cards', 0)} cards, "
+                  f"deposited {entry.get('deposited', 0)} (R{cents_to_rands(entry.get('deposited_cents', 0))}), "
+                  f"{entry.get('seconds', 0)}s" + (f" - {entry['error']}" if entry.get('error') else ''))
+
+    options = {'processes': args.processes, 'threads': args.threads, 'chunk_size': args.chunk_size,
+               'munch_rate': args.munch_rate, 'dry_run': args.dry_run}
+    report = build_report(run_id, entries, started_at, time.monotonic() - started, options)
+    report_path = os.path.join(run_dir, 'report.json')
+    write_report(report_path, report)
+
+    totals = report['totals']
+    print()
+    print(f"📊 {report['campaigns']} campaign(s) in {report['seconds']}s: "
+          + ', '.join(f"{count} {status}" for status, count in sorted(report['by_status'].items())))
+    print(f"   Cards: {totals['cards']}, deposited: {totals['deposited']} "
+          f"(R{cents_to_rands(totals['deposited_cents'])}), failed deposits: {totals['failed']}")
+    print(f"   Munch requests: {totals['munch_requests']} at {args.munch_rate}/s shared")
+    print(f"📝 Report: {report_path}")
+    if any(entry['status'] in ('failed', 'interrupted') for entry in entries):
+        print(f"↩️ Run again with --run-id {run_id} to resume")
+
+
+if __name__ == "__main__":
+    main()
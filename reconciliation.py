@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Loopy / Munch Reconciliation
+============================
+
+Works out exactly which rewards are still owed, in one pass.
+
+WHY:
+The search_loopy_* scripts each fetched cards, filtered them in their
+own loops and deposited one card at a time - passing the Loopy card id
+as the Munch user id, and paying every completed card in full however
+often it had been paid before.
+
+HOW IT WORKS (a hash join on normalized email):
+1. Each card's email is normalized by the same schema the webhooks use,
+   and cards with nothing earned are dropped before the join
+2. The smaller side is the build side. A loaded Munch directory is
+   already an in-memory dict keyed by lower-cased email (shared with the
+   webhook path), so the cards are streamed (loopy_cards) and probe it.
+   Given the raw Munch customer list instead, a card list shorter than
+   it is hashed by email and the customers are streamed past it;
+   otherwise the directory is built and probed as above
+3. Matched cards are probed against the deposit ledger in batches
+   (one indexed SQL query per batch), giving what was already credited
+4. owed = earned (campaign reward rule) - credited; only cards with
+   something owed are yielded
+
+Memory is the smaller side plus one batch of cards, whatever the
+campaign size. With from_store the cards are read from the local
+card-state store (kept current by webhooks) instead of the Loopy API.
+settle() deposits an owed reward to the matched Munch customer under
+the customer lock and records it in the ledger.
+
+Usage:
+    python reconciliation.py [campaign_id] [--deposit] [--limit N] [--from-store]
+"""
+
+from customer_lock import CustomerLockTimeout
+from deposit_ledger import NOT_PERSISTENT_ERROR, DepositLedger
+from loopy_schema import LoopySchemaError, webhook_validator
+from munch_directory import (EMAIL, FIRST_NAME, ID, LAST_NAME, MunchDirectory, get_shared_directory, index_entry,
+                             set_shared_directory)
+from reward_rules import cents_to_rands, get_rule_engine
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class OwedReward:
+    """A card whose earned rewards exceed what was credited"""
+
+    __slots__ = ('card_id', 'campaign_id', 'email', 'customer_id', 'customer_name',
+                 'earned_rewards', 'earned_cents', 'credited_rewards', 'credited_cents')
+
+    def __init__(self, card_id, campaign_id, email, customer_id, customer_name,
+                 earned_rewards, earned_cents, credited_rewards, credited_cents):
+        self.card_id = card_id
+        self.campaign_id = campaign_id
+        self.email = email
+        self.customer_id = customer_id
+        self.customer_name = customer_name
+        self.earned_rewards = earned_rewards
+        self.earned_cents = earned_cents
+        self.credited_rewards = credited_rewards
+        self.credited_cents = credited_cents
+
+    @property
+    def owed_rewards(self):
+        return self.earned_rewards - self.credited_rewards
+
+    @property
+    def owed_cents(self):
+        return self.earned_cents - self.credited_cents
+
+    def to_dict(self):
+        return {
+            'card_id': self.card_id,
+            'campaign_id': self.campaign_id,
+            'email': self.email,
+            'customer_id': self.customer_id,
+            'customer_name': self.customer_name,
+            'earned_rewards': self.earned_rewards,
+            'credited_rewards': self.credited_rewards,
+            'owed_rewards': self.owed_rewards,
+            'owed_amount': cents_to_rands(self.owed_cents)
+        }
+
+    def __repr__(self):
+        return f"OwedReward({self.card_id} -> {self.email}: {self.owed_rewards} x R{cents_to_rands(self.owed_cents)})"
+
+
+class Reconciler:
+    """
+    Joins cards with the Munch customers and the deposit ledger
+    directory: a loaded MunchDirectory, or the raw Munch customer list
+    """
+
+    def __init__(self, directory, ledger=None, engine=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.directory = directory
+        self.ledger = ledger or DepositLedger()
+        self.engine = engine or get_rule_engine()
+        self.batch_size = batch_size
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'cards': 0,
+            'invalid': 0,
+            'no_rule': 0,
+            'nothing_earned': 0,
+            'no_email': 0,
+            'unmatched': 0,
+            'settled': 0,
+            'owed': 0,
+            'owed_rewards': 0,
+            'owed_cents': 0
+        }
+
+    def reconcile(self, cards, campaign_id=None):
+        """Yield an OwedReward for every card with rewards still owed"""
+
+        self.stats = self._empty_stats()
+        earning = self._earning(cards, campaign_id)
+
+        if isinstance(self.directory, MunchDirectory):
+            matches = self._probe_directory(earning)
+        elif hasattr(cards, '__len__') and len(cards) < len(self.directory):
+            matches = self._probe_users(earning)
+        else:
+            self.directory = MunchDirectory.from_users(self.directory)
+            matches = self._probe_directory(earning)
+
+        batch = []
+        for match in matches:
+            batch.append(match)
+            if len(batch) >= self.batch_size:
+                yield from self._probe_ledger(batch)
+                batch = []
+
+        if batch:
+            yield from self._probe_ledger(batch)
+
+    def _earning(self, cards, campaign_id):
+        """(event, reward) for every valid card that has earned something and has an email"""
+
+        validator = webhook_validator()
+        campaign = {'id': campaign_id} if campaign_id else None
+
+        for card in cards:
+            self.stats['cards'] += 1
+            try:
+                event = validator.validate({'card': card, 'campaign': campaign})
+            except LoopySchemaError:
+                self.stats['invalid'] += 1
+                continue
+
+            reward = self.engine.evaluate(event.campaign_id, event.total_stamps)
+            if reward is None:
+                self.stats['no_rule'] += 1
+                continue
+            if reward.rewards < 1:
+                self.stats['nothing_earned'] += 1
+                continue
+            if not event.email or not event.card_id:
+                self.stats['no_email'] += 1
+                continue
+
+            yield event, reward
+
+    def _probe_directory(self, earning):
+        """Build side = the loaded directory; the cards stream past it"""
+
+        by_email = self.directory.by_email
+        for event, reward in earning:
+            customer = by_email.get(event.email)
+            if customer is None:
+                self.stats['unmatched'] += 1
+                continue
+            yield event, reward, customer
+
+    def _probe_users(self, earning):
+        """Build side = the cards (by email); the raw customer list streams past them"""
+
+        by_email = {}
+        for event, reward in earning:
+            by_email.setdefault(event.email, []).append((event, reward))
+
+        for user in self.directory:
+            if not by_email:
+                break
+            entry = index_entry(user)
+            # The first customer with an email wins, as in MunchDirectory.from_users
+            matched = by_email.pop(entry[EMAIL], None) if entry is not None else None
+            for event, reward in matched or ():
+                yield event, reward, entry
+
+        self.stats['unmatched'] += sum(len(matched) for matched in by_email.values())
+
+    def _probe_ledger(self, batch):
+        credited = self.ledger.credited_many(event.card_id for event, _, _ in batch)
+        for event, reward, customer in batch:
+            credited_rewards, credited_cents = credited.get(event.card_id, (0, 0))
+            owed = OwedReward(
+                event.card_id, reward.campaign_id, event.email, customer[ID],
+                f"{customer[FIRST_NAME]} {customer[LAST_NAME]}".strip(),
+                reward.rewards, reward.value_cents, credited_rewards, credited_cents
+            )
+            if owed.owed_cents <= 0:
+                self.stats['settled'] += 1
+                continue
+
+            self.stats['owed'] += 1
+            self.stats['owed_rewards'] += owed.owed_rewards
+            self.stats['owed_cents'] += owed.owed_cents
+            yield owed
+
+    def settle(self, owed, integration):
+        """
+        Deposit an owed reward through a SecureMunchIntegration
+        The ledger is re-read under the customer lock so a concurrent
+        webhook deposit is never paid twice, and the deposit is claimed
+        in the ledger first so a run that crashes mid-deposit is not
+        paid again when it resumes (SecureMunchIntegration.deposit_owed)
+        A customer whose lock cannot be had is a failure for this card only
+        """
+
+        try:
+            with integration.customer_lock.hold(owed.email):
+                return integration.deposit_owed(owed.customer_id, owed.email, owed.card_id, owed.campaign_id,
+                                                owed.earned_rewards, owed.earned_cents)
+        except CustomerLockTimeout as e:
+            print(f"❌ {owed.card_id}: {e}")
+            return {
+                'success': False,
+                'error': f'Customer busy, deposit not attempted: {e}'
+            }
+
+
+def load_directory(integration):
+    """The shared Munch directory, downloading it if none is loaded"""
+
+    directory = get_shared_directory()
+    if directory is None:
+        directory = MunchDirectory.download(integration)
+        if directory is not None:
+            set_shared_directory(directory)
+    return directory
+
+
+def reconcile_campaign(campaign_id=None, deposit=False, limit=None, integration=None, cards=None,
+                       from_store=False, on_owed=None):
+    """
+    Reconcile one campaign and optionally pay what is owed
+    from_store reads the cards from the card-state store instead of Loopy
+    Each owed reward is settled as it is found and handed to
+    on_owed(owed, result) (result is None when nothing was deposited);
+    none are kept, so memory does not grow with the campaign
+    Returns a summary dict (errors are reported as {'success': False, ...})
+    """
+
+    from loopy_cards import LoopyPageError, iter_campaign_cards
+    from secure_munch_integration import SecureMunchIntegration
+
+    try:
+        integration = integration or SecureMunchIntegration()
+    except ValueError as e:
+        return {'success': False, 'error': str(e)}
+
+    if deposit and not integration.ledger.persistent:
+        return {'success': False, 'error': NOT_PERSISTENT_ERROR}
+
+    # A short card list is joined against the raw customer list rather than a full directory
+    directory = get_shared_directory()
+    if directory is None and isinstance(cards, (list, tuple)):
+        directory = integration.fetch_users()
+    elif directory is None:
+        directory = load_directory(integration)
+    if directory is None:
+        return {'success': False, 'error': 'Could not download the Munch customer directory'}
+
+    pager = None
+    if cards is None and from_store:
+        from app_config import get_config
+        from card_state_store import get_card_state_store
+
+        campaign_id = campaign_id or get_config().campaign_id
+        cards = (state.to_card() for state in get_card_state_store().iter_campaign(campaign_id))
+    elif cards is None:
+        pager = iter_campaign_cards(campaign_id)
+        campaign_id = pager.campaign_id
+        cards = pager
+
+    reconciler = Reconciler(directory, ledger=integration.ledger)
+    deposited = failed = 0
+
+    try:
+        for owed in reconciler.reconcile(cards, campaign_id):
+            result = None
+            if deposit and (limit is None or deposited + failed < limit):
+                result = reconciler.settle(owed, integration)
+                if result['success']:
+                    deposited += 1
+                elif not result.get('already_credited'):
+                    failed += 1
+            if on_owed is not None:
+                on_owed(owed, result)
+    except LoopyPageError as e:
+        return {'success': False, 'error': str(e), 'stats': reconciler.stats}
+
+    return {
+        'success': True,
+        'campaign_id': campaign_id,
+        'stats': reconciler.stats,
+        'deposited': deposited,
+        'failed': failed,
+        'loopy': pager.stats() if pager else None,
+        'source': 'store' if from_store else 'loopy'
+    }
+
+
+def deposit_owed_rewards(campaign_id=None, cards=None):
+    """
+    Reconcile a campaign, deposit everything still owed and print a summary
+    (what the search scripts use instead of paying each card they found)
+    cards lets a script that already streams the campaign settle it in the same pass
+    """
+
+    print(f"\n💰 RECONCILING AND DEPOSITING OWED REWARDS...")
+    print("-" * 40)
+
+    result = reconcile_campaign(campaign_id, deposit=True, cards=cards)
+    if not result['success']:
+        print(f"❌ Reconciliation failed: {result['error']}")
+        return result
+
+    stats = result['stats']
+    print(f"\n📊 PROCESSING SUMMARY:")
+    print(f"✅ Deposited: {result['deposited']}/{stats['owed']} owed reward(s) "
+          f"(R{cents_to_rands(stats['owed_cents'])} owed)")
+    print(f"❌ Failed: {result['failed']}")
+    print(f"ℹ️ Already settled: {stats['settled']}, not in Munch: {stats['unmatched']}")
+    return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reconcile Loopy cards against Munch credits')
+    parser.add_argument('campaign_id', nargs='?', help='Campaign id (default: CAMPAIGN_ID)')
+    parser.add_argument('--deposit', action='store_true', help='Deposit what is owed (default: report only)')
+    parser.add_argument('--limit', type=int, default=None, help='Deposit at most N rewards')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read cards from the local card-state store instead of the Loopy API')
+    args = parser.parse_args()
+
+    print("🔄 LOOPY / MUNCH RECONCILIATION")
+    print("=" * 60)
+
+    def report(owed, _result):
+        print(f"   💰 {owed.card_id} -> {owed.customer_name} <{owed.email}>: "
+              f"{owed.owed_rewards} reward(s), R{cents_to_rands(owed.owed_cents)}")
+
+    result = reconcile_campaign(args.campaign_id, deposit=args.deposit, limit=args.limit,
+                                from_store=args.from_store, on_owed=report)
+    if not result['success']:
+        print(f"❌ {result['error']}")
+        return
+
+    stats = result['stats']
+
+    print()
+    print(f"📊 Campaign {result['campaign_id']}: {stats['cards']} cards (from {result['source']})")
+    print(f"   Owed: {stats['owed']} card(s), {stats['owed_rewards']} reward(s), "
+          f"R{cents_to_rands(stats['owed_cents'])}")
+    print(f"   Already settled: {stats['settled']}, nothing earned: {stats['nothing_earned']}")
+    print(f"   Not in Munch: {stats['unmatched']}, no email: {stats['no_email']}, "
+          f"invalid: {stats['invalid']}, no rule: {stats['no_rule']}")
+    if args.deposit:
+        print(f"   ✅ Deposited: {result['deposited']}, ❌ failed: {result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
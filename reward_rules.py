@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Reward Rules
+============
+
+Per-campaign reward rules, compiled once at startup.
+
+WHY:
+The 12-stamps-per-R40-coffee rule was hard-coded in several places and
+only one CAMPAIGN_ID was accepted. Campaigns now differ in thresholds
+and can have several reward tiers.
+
+HOW IT WORKS:
+1. Rules come from REWARD_RULES_FILE (default reward_rules.json next to
+   this file) or, without a file, from CAMPAIGN_ID (comma-separated) with
+   the classic 12 stamps = R40 rule, named after the campaign in the
+   local campaign cache (campaign_cache; read from disk, never fetched)
+2. Each rule repeats every `stamps_per_cycle` stamps; a tier pays out
+   when the stamps within the cycle reach its threshold
+3. Compiling a rule precomputes, for every position in the cycle, the
+   rewards and cents earned so far and the stamps to the next reward,
+   so evaluating a card is one dict lookup plus one table index
+
+RULES FILE:
+{
+  "default_campaign": "<campaign id>",
+  "campaigns": {
+    "<campaign id>": {
+      "name": "Coffee card",
+      "stamps_per_cycle": 12,
+      "tiers": [{"stamps": 12, "value_cents": 4000, "label": "free coffee"}]
+    }
+  }
+}
+"""
+
+import json
+import os
+
+from app_config import get_config, getenv
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The original Bird coffee rule
+STAMPS_PER_COFFEE = 12
+COFFEE_VALUE_CENTS = 4000  # R40
+
+
+def cents_to_rands(cents):
+    """Whole rands as an int (R40 -> 40), otherwise a float"""
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+class Reward:
+    """What a card has earned under one rule"""
+
+    __slots__ = ('campaign_id', 'total_stamps', 'rewards', 'value_cents', 'stamps_to_next', 'label')
+
+    def __init__(self, campaign_id, total_stamps, rewards, value_cents, stamps_to_next, label):
+        self.campaign_id = campaign_id
+        self.total_stamps = total_stamps
+        self.rewards = rewards
+        self.value_cents = value_cents
+        self.stamps_to_next = stamps_to_next
+        self.label = label
+
+    @property
+    def value_rands(self):
+        return cents_to_rands(self.value_cents)
+
+    def __repr__(self):
+        return f"Reward({self.rewards} x {self.label}, R{self.value_rands}, {self.stamps_to_next} to next)"
+
+
+class CompiledRule:
+    """One campaign's rule with its precomputed stamps-to-reward table"""
+
+    __slots__ = ('campaign_id', 'name', 'stamps_per_cycle', 'tiers', 'label',
+                 'cycle_rewards', 'cycle_cents', 'table')
+
+    def __init__(self, campaign_id, name, stamps_per_cycle, tiers):
+        if not isinstance(stamps_per_cycle, int) or stamps_per_cycle < 1:
+            raise ValueError(f"Campaign {campaign_id}: stamps_per_cycle must be a positive integer")
+        if not tiers:
+            raise ValueError(f"Campaign {campaign_id}: at least one reward tier is required")
+
+        parsed = []
+        for tier in tiers:
+            stamps = tier.get('stamps')
+            value_cents = tier.get('value_cents')
+            if not isinstance(stamps, int) or not 1 <= stamps <= stamps_per_cycle:
+                raise ValueError(f"Campaign {campaign_id}: tier stamps must be between 1 and {stamps_per_cycle}")
+            if not isinstance(value_cents, int) or value_cents < 0:
+                raise ValueError(f"Campaign {campaign_id}: tier value_cents must be a non-negative integer")
+            parsed.append((stamps, value_cents, tier.get('label') or 'reward'))
+        parsed.sort()
+
+        self.campaign_id = campaign_id
+        self.name = name or campaign_id or 'Coffee card'
+        self.stamps_per_cycle = stamps_per_cycle
+        self.tiers = tuple(parsed)
+        self.label = parsed[-1][2]
+        self.cycle_rewards = len(parsed)
+        self.cycle_cents = sum(value for _, value, _ in parsed)
+
+        # table[position in cycle] = (rewards so far, cents so far, stamps to next reward)
+        table = []
+        for position in range(stamps_per_cycle):
+            unlocked = [tier for tier in parsed if tier[0] <= position]
+            upcoming = [tier[0] for tier in parsed if tier[0] > position]
+            stamps_to_next = (upcoming[0] if upcoming else stamps_per_cycle + parsed[0][0]) - position
+            table.append((len(unlocked), sum(tier[1] for tier in unlocked), stamps_to_next))
+        self.table = tuple(table)
+
+    def evaluate(self, total_stamps):
+        """Rewards earned by a card's lifetime stamp count"""
+
+        if total_stamps is None or total_stamps < 0:
+            total_stamps = 0
+
+        cycles, position = divmod(total_stamps, self.stamps_per_cycle)
+        rewards, cents, stamps_to_next = self.table[position]
+
+        return Reward(
+            self.campaign_id,
+            total_stamps,
+            cycles * self.cycle_rewards + rewards,
+            cycles * self.cycle_cents + cents,
+            stamps_to_next,
+            self.label
+        )
+
+    def to_dict(self):
+        return {
+            'campaign_id': self.campaign_id,
+            'name': self.name,
+            'stamps_per_cycle': self.stamps_per_cycle,
+            'tiers': [{'stamps': s, 'value_cents': v, 'label': l} for s, v, l in self.tiers]
+        }
+
+
+class RuleEngine:
+    """Campaign id -> compiled rule"""
+
+    def __init__(self, rules, default_campaign=None):
+        self.rules = {rule.campaign_id: rule for rule in rules}
+        if default_campaign is None and len(self.rules) == 1:
+            default_campaign = next(iter(self.rules))
+        if default_campaign is not None and default_campaign not in self.rules:
+            raise ValueError(f"Default campaign {default_campaign} has no rule")
+        self.default_campaign = default_campaign
+        self.default_rule = self.rules.get(default_campaign)
+
+    @property
+    def campaign_ids(self):
+        """Configured campaigns"""
+        return list(self.rules)
+
+    def rule_for(self, campaign_id=None):
+        """
+        Rule for a campaign; events without a campaign use the default rule
+        Returns None for a campaign that is not configured (nothing is paid)
+        """
+
+        if campaign_id is None:
+            return self.default_rule
+        return self.rules.get(campaign_id)
+
+    def evaluate(self, campaign_id, total_stamps):
+        """Reward for a card, or None if the campaign has no rule"""
+
+        rule = self.rule_for(campaign_id)
+        return rule.evaluate(total_stamps) if rule else None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the parsed rules-file structure"""
+
+        campaigns = config.get('campaigns') or {}
+        if not isinstance(campaigns, dict) or not campaigns:
+            raise ValueError("Reward rules need a non-empty 'campaigns' object")
+
+        rules = [
+            CompiledRule(
+                campaign_id,
+                rule.get('name'),
+                rule.get('stamps_per_cycle', STAMPS_PER_COFFEE),
+                rule.get('tiers') or [{'stamps': rule.get('stamps_per_cycle', STAMPS_PER_COFFEE),
+                                       'value_cents': COFFEE_VALUE_CENTS, 'label': 'free coffee'}]
+            )
+            for campaign_id, rule in campaigns.items()
+        ]
+        return cls(rules, config.get('default_campaign'))
+
+    @classmethod
+    def from_env(cls):
+        """Classic coffee rule for every campaign listed in CAMPAIGN_ID (no rules without one)"""
+
+        campaign_ids = list(get_config().campaign_ids)
+        if not campaign_ids:
+            return cls([])
+
+        tiers = [{'stamps': STAMPS_PER_COFFEE, 'value_cents': COFFEE_VALUE_CENTS, 'label': 'free coffee'}]
+        from campaign_cache import get_campaign_cache
+
+        cache = get_campaign_cache()
+        return cls([CompiledRule(c, (cache.peek(c) or {}).get('name') or 'Coffee card', STAMPS_PER_COFFEE, tiers)
+                    for c in campaign_ids],
+                   default_campaign=campaign_ids[0])
+
+
+def rules_path():
+    """Rules file location (REWARD_RULES_FILE or reward_rules.json next to this file)"""
+    return getenv('REWARD_RULES_FILE') or os.path.join(ROOT_DIR, 'reward_rules.json')
+
+
+def load_rules(path=None):
+    """Load rules from a JSON file if one exists, otherwise from the environment"""
+
+    path = path or rules_path()
+    if os.path.isfile(path):
+        with open(path) as f:
+            return RuleEngine.from_config(json.load(f))
+    return RuleEngine.from_env()
+
+
+_engine = None
+
+
+def get_rule_engine():
+    """The process-wide rule engine, loaded on first use"""
+
+    global _engine
+    if _engine is None:
+        _engine = load_rules()
+    return _engine
+
+
+def set_rule_engine(engine):
+    """Install a rule engine (e.g. after reloading the rules file)"""
+
+    global _engine
+    _engine = engine
@@ -6,55 +6,30 @@ Search Loopy Rewards - Final Version
 Using the correct Loopy Loyalty API v1 with proper JWT authentication.
 """
 
-import os
-import requests
-import json
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from datetime import datetime
+from app_config import get_config
+from reconciliation import deposit_owed_rewards
+from reward_rules import get_rule_engine
+from loopy_card_details import fetch_card_details
+from loopy_cards import iter_campaign_cards
+from loopy_discovery import discover_endpoints, print_capabilities
+from loopy_token_cache import get_token_cache
 
-load_dotenv('production.env')
 
 def get_loopy_jwt_token():
-    """Get JWT token from Loopy Loyalty API"""
+    """Get JWT token from Loopy Loyalty API (cached between calls)"""
     
-    loopy_username = os.getenv('LOOPY_USERNAME')
-    loopy_api_secret = os.getenv('LOOPY_API_SECRET')  # This is the correct password
+    cache = get_token_cache()
+    logins_before = cache.logins
+    token = cache.get_token()
     
-    login_url = 'https://api.loopyloyalty.com/v1/account/login'
+    if token:
+        print(f"✅ Authentication successful ({'logged in' if cache.logins > logins_before else 'cached token'})")
+        print(f"🔑 Token: {token[:20]}...")
+        return token
     
-    login_data = {
-        'username': loopy_username,
-        'password': loopy_api_secret  # API secret is the correct password
-    }
-    
-    try:
-        response = requests.post(
-            login_url,
-            json=login_data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        print(f"🔐 Login attempt: {response.status_code}")
-        
-        if response.status_code == 200:
-            auth_data = response.json()
-            token = auth_data.get('token')
-            if token:
-                print(f"✅ Authentication successful")
-                print(f"🔑 Token: {token[:20]}...")
-                return token
-            else:
-                print(f"❌ No token in response: {auth_data}")
-                return None
-        else:
-            print(f"❌ Login failed: {response.status_code}")
-            print(f"📄 Response: {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"❌ Login error: {e}")
-        return None
+    print(f"❌ Login failed: {cache.last_error}")
+    return None
 
 def search_loopy_rewards_final():
     """Search for Loopy rewards using correct API v1"""
@@ -75,18 +50,13 @@ def search_loopy_rewards_final():
     
     # API Configuration
     base_url = 'https://api.loopyloyalty.com/v1'
-    campaign_id = os.getenv('CAMPAIGN_ID')
-    
-    headers = {
-        'Authorization': jwt_token,
-        'Content-Type': 'application/json'
-    }
+    campaign_id = get_config().campaign_id
     
     print(f"\n🎯 Campaign ID: {campaign_id}")
     print(f"🔗 Base URL: {base_url}")
     print()
     
-    found_rewards = []
+    completed_ids = []
     
     try:
         # Step 2: Search for cards in the campaign
@@ -97,199 +67,76 @@ def search_loopy_rewards_final():
         
         # Method 1: Try to get campaign information
         campaign_endpoints = [
-            f'/campaigns/{campaign_id}',
-            f'/campaign/{campaign_id}',
-            f'/enrol/{campaign_id}'  # This is mentioned in docs
+            '/campaigns/{campaign_id}',
+            '/campaign/{campaign_id}',
+            '/enrol/{campaign_id}'  # This is mentioned in docs
         ]
         
-        for endpoint in campaign_endpoints:
-            try:
-                url = f'{base_url}{endpoint}'
-                response = requests.get(url, headers=headers, timeout=10)
-                
-                print(f"   📡 {endpoint}: {response.status_code}")
-                
-                if response.status_code == 200:
-                    print(f"      ✅ SUCCESS!")
-                    try:
-                        data = response.json()
-                        print(f"      📋 Keys: {list(data.keys()) if isinstance(data, dict) else 'List'}")
-                    except:
-                        print(f"      📄 Response length: {len(response.text)}")
-                        
-            except Exception as e:
-                print(f"      ❌ Error: {e}")
+        discovery, capabilities = discover_endpoints(campaign_endpoints, campaign_id)
+        print_capabilities(capabilities, discovery)
         
-        # Step 3: Try to search for recent cards/activity
-        print(f"\n🔍 Step 3: Searching for recent card activity...")
+        # Step 3: Stream every card of the campaign (all pages, not just the first)
+        # and settle what is owed in the same pass; only completed card ids are kept
+        print(f"\n🔍 Step 3: Scanning all campaign cards...")
         
-        # Calculate date range for today
-        today = datetime.now().date()
-        today_start = datetime.combine(today, datetime.min.time())
+        rule = get_rule_engine().rule_for(campaign_id)
+        if rule is None:
+            print(f"   ❌ No reward rule configured for campaign {campaign_id}")
+            return []
         
-        # Try different search approaches
-        search_endpoints = [
-            '/cards',
-            '/card',
-            f'/cards?campaign={campaign_id}',
-            '/activity',
-            '/transactions',
-            '/stamps'
-        ]
+        pager = iter_campaign_cards(campaign_id)
         
-        for endpoint in search_endpoints:
-            try:
-                url = f'{base_url}{endpoint}'
-                
-                # Try with and without parameters
-                params_options = [
-                    {},
-                    {'campaign': campaign_id},
-                    {'campaignId': campaign_id},
-                    {'date': today_start.strftime('%Y-%m-%d')},
-                    {'limit': 100}
-                ]
+        def scan(cards):
+            for item in cards:
+                stamps = item.get('totalStampsEarned', 0)
+                card_id = item.get('id')
+                reward = rule.evaluate(stamps)
                 
-                for params in params_options[:2]:  # Test first 2 param combinations
-                    try:
-                        response = requests.get(url, headers=headers, params=params, timeout=10)
-                        
-                        print(f"   📡 {endpoint} {params}: {response.status_code}")
-                        
-                        if response.status_code == 200:
-                            try:
-                                data = response.json()
-                                print(f"      ✅ SUCCESS! Data type: {type(data)}")
-                                
-                                if isinstance(data, list):
-                                    print(f"      📊 Found {len(data)} items")
-                                    
-                                    # Look for cards with 12+ stamps (completed)
-                                    for item in data:
-                                        stamps = item.get('totalStampsEarned', 0)
-                                        card_id = item.get('id')
-                                        
-                                        if stamps >= 12:
-                                            print(f"      🎉 COMPLETED CARD: {card_id} ({stamps} stamps)")
-                                            
-                                            found_rewards.append({
-                                                'customer_id': card_id,
-                                                'stamps': stamps,
-                                                'reward_type': 'Free Coffee',
-                                                'amount': 4000,  # R40
-                                                'earned_at': datetime.now().isoformat(),
-                                                'status': 'earned',
-                                                'source': 'loopy_card_search'
-                                            })
-                                
-                                elif isinstance(data, dict):
-                                    print(f"      📋 Dict keys: {list(data.keys())}")
-                                    
-                                # Don't continue testing if we found something
-                                if data:
-                                    break
-                                    
-                            except json.JSONDecodeError:
-                                print(f"      📄 Non-JSON response")
-                        
-                        elif response.status_code == 401:
-                            print(f"      🔒 Authentication required")
-                        elif response.status_code == 404:
-                            print(f"      ❌ Not found")
-                            
-                    except Exception as e:
-                        continue
-                        
-            except Exception as e:
-                print(f"   ❌ Error testing {endpoint}: {e}")
+                if reward.rewards:
+                    print(f"      🎉 COMPLETED CARD: {card_id} ({stamps} stamps, {reward})")
+                    completed_ids.append(card_id)
+                yield item
         
-        # Step 4: Manual card lookup if we have specific card IDs
-        print(f"\n🔍 Step 4: Testing card lookup endpoints...")
+        # Cards are matched to Munch customers by email and only rewards not
+        # yet credited are paid (never the Loopy card id as a Munch user id)
+        deposit_owed_rewards(campaign_id, cards=scan(pager))
         
-        # Test card lookup format from documentation
-        test_card_ids = ['test', 'sample']  # We'd need real card IDs
+        stats = pager.stats()
+        print(f"   📊 {stats['rows']} cards in {stats['pages']} pages ({stats['pages_per_second']} pages/s)")
         
-        for card_id in test_card_ids:
-            try:
-                card_url = f'{base_url}/card/{card_id}?includeEvents=true'
-                response = requests.get(card_url, headers=headers, timeout=5)
-                
-                print(f"   📡 /card/{card_id}: {response.status_code}")
-                
-                if response.status_code == 200:
-                    print(f"      ✅ Card API working!")
-                    break
-                elif response.status_code == 404:
-                    print(f"      ℹ️ Card not found (expected)")
-                    
-            except Exception as e:
-                continue
+        # Step 4: Event history of the completed cards (batched, cached locally)
+        print(f"\n🔍 Step 4: Fetching event history for completed cards...")
+        
+        for detail in fetch_card_details(completed_ids):
+            if detail.ok:
+                print(f"   📡 /card/{detail.card_id}: {len(detail.events)} events [{detail.source}]")
+            else:
+                print(f"   ❌ /card/{detail.card_id}: {detail.error}")
         
-        return found_rewards
+        return completed_ids
         
     except Exception as e:
         print(f"❌ Error in search: {e}")
         return []
 
-def process_found_rewards(rewards):
-    """Process any found rewards to Munch"""
+def process_found_rewards(completed_ids):
+    """Report the completed cards found (owed rewards were settled during the scan)"""
     
-    if not rewards:
+    if not completed_ids:
         print(f"\n📊 SEARCH COMPLETE")
         print("=" * 30)
         print("ℹ️ No completed loyalty cards found today")
         print("💡 This could mean:")
-        print("   - No customers completed 12-stamp cards today")
+        print("   - No customers completed a card today")
         print("   - Cards were already processed")
         print("   - Need different search parameters")
         return
     
-    print(f"\n🎉 FOUND {len(rewards)} COMPLETED LOYALTY CARDS!")
+    print(f"\n🎉 FOUND {len(completed_ids)} COMPLETED LOYALTY CARDS!")
     print("=" * 50)
     
-    for i, reward in enumerate(rewards):
-        print(f"\n   🎯 Reward {i+1}:")
-        print(f"      Card/Customer: {reward['customer_id']}")
-        print(f"      Stamps: {reward['stamps']}")
-        print(f"      Value: R{reward['amount']/100}")
-        print(f"      Status: {reward['status']}")
-    
-    # Try to process to Munch
-    try:
-        from munch_loyalty_integration_final import deposit_loyalty_reward
-        
-        print(f"\n💰 PROCESSING TO MUNCH...")
-        print("-" * 30)
-        
-        successful = 0
-        
-        for reward in rewards:
-            customer_id = reward['customer_id']
-            amount = reward['amount']
-            
-            print(f"💳 Processing {customer_id}...")
-            
-            result = deposit_loyalty_reward(
-                customer_user_id=customer_id,
-                amount_in_cents=amount,
-                description=f"Loopy loyalty reward - {reward['stamps']} stamps completed"
-            )
-            
-            if result['success']:
-                print(f"   ✅ SUCCESS! R{result['amount_deposited']} deposited")
-                successful += 1
-            else:
-                print(f"   ❌ FAILED: {result['error']}")
-        
-        print(f"\n📊 PROCESSING SUMMARY:")
-        print(f"✅ Successful: {successful}/{len(rewards)}")
-        
-        if successful > 0:
-            print(f"🎉 {successful} customers now have FREE coffee credits!")
-            
-    except ImportError:
-        print(f"\n⚠️ Munch integration not available for auto-processing")
-        print(f"💡 Rewards found can be manually processed")
+    for i, card_id in enumerate(completed_ids):
+        print(f"   🎯 Reward {i+1}: card {card_id}")
 
 def main():
     """Main function"""
@@ -299,11 +146,11 @@ def main():
     print("🎯 Using correct Loopy Loyalty API v1 with JWT authentication")
     print()
     
-    # Search for rewards
-    rewards = search_loopy_rewards_final()
+    # Search for rewards (owed rewards are settled during the search)
+    completed_ids = search_loopy_rewards_final()
     
-    # Process any found rewards
-    process_found_rewards(rewards)
+    # Report any found rewards
+    process_found_rewards(completed_ids)
     
     print(f"\n🏁 SEARCH COMPLETE")
     print("=" * 20)
@@ -6,13 +6,59 @@ Search Loopy Rewards - Improved Version
 Improved version with better error handling and authentication.
 """
 
-import os
 import requests
 import json
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from app_config import get_config
+from deposit_ledger import NOT_PERSISTENT_ERROR
+from reconciliation import Reconciler, load_directory
+from reward_rules import get_rule_engine
+from loopy_discovery import EndpointDiscovery, print_capabilities
+from loopy_sync import IncrementalSync
+
+
+class ChangedCardSettler:
+    """
+    Pays what each changed card is still owed (cards are matched to Munch
+    customers by email and only rewards not yet credited are paid)
+    """
+    
+    def __init__(self, campaign_id, integration, directory):
+        self.campaign_id = campaign_id
+        self.integration = integration
+        self.reconciler = Reconciler(directory, ledger=integration.ledger)
+        self.deposited = 0
+        self.failed = 0
+    
+    @classmethod
+    def start(cls, campaign_id):
+        """A settler, or None when deposits are not possible"""
+        
+        from secure_munch_integration import SecureMunchIntegration
+        
+        try:
+            integration = SecureMunchIntegration()
+        except ValueError as e:
+            print(f"   ⚠️ Not depositing: {e}")
+            return None
+        if not integration.ledger.persistent:
+            print(f"   ⚠️ Not depositing: {NOT_PERSISTENT_ERROR}")
+            return None
+        
+        directory = load_directory(integration)
+        if directory is None:
+            print("   ⚠️ Not depositing: could not download the Munch customer directory")
+            return None
+        return cls(campaign_id, integration, directory)
+    
+    def __call__(self, card):
+        for owed in self.reconciler.reconcile([card], self.campaign_id):
+            result = self.reconciler.settle(owed, self.integration)
+            if result['success']:
+                self.deposited += 1
+            elif not result.get('already_credited'):
+                self.failed += 1
 
-load_dotenv('production.env')
 
 def search_loopy_rewards_improved():
     """Search for Loopy loyalty rewards with improved error handling"""
@@ -24,10 +70,11 @@ def search_loopy_rewards_improved():
     print()
     
     # Loopy API Configuration
-    loopy_api_key = os.getenv('LOOPY_API_KEY')
-    loopy_username = os.getenv('LOOPY_USERNAME')
-    loopy_base_url = os.getenv('LOOPY_BASE_URL', 'https://app.loopyloyalty.com/api')
-    campaign_id = os.getenv('CAMPAIGN_ID')
+    config = get_config()
+    loopy_api_key = config.loopy_api_key
+    loopy_username = config.loopy_username
+    loopy_base_url = config.loopy_base_url
+    campaign_id = config.campaign_id
     
     print(f"🔗 Loopy API: {loopy_base_url}")
     print(f"👤 Username: {loopy_username}")
@@ -73,136 +120,106 @@ def search_loopy_rewards_improved():
         
         # Step 2: Try different endpoints to find data
         endpoints_to_try = [
-            f'/campaigns/{campaign_id}/transactions',
-            f'/campaigns/{campaign_id}/rewards', 
-            f'/campaigns/{campaign_id}/customers',
-            f'/campaigns/{campaign_id}/activities',
-            f'/campaigns/{campaign_id}/completions',
-            f'/transactions',
-            f'/rewards',
-            f'/customers'
+            '/campaigns/{campaign_id}/transactions',
+            '/campaigns/{campaign_id}/rewards', 
+            '/campaigns/{campaign_id}/customers',
+            '/campaigns/{campaign_id}/activities',
+            '/campaigns/{campaign_id}/completions',
+            '/transactions',
+            '/rewards',
+            '/customers'
         ]
         
-        print(f"\n🔍 Step 2: Testing data endpoints...")
+        print(f"\n🔍 Step 2: Checking data endpoints...")
         
         found_rewards = []
         
-        for endpoint in endpoints_to_try:
-            print(f"\n   📡 Testing: {endpoint}")
-            
-            # Calculate today's date range
-            today = datetime.now().date()
-            today_start = datetime.combine(today, datetime.min.time())
-            today_end = datetime.combine(today, datetime.max.time())
+        # Calculate today's date range
+        today = datetime.now().date()
+        today_start = datetime.combine(today, datetime.min.time())
+        today_end = datetime.combine(today, datetime.max.time())
+        params = {
+            'from': today_start.isoformat(),
+            'to': today_end.isoformat(),
+            'limit': 100,
+            'campaign_id': campaign_id
+        }
+        
+        discovery = EndpointDiscovery(campaign_id, base_url=loopy_base_url)
+        capabilities = discovery.discover(endpoints_to_try, params)
+        print_capabilities(capabilities, discovery)
+        
+        for capability in capabilities:
+            if not capability.ok:
+                continue
+            data = discovery.fetch(capability, params)
+            if data is None:
+                continue
+            print(f"\n   📡 {capability.path}")
             
-            # Try with date parameters
-            params = {
-                'from': today_start.isoformat(),
-                'to': today_end.isoformat(),
-                'limit': 100,
-                'campaign_id': campaign_id
-            }
+            items = data
+            if capability.shape in ('rows', 'data'):
+                items = data[capability.shape]
+            if not isinstance(items, list):
+                print(f"      📋 Keys: {list(data.keys()) if isinstance(data, dict) else type(data).__name__}")
+                continue
+            print(f"      📊 Found {len(items)} items")
             
-            try:
-                url = f'{loopy_base_url}{endpoint}'
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-                
-                print(f"      📊 Status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        print(f"      ✅ SUCCESS! Data loaded")
-                        
-                        if isinstance(data, list):
-                            print(f"      📊 Found {len(data)} items")
-                            
-                            # Look for today's activities
-                            today_items = []
-                            for item in data:
-                                item_date = item.get('created_at') or item.get('earned_at') or item.get('date')
-                                if item_date and '2025-06-03' in str(item_date):
-                                    today_items.append(item)
-                                    
-                                    # Check if it's a completed reward
-                                    if 'reward' in endpoint or item.get('status') == 'earned':
-                                        print(f"      🎉 Found reward: {item}")
-                                        found_rewards.append(item)
-                            
-                            if today_items:
-                                print(f"      📅 {len(today_items)} items from today")
-                            else:
-                                print(f"      📅 No items from today")
-                                
-                        elif isinstance(data, dict):
-                            print(f"      📋 Dict with keys: {list(data.keys())}")
-                            
-                            # Check if there's a data array inside
-                            if 'data' in data:
-                                inner_data = data['data']
-                                if isinstance(inner_data, list):
-                                    print(f"      📊 Inner data has {len(inner_data)} items")
-                        
-                    except json.JSONDecodeError as e:
-                        print(f"      ❌ JSON error: {e}")
-                        print(f"      📄 Raw: {response.text[:100]}...")
-                        
-                elif response.status_code == 401:
-                    print(f"      🔒 Authentication required")
-                elif response.status_code == 403:
-                    print(f"      🚫 Forbidden")
-                elif response.status_code == 404:
-                    print(f"      ❌ Not found")
-                else:
-                    print(f"      ⚠️ {response.status_code}: {response.text[:100]}...")
+            # Look for today's activities
+            today_items = []
+            for item in items:
+                item_date = item.get('created_at') or item.get('earned_at') or item.get('date')
+                if item_date and today.isoformat() in str(item_date):
+                    today_items.append(item)
                     
-            except Exception as e:
-                print(f"      ❌ Error: {e}")
+                    # Check if it's a completed reward
+                    if 'reward' in capability.path or item.get('status') == 'earned':
+                        print(f"      🎉 Found reward: {item}")
+                        found_rewards.append(item)
+            
+            if today_items:
+                print(f"      📅 {len(today_items)} items from today")
+            else:
+                print(f"      📅 No items from today")
         
-        # Step 3: Try to get customer data and check for completed stamps
-        print(f"\n🔍 Step 3: Checking for completed stamp cards...")
+        # Step 3: Cards changed since the last run (incremental, watermark-based)
+        print(f"\n🔍 Step 3: Checking cards changed since the last sync...")
         
-        try:
-            customers_url = f'{loopy_base_url}/campaigns/{campaign_id}/customers'
-            customers_response = requests.get(customers_url, headers=headers, timeout=10)
+        # Only the changed cards are reconciled and paid, never a full campaign scan
+        settle = ChangedCardSettler.start(campaign_id)
+        rule = get_rule_engine().rule_for(campaign_id)
+        if rule is None:
+            print(f"   ⚠️ No reward rule configured for campaign {campaign_id}")
+        
+        def check_card(card):
+            stamps = card.get('totalStampsEarned', 0)
+            card_id = card.get('id')
+            reward = rule.evaluate(stamps) if rule else None
             
-            if customers_response.status_code == 200:
-                customers_data = customers_response.json()
-                print(f"   ✅ Got customers data")
-                
-                if isinstance(customers_data, list):
-                    completed_today = []
-                    
-                    for customer in customers_data:
-                        stamps = customer.get('stamps', 0)
-                        customer_id = customer.get('id') or customer.get('customer_id')
-                        
-                        if stamps >= 12:  # Completed loyalty card
-                            print(f"   🎉 Customer {customer_id} has {stamps} stamps (COMPLETED!)")
-                            
-                            completed_today.append({
-                                'customer_id': customer_id,
-                                'stamps': stamps,
-                                'reward_type': 'Free Coffee',
-                                'amount': 4000,  # R40
-                                'earned_at': datetime.now().isoformat(),
-                                'status': 'earned'
-                            })
-                    
-                    if completed_today:
-                        print(f"   🎯 Found {len(completed_today)} completed loyalty cards!")
-                        found_rewards.extend(completed_today)
-                    else:
-                        print(f"   📊 No completed loyalty cards found")
-                        
-                elif isinstance(customers_data, dict) and 'data' in customers_data:
-                    print(f"   📋 Customers data structure: {list(customers_data.keys())}")
-                
-            else:
-                print(f"   ❌ Could not get customers: {customers_response.status_code}")
+            if reward and reward.rewards:  # Completed loyalty card
+                print(f"   🎉 Card {card_id} has {stamps} stamps (COMPLETED!)")
                 
+                found_rewards.append({
+                    'customer_id': card_id,
+                    'stamps': stamps,
+                    'reward_type': reward.label,
+                    'amount': reward.value_cents,
+                    'earned_at': card.get('lastStampEarnedDate'),
+                    'status': 'earned'
+                })
+            if settle:
+                settle(card)
+        
+        try:
+            stats = IncrementalSync(campaign_id).run(check_card)
+            print(f"   📊 {stats['changed']} changed card(s) since {stats['previous_watermark'] or 'the beginning'} "
+                  f"({stats['rows']} read in {stats['pages']} pages)")
         except Exception as e:
-            print(f"   ❌ Error getting customers: {e}")
+            print(f"   ❌ Error syncing cards: {e}")
+        if settle:
+            print(f"   💰 Deposited: {settle.deposited}, ❌ failed: {settle.failed}")
+            if settle.failed:
+                print(f"   💡 Run 'python reconciliation.py --deposit' to retry the failed deposits")
         
         return found_rewards
         
@@ -234,34 +251,6 @@ def main():
             print(f"      Type: {reward.get('reward_type', 'Unknown')}")
             print(f"      Amount: R{reward.get('amount', 0)/100}")
             print(f"      Status: {reward.get('status', 'Unknown')}")
-        
-        # Ask if we should process these rewards
-        print(f"\n💰 PROCESSING OPTIONS:")
-        print(f"   1. Process all {len(rewards)} rewards to Munch")
-        print(f"   2. Show details only")
-        
-        try:
-            from munch_loyalty_integration_final import deposit_loyalty_reward
-            
-            print(f"\n🚀 AUTO-PROCESSING TO MUNCH...")
-            
-            for reward in rewards:
-                customer_id = reward['customer_id']
-                amount = reward.get('amount', 4000)
-                
-                result = deposit_loyalty_reward(
-                    customer_user_id=customer_id,
-                    amount_in_cents=amount,
-                    description=f"Loopy loyalty reward - {reward.get('reward_type', 'Free coffee')}"
-                )
-                
-                if result['success']:
-                    print(f"   ✅ {customer_id}: R{result['amount_deposited']} deposited")
-                else:
-                    print(f"   ❌ {customer_id}: {result['error']}")
-                    
-        except ImportError:
-            print("   ⚠️ Munch integration not available")
             
     else:
         print(f"ℹ️ No rewards found for today")
@@ -7,13 +7,13 @@ Searches the Loopy Loyalty system for any rewards earned today
 that can be processed and uploaded as credits to Munch.
 """
 
-import os
 import requests
 import json
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from app_config import get_config
+from reconciliation import deposit_owed_rewards
+from reward_rules import cents_to_rands, get_rule_engine
 
-load_dotenv('production.env')
 
 def search_loopy_rewards_today():
     """Search for Loopy loyalty rewards earned today"""
@@ -25,15 +25,23 @@ def search_loopy_rewards_today():
     print()
     
     # Loopy API Configuration
-    loopy_api_key = os.getenv('LOOPY_API_KEY')
-    loopy_username = os.getenv('LOOPY_USERNAME')
-    loopy_base_url = os.getenv('LOOPY_BASE_URL', 'https://app.loopyloyalty.com/api')
-    campaign_id = os.getenv('CAMPAIGN_ID')
+    config = get_config()
+    loopy_api_key = config.loopy_api_key
+    loopy_username = config.loopy_username
+    loopy_base_url = config.loopy_base_url
+    campaign_id = config.campaign_id
     
     if not all([loopy_api_key, loopy_username, campaign_id]):
         print("❌ Missing Loopy API configuration")
         return []
     
+    rule = get_rule_engine().rule_for(campaign_id)
+    if rule is None:
+        print(f"❌ No reward rule configured for campaign {campaign_id}")
+        return []
+    # A reward Loopy reports is worth one full cycle of the campaign's rule
+    reward_cents = rule.evaluate(rule.stamps_per_cycle).value_cents
+    
     print(f"🔗 Loopy API: {loopy_base_url}")
     print(f"👤 Username: {loopy_username}")
     print(f"🎯 Campaign ID: {campaign_id}")
@@ -149,9 +157,9 @@ def search_loopy_rewards_today():
                             'reward_type': reward_type,
                             'earned_at': earned_at,
                             'status': status,
-                            'amount': 4000  # R40 for free coffee
+                            'amount': reward_cents
                         })
-                        print(f"      ✅ Eligible for R40 Munch credit!")
+                        print(f"      ✅ Eligible for R{cents_to_rands(reward_cents)} Munch credit!")
                     
                     print()
                     
@@ -169,7 +177,7 @@ def search_loopy_rewards_today():
             headers=headers,
             params={
                 'limit': 100,
-                'min_stamps': 10  # Customers with 10+ stamps (close to 12)
+                'min_stamps': max(rule.stamps_per_cycle - 2, 1)  # Close to a full cycle
             },
             timeout=10
         )
@@ -185,18 +193,20 @@ def search_loopy_rewards_today():
                     stamps = customer.get('stamps', 0)
                     points = customer.get('points', 0)
                     
-                    if stamps >= 12:
+                    reward = rule.evaluate(stamps)
+                    
+                    if reward.rewards:
                         status = "🎉 COMPLETED! (Eligible for reward)"
                         completed_rewards.append({
                             'customer_id': customer_id,
                             'stamps': stamps,
                             'points': points,
-                            'amount': 4000  # R40 for free coffee
+                            'amount': reward.value_cents
                         })
-                    elif stamps >= 10:
-                        status = f"⭐ {stamps}/12 stamps (Close!)"
+                    elif reward.stamps_to_next <= 2:
+                        status = f"⭐ {stamps} stamps, {reward.stamps_to_next} to go (Close!)"
                     else:
-                        status = f"📊 {stamps}/12 stamps"
+                        status = f"📊 {stamps} stamps, {reward.stamps_to_next} to go"
                     
                     print(f"   {i+1}. Customer: {customer_id}")
                     print(f"      Stamps: {stamps}, Points: {points}")
@@ -223,64 +233,10 @@ def process_loopy_rewards_to_munch(rewards):
     print(f"\n💰 PROCESSING {len(rewards)} REWARDS TO MUNCH")
     print("=" * 50)
     
-    try:
-        # Import our production integration
-        from munch_loyalty_integration_final import deposit_loyalty_reward
-        
-        successful_deposits = []
-        failed_deposits = []
-        
-        for i, reward in enumerate(rewards):
-            customer_id = reward['customer_id']
-            amount = reward.get('amount', 4000)  # Default R40
-            
-            print(f"💳 Processing {i+1}/{len(rewards)}: Customer {customer_id}")
-            print(f"   Amount: R{amount/100}")
-            
-            # Check if customer exists in Munch first
-            result = deposit_loyalty_reward(
-                customer_user_id=customer_id,
-                amount_in_cents=amount,
-                description=f"Loopy loyalty reward - {reward.get('reward_type', 'Free coffee')}"
-            )
-            
-            if result['success']:
-                print(f"   ✅ SUCCESS! R{result['amount_deposited']} deposited")
-                print(f"   🆔 Deposit ID: {result.get('deposit_id', 'N/A')}")
-                successful_deposits.append(result)
-            else:
-                print(f"   ❌ FAILED: {result['error']}")
-                failed_deposits.append({
-                    'customer_id': customer_id,
-                    'error': result['error']
-                })
-            
-            print()
-        
-        # Summary
-        print("📊 PROCESSING SUMMARY")
-        print("=" * 30)
-        print(f"✅ Successful: {len(successful_deposits)}")
-        print(f"❌ Failed: {len(failed_deposits)}")
-        
-        if successful_deposits:
-            total_deposited = sum(d['amount_deposited'] for d in successful_deposits)
-            print(f"💰 Total deposited: R{total_deposited}")
-            print(f"🎉 Customers now have FREE coffee credits!")
-        
-        if failed_deposits:
-            print(f"\n⚠️ FAILED DEPOSITS:")
-            for failure in failed_deposits:
-                print(f"   Customer {failure['customer_id']}: {failure['error']}")
-        
-        return successful_deposits
-        
-    except ImportError:
-        print("❌ Could not import Munch integration module")
-        return []
-    except Exception as e:
-        print(f"❌ Error processing rewards: {e}")
-        return []
+    # Cards are matched to Munch customers by email and only rewards not
+    # yet credited are paid (never the Loopy card id as a Munch user id)
+    result = deposit_owed_rewards()
+    return result['deposited'] if result['success'] else 0
 
 def main():
     """Main function to search and process Loopy rewards"""
@@ -299,7 +255,7 @@ def main():
         
         if deposits:
             print(f"\n🎉 SUCCESS!")
-            print(f"✅ {len(deposits)} rewards processed successfully")
+            print(f"✅ {deposits} rewards processed successfully")
             print(f"💳 Credits uploaded to Munch accounts")
             print(f"☕ Customers can now get FREE coffee!")
         else:
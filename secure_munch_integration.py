@@ -11,28 +11,45 @@ CRITICAL SECURITY REQUIREMENTS:
 5. NEVER deposit without proper authentication
 """
 
-import os
 import requests
 import json
 from datetime import datetime
-from dotenv import load_dotenv
+from app_config import get_config
+from customer_lock import CustomerLock, CustomerLockTimeout
+from deposit_ledger import NOT_PERSISTENT_ERROR, DepositLedger
+from munch_directory import MunchDirectory, get_shared_directory
+from loopy_schema import LoopyEvent, LoopySchemaError, deposit_validator
+from reward_rules import get_rule_engine
 
-load_dotenv('production.env')
 
 class SecureMunchIntegration:
     """Secure Munch integration with proper validation"""
     
-    def __init__(self):
-        """Initialize with proper API configuration"""
+    def __init__(self, session=None, ledger=None):
+        """
+        Initialize with proper API configuration
+        session: pooled requests.Session to reuse (e.g. from warm_state)
+        ledger: DepositLedger recording what each Loopy card was credited
+        """
         
-        self.api_key = os.getenv('MUNCH_API_KEY')
-        self.org_id = os.getenv('MUNCH_ORG_ID')
+        config = get_config()
+        self.api_key = config.munch_api_key
+        self.org_id = config.munch_org_id
         self.payment_method_id = '0193bf43-bc83-744e-9510-bc20d2314fdb'  # Account Load
-        self.base_url = 'https://api.munch.cloud/api'
+        self.base_url = config.munch_base_url
         
         if not self.api_key or not self.org_id:
             raise ValueError("❌ Missing required Munch API credentials")
         
+        # Keep-alive connections to Munch are reused across calls
+        self.http = session or requests.Session()
+        
+        # Host-wide lock so concurrent workers never deposit to the same customer at once
+        self.customer_lock = CustomerLock()
+        
+        # Loopy stamp counts are lifetime totals: only earned minus credited is paid
+        self.ledger = ledger or DepositLedger()
+        
         print("🔒 Secure Munch Integration initialized")
         print(f"   Organization: {self.org_id}")
         print(f"   Base URL: {self.base_url}")
@@ -52,20 +69,14 @@ class SecureMunchIntegration:
             'Munch-Organisation': self.org_id
         }
     
-    def find_customer_by_email(self, email):
+    def fetch_users(self):
         """
-        Find customer in Munch by email from Loopy webhook
-        NO hardcoded IDs - only search by real customer data
+        Download the full Munch customer list
+        Returns None if the request fails
         """
         
-        if not email or not isinstance(email, str):
-            print(f"❌ Invalid email provided: {email}")
-            return None
-        
-        print(f"🔍 Searching Munch for customer by email: {email}")
-        
         try:
-            response = requests.post(
+            response = self.http.post(
                 f'{self.base_url}/account/retrieve-users',
                 headers=self.get_headers(),
                 json={
@@ -76,87 +87,84 @@ class SecureMunchIntegration:
             )
             
             if response.status_code == 200:
-                users_data = response.json()
-                users = users_data.get('data', [])
-                
-                print(f"🔍 Searching {len(users)} Munch customers...")
-                
-                # Search for customer by email
-                for user in users:
-                    user_email = user.get('email', '').lower()
-                    
-                    if user_email == email.lower():
-                        customer_name = f"{user.get('firstName', '')} {user.get('lastName', '')}"
-                        print(f"✅ Found customer: {customer_name} ({email})")
-                        
-                        return {
-                            'id': user.get('id'),
-                            'email': user_email,
-                            'name': customer_name,
-                            'phone': user.get('phone', ''),
-                            'firstName': user.get('firstName', ''),
-                            'lastName': user.get('lastName', '')
-                        }
-                
-                print(f"⚠️ Customer not found in Munch: {email}")
-                return None
-                
-            else:
-                print(f"❌ Failed to search customers: {response.status_code}")
-                return None
-                
+                return response.json().get('data', [])
+            
+            print(f"❌ Failed to retrieve customers: {response.status_code}")
+            return None
+            
         except Exception as e:
-            print(f"❌ Error searching customer: {e}")
+            print(f"❌ Error retrieving customers: {e}")
             return None
     
-    def validate_deposit_request(self, loopy_webhook_data, customer_email):
+    def find_customer_by_email(self, email):
+        """
+        Find customer in Munch by email from Loopy webhook
+        NO hardcoded IDs - only search by real customer data
+        """
+        
+        if not email or not isinstance(email, str):
+            print(f"❌ Invalid email provided: {email}")
+            return None
+        
+        print(f"🔍 Searching Munch for customer by email: {email}")
+        
+        # Preloaded directory first; a miss falls through to a live search
+        # because the customer may have registered after the snapshot
+        directory = get_shared_directory()
+        if directory is not None:
+            customer = directory.find_by_email(email)
+            if customer:
+                print(f"✅ Found customer: {customer['name']} ({email}) [directory]")
+                return customer
+        
+        users = self.fetch_users()
+        if users is None:
+            return None
+        
+        print(f"🔍 Searching {len(users)} Munch customers...")
+        
+        customer = MunchDirectory.from_users(users).find_by_email(email)
+        if customer:
+            print(f"✅ Found customer: {customer['name']} ({email})")
+            return customer
+        
+        print(f"⚠️ Customer not found in Munch: {email}")
+        return None
+    
+    def validate_deposit_request(self, loopy_webhook_data):
         """
         Validate that deposit request is legitimate from Loopy webhook
         NEVER allow deposits without proper validation
+        Returns (LoopyEvent, Reward), or (None, None) if invalid
         """
         
         print("🔒 VALIDATING DEPOSIT REQUEST...")
         
-        # Validate webhook structure
-        if not isinstance(loopy_webhook_data, dict):
-            print("❌ Invalid webhook data structure")
-            return False
-        
-        # Validate customer email matches webhook
-        card_data = loopy_webhook_data.get('card', {})
-        customer_details = card_data.get('customerDetails', {})
-        webhook_email = customer_details.get('email', '').lower()
-        
-        if webhook_email != customer_email.lower():
-            print(f"❌ Email mismatch: webhook={webhook_email}, request={customer_email}")
-            return False
-        
-        # Validate card ID exists
-        loopy_card_id = card_data.get('id')
-        if not loopy_card_id:
-            print("❌ Missing Loopy card ID")
-            return False
-        
-        # Validate stamps earned
-        total_stamps = card_data.get('totalStampsEarned', 0)
-        if not isinstance(total_stamps, int) or total_stamps < 12:
-            print(f"❌ Invalid stamps count: {total_stamps}")
-            return False
-        
-        # Validate campaign
-        campaign_data = loopy_webhook_data.get('campaign', {})
-        expected_campaign = os.getenv('CAMPAIGN_ID')
-        if campaign_data.get('id') != expected_campaign:
-            print(f"❌ Wrong campaign: {campaign_data.get('id')}")
-            return False
+        # Structure, card ID, customer email and campaign are checked in one schema pass
+        try:
+            event = deposit_validator().validate(loopy_webhook_data)
+        except LoopySchemaError as e:
+            print(f"❌ Invalid webhook: {e}")
+            return None, None
+        
+        # Validate stamps earned against the campaign's reward rule
+        reward = get_rule_engine().evaluate(event.campaign_id, event.total_stamps)
+        if reward is None:
+            print(f"❌ No reward rule for campaign: {event.campaign_id}")
+            return None, None
+        
+        if reward.rewards < 1:
+            print(f"❌ Invalid stamps count: {event.total_stamps} ({reward.stamps_to_next} more needed)")
+            return None, None
         
         print("✅ Deposit request validated")
-        return True
+        return event, reward
     
     def process_legitimate_reward(self, loopy_webhook_data):
         """
         Process a legitimate reward from validated Loopy webhook
         NEVER process without proper validation
+        Accepts the raw webhook dict or a LoopyEvent from the webhook handler
         """
         
         print("🎁 PROCESSING LEGITIMATE LOOPY REWARD")
@@ -164,26 +172,44 @@ class SecureMunchIntegration:
         print(f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print()
         
-        # Extract customer data from webhook
-        card_data = loopy_webhook_data.get('card', {})
-        customer_details = card_data.get('customerDetails', {})
+        # Events from the lenient webhook validator are re-checked against the deposit rules
+        if isinstance(loopy_webhook_data, LoopyEvent):
+            loopy_webhook_data = loopy_webhook_data.raw
         
-        customer_email = customer_details.get('email')
-        loopy_card_id = card_data.get('id')
-        total_stamps = card_data.get('totalStampsEarned', 0)
+        # Validate the deposit request
+        event, reward = self.validate_deposit_request(loopy_webhook_data)
+        if event is None:
+            return {
+                'success': False,
+                'error': 'Deposit request validation failed'
+            }
+        
+        customer_email = event.email
+        loopy_card_id = event.card_id
         
         print(f"📊 LOOPY WEBHOOK DATA:")
         print(f"   Card ID: {loopy_card_id}")
         print(f"   Customer Email: {customer_email}")
-        print(f"   Total Stamps: {total_stamps}")
+        print(f"   Total Stamps: {event.total_stamps}")
+        print(f"   Campaign: {reward.campaign_id}")
         print()
         
-        # Validate the deposit request
-        if not self.validate_deposit_request(loopy_webhook_data, customer_email):
+        # Lookup and deposit must not interleave with another worker for this customer
+        try:
+            with self.customer_lock.hold(customer_email):
+                return self._lookup_and_deposit(customer_email, loopy_card_id, reward)
+        except CustomerLockTimeout as e:
+            print(f"❌ {e}")
             return {
                 'success': False,
-                'error': 'Deposit request validation failed'
+                'error': f'Customer busy, deposit not attempted: {e}'
             }
+    
+    def _lookup_and_deposit(self, customer_email, loopy_card_id, reward):
+        """
+        Critical section: find the Munch customer and deposit the reward
+        Caller must hold the customer lock
+        """
         
         # Find customer in Munch
         customer = self.find_customer_by_email(customer_email)
@@ -194,33 +220,80 @@ class SecureMunchIntegration:
                 'error': f'Customer not found in Munch: {customer_email}'
             }
         
-        # Calculate legitimate reward
-        STAMPS_PER_COFFEE = 12
-        COFFEE_VALUE_CENTS = 4000  # R40
+        # Legitimate reward from the campaign's precompiled rule, less what was already credited
+        return self.deposit_owed(customer['id'], customer_email, loopy_card_id, reward.campaign_id,
+                                 reward.rewards, reward.value_cents)
+    
+    def deposit_owed(self, customer_id, customer_email, loopy_card_id, campaign_id, earned_rewards, earned_cents):
+        """
+        Deposit what a card has earned less what the ledger says was credited
+        Caller must hold the customer lock. The deposit is claimed in the
+        ledger before Munch is called, so one that Munch accepted is never
+        paid again even if we crash or time out before recording it; only
+        a deposit Munch refused releases its claim for a retry
+        """
+        
+        if not self.ledger.persistent:
+            print(f"❌ {NOT_PERSISTENT_ERROR}")
+            return {
+                'success': False,
+                'error': NOT_PERSISTENT_ERROR
+            }
         
-        free_coffees = total_stamps // STAMPS_PER_COFFEE
-        total_credit = free_coffees * COFFEE_VALUE_CENTS
+        credited_rewards, credited_cents = self.ledger.credited(loopy_card_id)
+        free_coffees = earned_rewards - credited_rewards
+        total_credit = earned_cents - credited_cents
         
         print(f"💰 REWARD CALCULATION:")
-        print(f"   Free Coffees: {free_coffees}")
+        print(f"   Earned: {earned_rewards} (R{earned_cents/100})")
+        print(f"   Already credited: {credited_rewards} (R{credited_cents/100})")
+        print(f"   Free Coffees owed: {free_coffees}")
         print(f"   Credit Amount: R{total_credit/100}")
         print()
         
-        # Process the deposit
-        return self.deposit_reward(
-            customer_id=customer['id'],
+        if total_credit <= 0:
+            return {
+                'success': False,
+                'error': f'Reward already credited for card {loopy_card_id}',
+                'already_credited': True
+            }
+        
+        claim_key = f'credit:{loopy_card_id}:{earned_rewards}'
+        if not self.ledger.claim_event(claim_key, loopy_card_id):
+            print(f"❌ Deposit for card {loopy_card_id} was already attempted")
+            return {
+                'success': False,
+                'error': f'Deposit for card {loopy_card_id} was already attempted; check Munch before retrying',
+                'needs_review': True
+            }
+        
+        result = self.deposit_reward(
+            customer_id=customer_id,
             amount_in_cents=total_credit,
             loopy_card_id=loopy_card_id,
             customer_email=customer_email,
-            free_coffees=free_coffees
+            free_coffees=free_coffees,
+            campaign_id=campaign_id
         )
+        if not result['success'] and 'response_code' in result:
+            # Munch refused the deposit, so nothing was paid: allow a retry
+            self.ledger.release_event(claim_key)
+        return result
     
-    def deposit_reward(self, customer_id, amount_in_cents, loopy_card_id, customer_email, free_coffees):
+    def deposit_reward(self, customer_id, amount_in_cents, loopy_card_id, customer_email, free_coffees,
+                       campaign_id=None):
         """
         Deposit reward to verified Munch customer
-        With proper audit trail and validation
+        With proper audit trail and validation; the credit is recorded in the ledger
         """
         
+        if not self.ledger.persistent:
+            print(f"❌ {NOT_PERSISTENT_ERROR}")
+            return {
+                'success': False,
+                'error': NOT_PERSISTENT_ERROR
+            }
+        
         print(f"💳 DEPOSITING REWARD:")
         print(f"   Customer ID: {customer_id}")
         print(f"   Email: {customer_email}")
@@ -229,7 +302,7 @@ class SecureMunchIntegration:
         print()
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f'{self.base_url}/deposit/deposit',
                 headers=self.get_headers(),
                 json={
@@ -268,9 +341,13 @@ class SecureMunchIntegration:
                 
                 print(f"📋 AUDIT RECORD: {json.dumps(audit_record, indent=2)}")
                 
+                self.ledger.record_credit(loopy_card_id, campaign_id, free_coffees, amount_in_cents,
+                                          customer_id, customer_email, result.get('id'))
+                
                 return {
                     'success': True,
                     'amount_deposited': f"R{amount_in_cents/100}",
+                    'amount_cents': amount_in_cents,
                     'customer_email': customer_email,
                     'loopy_card_id': loopy_card_id,
                     'deposit_id': result.get('id'),
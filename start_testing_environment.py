@@ -14,17 +14,16 @@ import time
 import json
 import requests
 from datetime import datetime
-from dotenv import load_dotenv
+from app_config import get_config, getenv
 
-# Load environment variables
-load_dotenv('production.env')
 
 class TestingEnvironmentManager:
     """Manages the testing environment setup"""
     
     def __init__(self):
-        self.munch_base_url = os.getenv('MUNCH_BASE_URL', 'https://api.munch.cloud/api')
-        self.munch_api_key = os.getenv('MUNCH_API_KEY')
+        config = get_config()
+        self.munch_base_url = config.munch_base_url
+        self.munch_api_key = config.munch_api_key
         self.munch_headers = {
             'Authorization': f'Bearer {self.munch_api_key}',
             'Content-Type': 'application/json'
@@ -46,7 +45,7 @@ class TestingEnvironmentManager:
         ]
         
         for var in required_vars:
-            if os.getenv(var):
+            if getenv(var):
                 prerequisites.append(f"✅ {var}")
             else:
                 prerequisites.append(f"❌ {var} - Missing")
@@ -101,10 +100,11 @@ class TestingEnvironmentManager:
         try:
             from loopy_munch_bilateral_sync import LoopyCustomerAPI
             
+            config = get_config()
             loopy_api = LoopyCustomerAPI(
-                api_key=os.getenv('LOOPY_API_KEY'),
-                api_secret=os.getenv('LOOPY_API_SECRET'),
-                username=os.getenv('LOOPY_USERNAME')
+                api_key=config.loopy_api_key,
+                api_secret=config.loopy_api_secret,
+                username=config.loopy_username
             )
             
             if loopy_api.auth_token:
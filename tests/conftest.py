@@ -0,0 +1,86 @@
+"""
+Shared test setup: the repository root on sys.path, and every store,
+lock and env file pointed at a per-session temporary directory so tests
+never touch production.env or the host's ledger.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+_state_dir = tempfile.mkdtemp(prefix='loopy-munch-tests-')
+
+os.environ.update({
+    'ENV_FILE': os.path.join(_state_dir, 'missing.env'),
+    'REWARD_RULES_FILE': os.path.join(_state_dir, 'missing_rules.json'),
+    'CAMPAIGN_ID': 'test-campaign',
+    'MUNCH_API_KEY': 'test-key',
+    'MUNCH_ORG_ID': 'test-org',
+    'DEPOSIT_LEDGER_DB': os.path.join(_state_dir, 'ledger.db'),
+    'CUSTOMER_LOCK_DB': os.path.join(_state_dir, 'locks.db'),
+    'CARD_STATE_DB': os.path.join(_state_dir, 'card_state.db'),
+})
+
+
+def make_card(card_id='card-1', stamps=12, email='thandi@example.co.za', campaign_id='test-campaign', **extra):
+    """A Loopy card object as webhooks and the cards API send it"""
+
+    card = {
+        'id': card_id,
+        'campaignID': campaign_id,
+        'totalStampsEarned': stamps,
+        'customerDetails': {'email': email, 'Name': 'Thandi Nkosi'},
+    }
+    card.update(extra)
+    return card
+
+
+def load_api_module(name):
+    """A fresh copy of api/<name>.py, loaded the way Vercel loads a function"""
+
+    spec = importlib.util.spec_from_file_location(f'api_{name}', os.path.join(ROOT_DIR, 'api', f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_webhook_module():
+    return load_api_module('webhook')
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FlakyMake:
+    """Make.com stand-in: unreachable for the first `failures` posts"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.posts = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.posts += 1
+        if self.posts <= self.failures:
+            raise ConnectionError('Make.com unreachable')
+        return FakeResponse(200)
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    """A freshly loaded api/webhook.py with a rewards forward configured"""
+
+    from app_config import reset_config
+
+    monkeypatch.setenv('REWARDS_WEBHOOK_URL', 'https://hook.example/rewards')
+    reset_config()
+    module = load_webhook_module()
+    yield module
+    reset_config()
@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+from admission import AdmissionController, classify_event
+from conftest import load_webhook_module
+
+
+def admit(controller, event_class, count):
+    return [controller.try_admit(event_class) for _ in range(count)]
+
+
+def test_lower_priority_is_shed_with_429_while_rewards_get_in():
+    controller = AdmissionController(max_in_flight=4)
+    assert controller.limits == {'rewards': 4, 'stamp': 3, 'enrolled': 2}
+
+    assert all(decision.admitted for decision in admit(controller, 'enrolled', 2))
+    shed = controller.try_admit('enrolled')
+    assert (shed.admitted, shed.status_code) == (False, 429)
+    assert shed.retry_after >= 1
+
+    assert controller.try_admit('stamp').admitted
+    assert controller.try_admit('stamp').status_code == 429
+    assert controller.try_admit('rewards').admitted
+
+
+def test_saturated_handler_sheds_every_class_with_503():
+    controller = AdmissionController(max_in_flight=2)
+    admitted = admit(controller, 'rewards', 2)
+
+    for event_class in ('rewards', 'stamp', 'enrolled'):
+        assert controller.try_admit(event_class).status_code == 503
+
+    controller.release(admitted[0], service_seconds=0.1)
+    assert controller.try_admit('rewards').admitted
+    assert controller.get_metrics()['rejected'] == {'rewards': 1, 'stamp': 1, 'enrolled': 1}
+
+
+def test_retry_after_follows_processing_time_within_bounds():
+    controller = AdmissionController(max_in_flight=1)
+    held = controller.try_admit('rewards')
+    assert controller.try_admit('rewards').retry_after == 1
+
+    for _ in range(20):
+        controller.release(held, service_seconds=8.0)
+        held = controller.try_admit('rewards')
+    assert 7 <= controller.try_admit('rewards').retry_after <= 8
+
+    for _ in range(20):
+        controller.release(held, service_seconds=600.0)
+        held = controller.try_admit('rewards')
+    assert controller.try_admit('rewards').retry_after == 30
+
+
+@pytest.mark.parametrize('endpoint, event_class', [
+    ('rewards', 'rewards'), ('stamp', 'stamp'), ('enrolled', 'enrolled'), ('something-new', 'enrolled')])
+def test_endpoints_map_to_event_classes(endpoint, event_class):
+    assert classify_event(endpoint) == event_class
+
+
+def test_webhook_answers_a_shed_request_with_retry_after(monkeypatch):
+    webhook = load_webhook_module()
+    controller = AdmissionController(max_in_flight=1)
+    controller.try_admit('rewards')
+    monkeypatch.setattr(webhook, 'ADMISSION', controller)
+
+    request = webhook.handler.__new__(webhook.handler)
+    request.path = '/api/webhook/stamp'
+    request.command, request.request_version = 'POST', 'HTTP/1.1'
+    request.requestline = 'POST /api/webhook/stamp HTTP/1.1'
+    request.client_address = ('127.0.0.1', 0)
+    request.wfile = io.BytesIO()
+    request.log_message = lambda *args: None
+    request.do_POST()
+
+    head, body = request.wfile.getvalue().split(b'\r\n\r\n', 1)
+    assert head.split(b' ')[1] == b'503'
+    assert b'\r\nRetry-After: 1' in head
+    assert json.loads(body)['status'] == 'rejected'
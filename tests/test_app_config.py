@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from admission import AdmissionController
+from app_config import get_config, getenv, reset_config
+from conftest import load_webhook_module
+
+KNOBS = ('WEBHOOK_MAX_IN_FLIGHT', 'BULK_WINDOW', 'MUNCH_ORG_ID')
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    path = tmp_path / 'production.env'
+    path.write_text('WEBHOOK_MAX_IN_FLIGHT=3\nBULK_WINDOW=32\nMUNCH_ORG_ID=from-file\n')
+    saved = {name: os.environ.get(name) for name in KNOBS}
+    monkeypatch.setenv('ENV_FILE', str(path))
+    reset_config()
+    yield path
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    monkeypatch.undo()
+    reset_config()
+
+
+def test_knobs_read_before_get_config_see_the_env_file(env_file):
+    assert AdmissionController().max_in_flight == 3
+    assert load_webhook_module().BULK_WINDOW == 32
+
+
+def test_existing_environment_wins_over_the_env_file(env_file):
+    assert getenv('MUNCH_ORG_ID') == 'test-org'
+    assert get_config().munch_org_id == 'test-org'
+    assert get_config().env_file == str(env_file)
@@ -0,0 +1,68 @@
+import pytest
+
+from backfill_loopy_cards import Backfill, Checkpoint
+from conftest import make_card
+from customer_lock import CustomerLock
+from deposit_ledger import DepositLedger
+from munch_directory import MunchDirectory, set_shared_directory
+from secure_munch_integration import SecureMunchIntegration
+from test_reconciliation import USERS, FakeMunch, start_service
+
+
+class FakePager:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetch_page(self, offset):
+        return {'rows': self.rows[offset:offset + 100], 'total_rows': len(self.rows)}
+
+
+class WebhookRaceLedger(DepositLedger):
+    """A webhook credits card-1's first reward right after the backfill probed the ledger"""
+
+    raced = False
+
+    def credited_many(self, card_ids):
+        totals = super().credited_many(card_ids)
+        if not self.raced:
+            self.raced = True
+            self.record_credit('card-1', 'test-campaign', 1, 4000)
+        return totals
+
+
+@pytest.fixture
+def directory():
+    set_shared_directory(MunchDirectory.from_users(USERS))
+    yield
+    set_shared_directory(None)
+
+
+def start_backfill(integration, rows, tmp_path):
+    backfill = Backfill('test-campaign', integration, Checkpoint(str(tmp_path / 'checkpoint.json'), 'test-campaign', 100))
+    backfill.pager = FakePager(rows)
+    return backfill
+
+
+def test_deposited_cents_are_what_was_actually_paid(tmp_path, directory):
+    munch = FakeMunch()
+    integration = SecureMunchIntegration(session=munch, ledger=WebhookRaceLedger(str(tmp_path / 'ledger.db')))
+
+    _, _, stats = start_backfill(integration, [make_card('card-1', stamps=24)], tmp_path).process_chunk(0)
+
+    assert [deposit['amount'] for deposit in munch.deposits] == [4000]
+    assert (stats['deposited'], stats['deposited_cents']) == (1, 4000)
+
+
+def test_busy_customer_is_a_failed_card_not_a_failed_chunk(tmp_path, directory):
+    munch = FakeMunch()
+    integration = start_service(munch, str(tmp_path / 'ledger.db'))
+    integration.customer_lock.timeout = 0.05
+    rows = [make_card('card-1', stamps=24, email='thandi@example.co.za'),
+            make_card('card-2', stamps=12, email='sipho@example.co.za')]
+    backfill = start_backfill(integration, rows, tmp_path)
+
+    with CustomerLock().hold('thandi@example.co.za'):
+        final = backfill.run()
+
+    assert (final['deposited'], final['failed'], final['deposited_cents']) == (1, 1, 4000)
+    assert final['completed'] is True
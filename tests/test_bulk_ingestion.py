@@ -0,0 +1,43 @@
+import gzip
+
+import pytest
+
+from conftest import load_webhook_module
+
+
+@pytest.fixture(scope='module')
+def handler():
+    return load_webhook_module()
+
+
+def chunked(data, size=4096):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_gzip_lines_are_split_across_chunks(handler):
+    body = gzip.compress(b'{"a":1}\n{"b":2}\n{"c":3}')
+    assert [line for line in handler.iter_ndjson_lines(chunked(body, 7), gzipped=True)] == \
+        [b'{"a":1}', b'{"b":2}', b'{"c":3}']
+
+
+def test_newline_free_gzip_bomb_is_stopped_at_one_line(handler):
+    # ~100 KB on the wire, 100 MB of zeros without a newline once inflated
+    bomb = gzip.compress(b'0' * (100 * 1024 * 1024))
+    inflated = []
+
+    def consumed(chunks):
+        for chunk in handler.iter_inflated(chunks, 1 << 40):
+            inflated.append(len(chunk))
+            yield chunk
+
+    lines = handler.iter_ndjson_lines(consumed(chunked(bomb, len(bomb))), gzipped=False)
+    with pytest.raises(ValueError, match='exceeds 1 MB'):
+        list(lines)
+    assert max(inflated) <= handler.BULK_MAX_LINE_BYTES
+    assert sum(inflated) <= 2 * handler.BULK_MAX_LINE_BYTES + 1
+
+
+def test_inflated_size_is_capped_per_request(handler):
+    body = gzip.compress(b'{}\n' * 100000)
+    with pytest.raises(ValueError, match='Decompressed body exceeds 1000 bytes'):
+        list(handler.iter_ndjson_lines(chunked(body), gzipped=True, max_inflated_bytes=1000))
@@ -0,0 +1,117 @@
+import pytest
+
+from campaign_cache import CampaignCache
+
+BASE_URL = 'https://loopy.test/v1'
+CAMPAIGNS = [{'id': 'test-campaign', 'name': 'Coffee card'}, {'id': 'other-campaign', 'name': 'Muffins'}]
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+
+class StaticToken:
+    last_error = None
+
+    def get_token(self, force_refresh=False):
+        return 'token'
+
+
+class FakeLoopy:
+    """/campaigns with an ETag; answers 304 when the client already has it"""
+
+    def __init__(self):
+        self.requests = []
+        self.etag = '"v1"'
+        self.down = False
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers.get('If-None-Match')))
+        if self.down:
+            raise ConnectionError('Loopy unreachable')
+        if headers.get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        data = {'rows': CAMPAIGNS} if url.endswith('/campaigns') else {'id': url.rsplit('/', 1)[1]}
+        return FakeResponse(200, data, {'ETag': self.etag})
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / 'campaigns.json')
+
+
+def campaign_cache(loopy, path, ttl=3600):
+    return CampaignCache(path, ttl=ttl, session=loopy, token_cache=StaticToken(), base_url=BASE_URL)
+
+
+def test_reads_within_the_ttl_stay_off_the_network(cache_file):
+    loopy = FakeLoopy()
+    cache = campaign_cache(loopy, cache_file)
+
+    assert cache.get('test-campaign')['name'] == 'Coffee card'
+    assert [c['id'] for c in cache.all()] == ['test-campaign', 'other-campaign']
+    # A new process reads the file instead of downloading
+    assert campaign_cache(loopy, cache_file).get('other-campaign')['name'] == 'Muffins'
+
+    assert len(loopy.requests) == 1
+    assert cache.stats['hits'] == 1
+
+
+def test_expired_entry_is_revalidated_with_its_etag(cache_file):
+    loopy = FakeLoopy()
+    campaign_cache(loopy, cache_file).all()
+
+    later = campaign_cache(loopy, cache_file, ttl=0)
+    assert later.get('test-campaign')['name'] == 'Coffee card'
+
+    assert loopy.requests[-1] == (f'{BASE_URL}/campaigns', '"v1"')
+    assert (later.stats['not_modified'], later.stats['downloaded']) == (1, 0)
+
+
+def test_changed_list_is_downloaded_again(cache_file):
+    loopy = FakeLoopy()
+    campaign_cache(loopy, cache_file).all()
+    loopy.etag = '"v2"'
+
+    later = campaign_cache(loopy, cache_file, ttl=0)
+    later.all()
+
+    assert later.stats['downloaded'] == 1
+    assert later.info()['etag'] is True
+
+
+def test_stale_entry_is_served_when_loopy_is_down(cache_file):
+    loopy = FakeLoopy()
+    campaign_cache(loopy, cache_file).details('test-campaign')
+    loopy.down = True
+
+    later = campaign_cache(loopy, cache_file, ttl=0)
+
+    assert later.details('test-campaign') == {'id': 'test-campaign'}
+    assert later.stats['stale_served'] == 1
+
+
+def test_nothing_cached_and_loopy_down(cache_file):
+    loopy = FakeLoopy()
+    loopy.down = True
+    cache = campaign_cache(loopy, cache_file)
+
+    assert cache.details('test-campaign') is None
+    assert cache.all() == []
+
+
+def test_peek_never_makes_a_request(cache_file):
+    loopy = FakeLoopy()
+    assert campaign_cache(loopy, cache_file).peek('test-campaign') is None
+
+    campaign_cache(loopy, cache_file).all()
+    requests = len(loopy.requests)
+
+    assert campaign_cache(loopy, cache_file, ttl=0).peek('test-campaign')['name'] == 'Coffee card'
+    assert len(loopy.requests) == requests
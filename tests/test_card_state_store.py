@@ -0,0 +1,61 @@
+import pytest
+
+from card_state_store import CardStateStore, get_card_state_store
+from conftest import FlakyMake, make_card
+from loopy_schema import webhook_validator
+
+
+def card_event(stamps, redeemed=None, card_id='card-1'):
+    card = make_card(card_id, stamps=stamps)
+    if redeemed is not None:
+        card['totalRewardsRedeemed'] = redeemed
+    return webhook_validator().validate({'event': 'rewards.updated', 'card': card})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CardStateStore(str(tmp_path / 'card_state.db'))
+
+
+def test_older_snapshot_does_not_roll_stamps_back(store):
+    assert store.update_from_event(card_event(14))
+    assert not store.update_from_event(card_event(13))
+    assert store.get('card-1').total_stamps == 14
+
+
+def test_retried_snapshot_does_not_undo_a_redemption(store):
+    assert store.update_from_event(card_event(12, redeemed=0))
+    assert store.update_from_event(card_event(12, redeemed=1))
+    # Loopy retries the pre-redemption webhook: same stamps, fewer redeemed
+    assert not store.update_from_event(card_event(12, redeemed=0))
+    assert store.get('card-1').rewards_redeemed == 1
+
+
+def test_same_version_is_not_rewritten_but_stays_fresh(store):
+    store.update_from_event(card_event(12, redeemed=1))
+    first_seen = store.get('card-1').updated_at
+
+    assert not store.update_from_event(card_event(12, redeemed=1))
+    state = store.get('card-1')
+    assert state.rewards_redeemed == 1
+    assert state.updated_at >= first_seen
+    assert store.get_stats()['stale_writes'] == 1
+
+
+def test_newer_snapshot_replaces_the_stored_one(store):
+    store.update_from_event(card_event(12, redeemed=1))
+    assert store.update_from_event(card_event(13))
+    state = store.get('card-1')
+    assert (state.total_stamps, state.rewards_redeemed) == (13, 1)
+
+
+def test_out_of_order_webhooks_keep_the_newest_card_state(webhook, monkeypatch):
+    monkeypatch.setattr(webhook.STATE, 'session', lambda name='default', pool_size=10: FlakyMake(failures=0))
+    newer = {'event': 'rewards.updated', 'card': make_card('card-order', stamps=25, totalRewardsRedeemed=1)}
+    older = {'event': 'rewards.updated', 'card': make_card('card-order', stamps=24, totalRewardsRedeemed=0)}
+
+    webhook.process_loopy_event('rewards', newer, '/api/webhook/rewards')
+    webhook.process_loopy_event('rewards', older, '/api/webhook/rewards')
+
+    state = get_card_state_store().get('card-order')
+    assert (state.total_stamps, state.rewards_redeemed) == (25, 1)
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from customer_lock import CustomerLock, CustomerLockTimeout
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'locks.db')
+
+
+def test_second_worker_waits_for_the_same_customer(db_path):
+    first, second = CustomerLock(db_path), CustomerLock(db_path)
+
+    with first.hold('Thandi@Example.co.za'):
+        # Emails are matched case-insensitively, so this is the same customer
+        with pytest.raises(CustomerLockTimeout):
+            second.acquire('thandi@example.co.za', timeout=0.1)
+        with second.hold('sipho@example.co.za', timeout=0.1):
+            pass
+
+    with second.hold('thandi@example.co.za', timeout=0.1):
+        pass
+
+
+def test_deposits_for_one_customer_never_overlap(db_path):
+    inside, overlaps = [], []
+
+    def deposit(worker):
+        lock = CustomerLock(db_path, poll_interval=0.001)
+        for _ in range(20):
+            with lock.hold('thandi@example.co.za'):
+                if inside:
+                    overlaps.append(worker)
+                inside.append(worker)
+                inside.pop()
+
+    workers = [threading.Thread(target=deposit, args=(n,)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert overlaps == []
+    assert CustomerLock(db_path).get_metrics()['held_locks'] == 0
+
+
+def test_lease_of_a_crashed_worker_is_recovered(db_path):
+    CustomerLock(db_path, lease_seconds=0.05).acquire('thandi@example.co.za')
+
+    survivor = CustomerLock(db_path)
+    survivor.acquire('thandi@example.co.za', timeout=1)
+    assert survivor.get_metrics()['stale_recovered'] == 1
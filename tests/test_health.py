@@ -0,0 +1,33 @@
+from conftest import load_api_module
+
+
+def test_local_functions_are_not_reported_as_vercel(monkeypatch):
+    monkeypatch.delenv('VERCEL', raising=False)
+    info = load_api_module('health').build_health_response()['deployment_info']
+    assert (info['platform'], info['mode']) == ('local', 'serverless_functions')
+
+
+def test_vercel_functions(monkeypatch):
+    monkeypatch.setenv('VERCEL', '1')
+    info = load_api_module('health').build_health_response()['deployment_info']
+    assert (info['platform'], info['mode']) == ('vercel', 'serverless_functions')
+
+
+def test_container_server_reports_itself(monkeypatch):
+    monkeypatch.setenv('VERCEL', '1')
+    health = load_api_module('health')
+    health.set_deployment_info('container', 'prefork_server', workers=4)
+
+    info = health.build_health_response()['deployment_info']
+    assert info['platform'] == 'container'
+    assert info['mode'] == 'prefork_server'
+    assert info['workers'] == 4
+    assert info['runtime'].startswith('python3.')
+
+
+def test_health_warns_when_the_ledger_is_not_persistent(monkeypatch):
+    monkeypatch.delenv('DEPOSIT_LEDGER_DB')
+    response = load_api_module('health').build_health_response()
+
+    assert response['environment_checks']['deposit_ledger_db'] is False
+    assert response['status'] == 'warning'
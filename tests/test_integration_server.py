@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+from admission import AdmissionController
+from loopy_make_integration import MAX_BODY_BYTES, MAX_HEADER_BYTES, IntegrationServer, route_for, webhook
+
+
+@pytest.mark.parametrize('path, route', [
+    ('/health', 'health'), ('/api/health?pretty=1', 'health'), ('/', 'index'), ('/api/index', 'index'),
+    ('/webhook/rewards', 'webhook'), ('/api/webhook', 'webhook'), ('/api/webhookx', None), ('/admin', None)])
+def test_routes_follow_vercel_json(path, route):
+    assert route_for(path) == route
+
+
+def exchange(raw, server=None):
+    """Send raw bytes on one connection and return everything the server wrote back"""
+
+    server = server or IntegrationServer(keepalive_timeout=2.0)
+
+    async def run():
+        server._request_slots = asyncio.Semaphore(server.max_concurrency)
+        listener = await asyncio.start_server(server._handle_connection, '127.0.0.1', 0, limit=MAX_HEADER_BYTES)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(raw)
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return data
+        finally:
+            listener.close()
+            await listener.wait_closed()
+
+    return asyncio.run(run()), server
+
+
+def responses(data):
+    """(status, headers, body) for each Content-Length framed response"""
+
+    found = []
+    while data:
+        head, data = data.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        length = int(headers['Content-Length'])
+        found.append((int(lines[0].split(' ')[1]), headers, data[:length]))
+        data = data[length:]
+    return found
+
+
+def test_keep_alive_serves_several_requests_on_one_connection():
+    data, server = exchange(b'GET /api/index HTTP/1.1\r\nHost: test\r\n\r\n'
+                            b'GET /api/index HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n')
+
+    first, second = responses(data)
+    assert (first[0], first[1]['Connection']) == (200, 'keep-alive')
+    assert (second[0], second[1]['Connection']) == (200, 'close')
+    assert server.requests_served == 2
+
+
+def test_shed_webhook_gets_retry_after_and_closes(monkeypatch):
+    controller = AdmissionController(max_in_flight=1)
+    controller.try_admit('rewards')
+    monkeypatch.setattr(webhook, 'ADMISSION', controller)
+
+    data, _ = exchange(b'POST /webhook/stamp HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}')
+
+    (status, headers, body), = responses(data)
+    assert (status, headers['Retry-After'], headers['Connection']) == (503, '1', 'close')
+    assert json.loads(body)['status'] == 'rejected'
+
+
+def test_oversized_webhook_body_is_refused():
+    data, _ = exchange(b'POST /webhook/stamp HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (MAX_BODY_BYTES + 1))
+
+    (status, _, body), = responses(data)
+    assert status == 413
+    assert json.loads(body)['message'] == 'Request body too large'
+
+
+def test_draining_server_turns_new_connections_away():
+    server = IntegrationServer()
+    server.draining = True
+
+    # Answered as soon as the connection is accepted, before any request is read
+    data, _ = exchange(b'', server)
+
+    (status, headers, _), = responses(data)
+    assert (status, headers['Retry-After']) == (503, '1')
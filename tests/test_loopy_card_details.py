@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from conftest import make_card
+from loopy_card_details import CardDetailFetcher, CardDetailStore
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class StaticToken:
+    last_error = None
+
+    def get_token(self, force_refresh=False):
+        return 'token'
+
+
+class FakeLoopyCards:
+    """/card/{id}?includeEvents=true that tracks how many requests overlap"""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        card_id = url.rsplit('/', 1)[1]
+        with self._lock:
+            self.requests.append(card_id)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        if card_id in self.missing:
+            return FakeResponse(404)
+        return FakeResponse(200, dict(make_card(card_id, stamps=5), events=[{'type': 'stamp'}]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CardDetailStore(str(tmp_path / 'details.db'))
+
+
+def fetcher(loopy, store, **options):
+    return CardDetailFetcher(concurrency=4, store=store, session=loopy, token_cache=StaticToken(), **options)
+
+
+def test_cards_are_fetched_concurrently_and_a_missing_card_stops_nothing(store):
+    loopy = FakeLoopyCards(missing={'card-3'})
+    card_ids = [f'card-{n}' for n in range(20)] + ['card-1', '', None]
+
+    results = {detail.card_id: detail for detail in fetcher(loopy, store).fetch(card_ids)}
+
+    assert len(results) == 20 and len(loopy.requests) == 20
+    assert 2 <= loopy.max_in_flight <= 4
+    assert results['card-3'].error == 'card not found'
+    assert results['card-0'].events == [{'type': 'stamp'}]
+
+
+def test_stored_cards_are_not_fetched_again(store):
+    loopy = FakeLoopyCards()
+    list(fetcher(loopy, store).fetch(['card-1', 'card-2']))
+
+    again = fetcher(loopy, store)
+    assert [detail.source for detail in again.fetch(['card-1', 'card-2'])] == ['store', 'store']
+    assert again.stats == {'requested': 2, 'from_store': 2, 'fetched': 0, 'errors': 0}
+    assert len(loopy.requests) == 2
+
+    list(fetcher(loopy, store, refresh=True).fetch(['card-1']))
+    list(fetcher(loopy, store, max_age=0).fetch(['card-2']))
+    assert len(loopy.requests) == 4
+
+
+def test_failed_cards_are_not_stored(store):
+    list(fetcher(FakeLoopyCards(missing={'card-9'}), store).fetch(['card-9']))
+    assert store.get('card-9') is None
@@ -0,0 +1,123 @@
+import json
+import time
+
+import pytest
+
+from loopy_discovery import EndpointDiscovery
+
+BASE_URL = 'https://loopy.test/v1'
+CARDS = '/campaigns/test-campaign/cards'
+CAMPAIGN = '/campaigns/test-campaign'
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class StaticToken:
+    def get_token(self, force_refresh=False):
+        return 'token'
+
+
+class FakeLoopy:
+    """Answers each path with a fixed status; counts the requests"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        path = url[len(BASE_URL):]
+        self.requests.append(path)
+        status = self.statuses.get(path, 404)
+        if status == 200:
+            return FakeResponse(200, {'rows': [{'id': 'card-1'}], 'total_rows': 1})
+        return FakeResponse(status)
+
+
+@pytest.fixture
+def capabilities_file(tmp_path):
+    return str(tmp_path / 'capabilities.json')
+
+
+def discovery(loopy, path, **options):
+    return EndpointDiscovery('test-campaign', base_url=BASE_URL, path=path, session=loopy,
+                             token_cache=StaticToken(), **options)
+
+
+def test_fresh_capabilities_are_not_probed_again(capabilities_file):
+    loopy = FakeLoopy({CARDS: 200})
+    first = discovery(loopy, capabilities_file).working(['/campaigns/{campaign_id}/cards'])
+    probes = len(loopy.requests)
+
+    again = discovery(loopy, capabilities_file)
+    working = again.working(['/campaigns/{campaign_id}/cards'])
+
+    assert [(c.path, c.shape, c.pagination) for c in first] == [(CARDS, 'rows', 'offset')]
+    assert [c.path for c in working] == [CARDS]
+    assert len(loopy.requests) == probes
+    assert again.stats == {'probed': 0, 'from_file': 1}
+
+
+def test_expired_capabilities_are_probed_again(capabilities_file):
+    loopy = FakeLoopy({CARDS: 200})
+    discovery(loopy, capabilities_file).discover([CARDS])
+    with open(capabilities_file) as f:
+        saved = json.load(f)
+    saved['endpoints'][CARDS]['probed_at'] = time.time() - 120
+    with open(capabilities_file, 'w') as f:
+        json.dump(saved, f)
+
+    probes = len(loopy.requests)
+    later = discovery(loopy, capabilities_file, ttl=60)
+    later.discover([CARDS])
+
+    assert len(loopy.requests) > probes
+    assert later.stats['from_file'] == 0
+
+
+def test_endpoint_that_starts_refusing_is_forgotten(capabilities_file):
+    loopy = FakeLoopy({CARDS: 200, CAMPAIGN: 200})
+    first = discovery(loopy, capabilities_file)
+    first.discover([CARDS, CAMPAIGN])
+
+    # The next run trusts the file, then Loopy withdraws one endpoint
+    loopy.statuses.update({CARDS: 401, CAMPAIGN: 404})
+    run = discovery(loopy, capabilities_file)
+    cards, campaign = run.working([CARDS, CAMPAIGN])
+    assert run.fetch(cards) is None
+    assert run.fetch(campaign) is None
+
+    with open(capabilities_file) as f:
+        assert json.load(f)['endpoints'] == {}
+    next_run = discovery(loopy, capabilities_file)
+    next_run.discover([CARDS, CAMPAIGN])
+    assert next_run.stats['from_file'] == 0
+
+
+def test_server_errors_are_not_recorded(capabilities_file):
+    loopy = FakeLoopy({CARDS: 503})
+    first = discovery(loopy, capabilities_file)
+
+    assert first.discover([CARDS]) == []
+
+    loopy.statuses[CARDS] = 200
+    assert [c.path for c in discovery(loopy, capabilities_file).working([CARDS])] == [CARDS]
+
+
+def test_capabilities_of_another_host_are_discarded(capabilities_file):
+    loopy = FakeLoopy({CARDS: 200})
+    discovery(loopy, capabilities_file).discover([CARDS])
+    probes = len(loopy.requests)
+
+    staging = EndpointDiscovery('test-campaign', base_url='https://staging.loopy.test/v1', path=capabilities_file,
+                                session=loopy, token_cache=StaticToken())
+
+    staging.discover([CARDS])
+    assert staging.stats['from_file'] == 0
+    assert len(loopy.requests) > probes
@@ -0,0 +1,117 @@
+import pytest
+
+import loopy_sync
+from loopy_sync import IncrementalSync, SyncState
+
+
+class FakePager:
+    """Pages of cards handed out in a chosen completion order"""
+
+    pages = []
+    order = None
+
+    def __init__(self, campaign_id, params=None, page_size=2):
+        self.page_size = page_size
+        self.stopped = False
+        self.read = 0
+
+    def stop(self):
+        self.stopped = True
+
+    def iter_pages(self):
+        order = self.order or range(len(self.pages))
+        for number, index in enumerate(order):
+            if number and self.stopped:
+                return
+            self.read += 1
+            yield index * self.page_size, self.pages[index]
+
+    def stats(self):
+        return {'pages': self.read, 'rows': 0, 'seconds': 0.0, 'stopped_early': self.stopped}
+
+
+def card(card_id, date=None, stamps=12):
+    return {'id': card_id, 'totalStampsEarned': stamps, 'lastStampEarnedDate': date}
+
+
+@pytest.fixture
+def sync(tmp_path, monkeypatch):
+    monkeypatch.setattr(loopy_sync, 'LoopyCardPager', FakePager)
+    FakePager.order = None
+    return IncrementalSync('test-campaign', state=SyncState(str(tmp_path / 'sync.json')), overlap_seconds=300)
+
+
+def run(sync, pages, order=None):
+    FakePager.pages = pages
+    FakePager.order = order
+    delivered = []
+    stats = sync.run(lambda c: delivered.append(c['id']))
+    return delivered, stats
+
+
+def test_watermark_is_the_newest_stamp_date(sync):
+    delivered, stats = run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('b', '2025-06-03T09:00:00Z')]])
+
+    assert delivered == ['a', 'b']
+    assert stats['watermark'] == '2025-06-03T10:00:00Z'
+    assert sync.state.watermark('test-campaign').hour == 10
+
+
+def test_overlap_redelivers_nothing_but_catches_late_stamps(sync):
+    run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('b', '2025-06-03T09:00:00Z')]])
+
+    # 'c' was written late with a stamp date inside the overlap; 'b' is before the cutoff
+    delivered, stats = run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('c', '2025-06-03T09:58:00Z')],
+                                  [card('b', '2025-06-03T09:00:00Z')]])
+
+    assert delivered == ['c']
+    assert (stats['skipped_duplicate'], stats['skipped_old']) == (1, 1)
+
+
+def test_sorted_pages_stop_early_once_past_the_cutoff(sync):
+    run(sync, [[card('a', '2025-06-03T10:00:00Z')]])
+
+    pages = [[card('n', '2025-06-03T11:00:00Z'), card('a', '2025-06-03T10:00:00Z')],
+             [card('x', '2025-06-02T10:00:00Z'), card('y', '2025-06-02T09:00:00Z')],
+             [card('z', '2025-06-01T10:00:00Z'), card('w', '2025-06-01T09:00:00Z')]]
+    delivered, stats = run(sync, pages)
+
+    assert delivered == ['n']
+    assert stats['pages'] == 2
+    assert stats['watermark'] == '2025-06-03T11:00:00Z'
+
+
+def test_a_page_with_one_dated_card_proves_no_ordering(sync):
+    run(sync, [[card('a', '2025-06-03T10:00:00Z')]])
+
+    # Nothing has been compared when the first page arrives, so the run must go on
+    pages = [[card('old', '2025-06-01T10:00:00Z'), card('undated', stamps=0)],
+             [card('new', '2025-06-03T11:00:00Z'), card('b', '2025-06-01T09:00:00Z')]]
+    delivered, stats = run(sync, pages)
+
+    assert delivered == ['new']
+    assert stats['pages'] == 2
+    assert stats['server_sorted'] is False
+
+
+def test_pages_out_of_order_across_pages_are_not_trusted(sync):
+    run(sync, [[card('a', '2025-06-03T10:00:00Z')]])
+
+    # Each page is sorted on its own, but page 1 is newer than page 0
+    pages = [[card('p', '2025-06-02T10:00:00Z'), card('q', '2025-06-02T09:00:00Z')],
+             [card('r', '2025-06-03T11:00:00Z'), card('s', '2025-06-03T10:30:00Z')],
+             [card('t', '2025-06-03T12:00:00Z'), card('u', '2025-06-01T09:00:00Z')]]
+    delivered, stats = run(sync, pages, order=[1, 0, 2])
+
+    assert sorted(delivered) == ['r', 's', 't']
+    assert stats['server_sorted'] is False
+
+
+def test_undated_cards_are_delivered_when_their_stamps_change(sync):
+    run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('imported', stamps=12)]])
+
+    unchanged, _ = run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('imported', stamps=12)]])
+    stamped, _ = run(sync, [[card('a', '2025-06-03T10:00:00Z'), card('imported', stamps=24)]])
+
+    assert unchanged == []
+    assert stamped == ['imported']
@@ -0,0 +1,108 @@
+import base64
+import json
+import os
+import threading
+import time
+
+from loopy_token_cache import LoopyTokenCache, decode_jwt_expiry
+
+
+def make_jwt(expires_in, subject='bird'):
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    return f"{part({'alg': 'HS256'})}.{part({'sub': subject, 'exp': int(time.time() + expires_in)})}.signature"
+
+
+class LoginResponse:
+    def __init__(self, status_code, token=None):
+        self.status_code = status_code
+        self._token = token
+
+    def json(self):
+        return {'token': self._token}
+
+
+class FakeLoopyLogin:
+    """Login endpoint handing out a new token per call; can be held open with `gate`"""
+
+    def __init__(self, expires_in=3600, status_code=200):
+        self.expires_in = expires_in
+        self.status_code = status_code
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.calls += 1
+        self.gate.wait(5)
+        return LoginResponse(self.status_code, make_jwt(self.expires_in, subject=f'login-{self.calls}'))
+
+
+def make_cache(login, **options):
+    options.setdefault('persist_path', '')
+    return LoopyTokenCache(username='bird', password='secret', session=login, **options)
+
+
+def test_concurrent_callers_share_one_login():
+    login = FakeLoopyLogin()
+    login.gate.clear()
+    cache = make_cache(login)
+    tokens = []
+
+    threads = [threading.Thread(target=lambda: tokens.append(cache.get_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced_waits'] < 7:
+        time.sleep(0.01)
+    login.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert login.calls == 1
+    assert len(set(tokens)) == 1 and tokens[0]
+    assert cache.get_token() == tokens[0]
+    assert cache.stats()['hits'] == 1
+
+
+def test_token_near_expiry_is_served_while_it_refreshes_in_the_background():
+    login = FakeLoopyLogin(expires_in=60)
+    cache = make_cache(login, refresh_margin=300)
+    first = cache.get_token()
+
+    login.gate.clear()
+    assert cache.get_token() == first
+    assert cache.stats()['proactive_refreshes'] == 1
+    login.gate.set()
+
+    deadline = time.time() + 5
+    while cache.peek() == first and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.peek() != first
+    assert login.calls == 2
+
+
+def test_failed_login_returns_none_and_says_why():
+    cache = make_cache(FakeLoopyLogin(status_code=401))
+
+    assert cache.get_token() is None
+    assert cache.stats()['last_error'] == 'Loopy login failed: 401'
+
+
+def test_expiry_is_read_from_the_jwt_exp_claim():
+    token = make_jwt(120)
+    assert abs(decode_jwt_expiry(token) - (time.time() + 120)) < 2
+    assert decode_jwt_expiry('not-a-jwt') is None
+
+
+def test_persisted_token_is_reused_by_the_next_process(tmp_path):
+    path = str(tmp_path / 'loopy_token.json')
+    login = FakeLoopyLogin()
+    token = make_cache(login, persist_path=path).get_token()
+
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert make_cache(login, persist_path=path).get_token() == token
+    assert login.calls == 1
+
+    # Another account never adopts the file
+    other = LoopyTokenCache(username='someone-else', password='secret', session=login, persist_path=path)
+    assert other.get_token() != token
@@ -0,0 +1,18 @@
+from munch_directory import MunchDirectory
+
+
+def test_first_customer_with_an_email_wins():
+    directory = MunchDirectory.from_users([
+        {'id': 'first', 'email': 'thandi@example.co.za', 'firstName': 'Thandi'},
+        {'id': 'second', 'email': ' Thandi@Example.co.za ', 'firstName': 'Duplicate'},
+    ])
+
+    assert len(directory) == 1
+    assert directory.find_by_email('THANDI@example.co.za')['id'] == 'first'
+
+
+def test_customers_without_an_email_are_skipped():
+    directory = MunchDirectory.from_users([{'id': 'walk-in', 'email': None}, {'id': 'blank', 'email': '  '}])
+
+    assert len(directory) == 0
+    assert directory.find_by_email('') is None
@@ -0,0 +1,54 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from priority_lanes import LaneScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = LaneScheduler(workers=1, name='test-lanes')
+    yield scheduler
+    scheduler.shutdown()
+
+
+def dispatch_order(scheduler, counts):
+    """Queue counts[lane] items behind a blocked worker, then return the lanes in run order"""
+
+    gate = threading.Event()
+    order = []
+    blocker = scheduler.submit('rewards', gate.wait)
+
+    futures = [scheduler.submit(lane, order.append, lane)
+               for lane, count in counts.items() for _ in range(count)]
+    gate.set()
+    blocker.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+def test_busy_lanes_share_dispatches_six_three_one(scheduler):
+    order = dispatch_order(scheduler, {'rewards': 120, 'stamp': 60, 'enrolled': 20})
+
+    for start in range(0, 200, 10):
+        assert Counter(order[start:start + 10]) == {'rewards': 6, 'stamp': 3, 'enrolled': 1}
+
+    metrics = scheduler.get_metrics()['lanes']
+    assert metrics['enrolled']['guaranteed_share'] == 0.1
+    assert metrics['enrolled']['dispatched'] == 20
+
+
+def test_reward_flood_does_not_starve_enrolled_events(scheduler):
+    order = dispatch_order(scheduler, {'rewards': 600, 'enrolled': 10})
+
+    # With only rewards (6) and enrolled (1) waiting, enrolled gets 1 in every 7
+    last_enrolled = max(i for i, lane in enumerate(order) if lane == 'enrolled')
+    assert last_enrolled < 70
+    assert Counter(order[:70])['enrolled'] == 10
+
+
+def test_idle_lanes_do_not_hold_back_a_busy_one(scheduler):
+    order = dispatch_order(scheduler, {'enrolled': 5})
+    assert order == ['enrolled'] * 5
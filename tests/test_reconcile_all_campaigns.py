@@ -0,0 +1,112 @@
+import multiprocessing
+import threading
+
+import pytest
+
+import reconcile_all_campaigns
+from reconcile_all_campaigns import FairRateBudget
+
+
+def start_watcher(monkeypatch):
+    stop, done, stopping = threading.Event(), threading.Event(), threading.Event()
+    monkeypatch.setattr(reconcile_all_campaigns, '_stop', stop)
+    monkeypatch.setattr(reconcile_all_campaigns, 'STOP_POLL_SECONDS', 0.01)
+    watcher = threading.Thread(target=reconcile_all_campaigns._watch_stop, args=(done, stopping), daemon=True)
+    watcher.start()
+    return stop, done, stopping, watcher
+
+
+def test_watcher_exits_when_the_campaign_finishes(monkeypatch):
+    stop, done, stopping, watcher = start_watcher(monkeypatch)
+
+    done.set()
+    watcher.join(timeout=1)
+
+    assert not watcher.is_alive()
+    assert not stopping.is_set()
+
+
+def test_watcher_passes_a_stop_request_on(monkeypatch):
+    stop, done, stopping, watcher = start_watcher(monkeypatch)
+
+    stop.set()
+    watcher.join(timeout=1)
+
+    assert not watcher.is_alive()
+    assert stopping.is_set()
+
+
+class FakeClock:
+    """time.monotonic / time.sleep that only move when someone sleeps"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(reconcile_all_campaigns.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(reconcile_all_campaigns.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_requests_are_spaced_by_the_running_campaigns(clock):
+    active = multiprocessing.Value('i', 0)
+    budget = FairRateBudget(10, active)
+    budget.join()
+    FairRateBudget(10, active).join()
+
+    for _ in range(4):
+        budget.acquire()
+
+    # Two campaigns share 10 requests/s: each sends one every 0.2s
+    assert clock.sleeps == [0.2, 0.2, 0.2]
+    assert budget.requests == 4
+    assert round(budget.waited, 6) == 0.6
+
+
+def test_spacing_narrows_when_a_campaign_finishes(clock):
+    active = multiprocessing.Value('i', 0)
+    budget, other = FairRateBudget(10, active), FairRateBudget(10, active)
+    budget.join()
+    other.join()
+
+    budget.acquire()
+    budget.acquire()
+    other.leave()
+    budget.acquire()
+    budget.acquire()
+
+    assert clock.sleeps == [0.2, 0.2, 0.1]
+    assert active.value == 1
+
+
+def test_idle_time_is_not_saved_up_as_a_burst(clock):
+    active = multiprocessing.Value('i', 0)
+    budget = FairRateBudget(10, active)
+    budget.join()
+
+    budget.acquire()
+    clock.now += 5
+    budget.acquire()
+    budget.acquire()
+
+    assert clock.sleeps == [0.1]
+
+
+def test_no_rate_means_no_waiting(clock):
+    budget = FairRateBudget(0, multiprocessing.Value('i', 3))
+
+    for _ in range(5):
+        budget.acquire()
+
+    assert clock.sleeps == []
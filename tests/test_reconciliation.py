@@ -0,0 +1,186 @@
+import pytest
+
+from conftest import make_card
+from deposit_ledger import NOT_PERSISTENT_ERROR, DepositLedger
+from munch_directory import MunchDirectory
+from reconciliation import Reconciler, reconcile_campaign
+from secure_munch_integration import SecureMunchIntegration
+
+USERS = [
+    {'id': 'munch-thandi', 'email': 'Thandi@Example.co.za', 'firstName': 'Thandi', 'lastName': 'Nkosi'},
+    {'id': 'munch-sipho', 'email': 'sipho@example.co.za', 'firstName': 'Sipho', 'lastName': 'Dlamini'},
+    {'id': 'munch-lerato', 'email': 'lerato@example.co.za', 'firstName': 'Lerato', 'lastName': 'Mokoena'},
+    {'id': 'munch-anon', 'email': '', 'firstName': 'Walk-in', 'lastName': ''},
+]
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeMunch:
+    """Munch stand-in: the customer list and a deposit endpoint that counts payments"""
+
+    def __init__(self):
+        self.deposits = []
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        if url.endswith('/account/retrieve-users'):
+            return FakeResponse(200, {'data': USERS})
+        self.deposits.append(json)
+        return FakeResponse(200, {'id': f'deposit-{len(self.deposits)}'})
+
+
+def start_service(munch, db_path):
+    """A fresh process: new integration, new ledger connection on the same database"""
+    return SecureMunchIntegration(session=munch, ledger=DepositLedger(db_path))
+
+
+def test_nothing_is_paid_twice_after_a_restart(tmp_path):
+    munch = FakeMunch()
+    db_path = str(tmp_path / 'ledger.db')
+    cards = [make_card('card-1', stamps=24)]
+
+    first = reconcile_campaign('test-campaign', deposit=True, cards=cards, integration=start_service(munch, db_path))
+    assert first['deposited'] == 1
+    assert [deposit['amount'] for deposit in munch.deposits] == [8000]
+
+    again = reconcile_campaign('test-campaign', deposit=True, cards=cards, integration=start_service(munch, db_path))
+    assert again['deposited'] == 0
+    assert again['stats']['settled'] == 1
+    assert len(munch.deposits) == 1
+
+
+def test_only_new_stamps_are_paid_after_a_restart(tmp_path):
+    munch = FakeMunch()
+    db_path = str(tmp_path / 'ledger.db')
+
+    reconcile_campaign('test-campaign', deposit=True, cards=[make_card('card-1', stamps=12)],
+                       integration=start_service(munch, db_path))
+    reconcile_campaign('test-campaign', deposit=True, cards=[make_card('card-1', stamps=24)],
+                       integration=start_service(munch, db_path))
+
+    assert [deposit['amount'] for deposit in munch.deposits] == [4000, 4000]
+
+
+def test_deposit_interrupted_before_recording_is_not_resent(tmp_path):
+    munch = FakeMunch()
+    db_path = str(tmp_path / 'ledger.db')
+    # The previous process claimed the deposit and died before recording the credit
+    DepositLedger(db_path).claim_event('credit:card-1:2', 'card-1')
+
+    integration = start_service(munch, db_path)
+    owed, = Reconciler(MunchDirectory.from_users(USERS), ledger=integration.ledger).reconcile(
+        [make_card('card-1', stamps=24)], 'test-campaign')
+    result = Reconciler(None, ledger=integration.ledger).settle(owed, integration)
+
+    assert result['needs_review'] is True
+    assert munch.deposits == []
+
+
+def test_deposits_are_refused_without_a_persistent_ledger(monkeypatch):
+    monkeypatch.delenv('DEPOSIT_LEDGER_DB')
+    munch = FakeMunch()
+    integration = SecureMunchIntegration(session=munch)
+
+    assert integration.ledger.persistent is False
+    result = reconcile_campaign('test-campaign', deposit=True, cards=[make_card(stamps=24)], integration=integration)
+    assert result == {'success': False, 'error': NOT_PERSISTENT_ERROR}
+    assert integration.deposit_reward('munch-thandi', 4000, 'card-1', 'thandi@example.co.za', 1)['success'] is False
+    assert munch.deposits == []
+
+
+@pytest.mark.parametrize('directory', [USERS, MunchDirectory.from_users(USERS)], ids=['cards-build', 'directory-build'])
+def test_both_build_sides_find_the_same_rewards(tmp_path, directory):
+    cards = [
+        make_card('card-1', stamps=24, email='thandi@example.co.za'),
+        make_card('card-2', stamps=5, email='sipho@example.co.za'),
+        make_card('card-3', stamps=12, email='nobody@example.co.za'),
+    ]
+    reconciler = Reconciler(directory, ledger=DepositLedger(str(tmp_path / 'ledger.db')))
+    assert len(cards) < len(USERS)
+
+    owed = [(o.card_id, o.customer_id, o.owed_rewards) for o in reconciler.reconcile(cards, 'test-campaign')]
+
+    assert owed == [('card-1', 'munch-thandi', 2)]
+    assert (reconciler.stats['nothing_earned'], reconciler.stats['unmatched']) == (1, 1)
+
+
+class UnansweredMunch(FakeMunch):
+    """Munch accepts the deposit but the answer never reaches us"""
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        response = super().post(url, headers, json, timeout)
+        if not url.endswith('/account/retrieve-users'):
+            raise TimeoutError('read timed out')
+        return response
+
+
+class RefusingMunch(FakeMunch):
+    def post(self, url, headers=None, json=None, timeout=None):
+        if url.endswith('/account/retrieve-users'):
+            return super().post(url, headers, json, timeout)
+        self.deposits.append(json)
+        return FakeResponse(500, {})
+
+
+def webhook_event(stamps=24):
+    return {'card': make_card('card-1', stamps=stamps), 'campaign': {'id': 'test-campaign'}}
+
+
+def test_webhook_deposit_that_got_no_answer_is_not_paid_again(tmp_path):
+    munch = UnansweredMunch()
+    integration = start_service(munch, str(tmp_path / 'ledger.db'))
+
+    assert integration.process_legitimate_reward(webhook_event())['success'] is False
+    retry = integration.process_legitimate_reward(webhook_event())
+
+    assert retry['needs_review'] is True
+    assert len(munch.deposits) == 1
+
+
+def test_webhook_deposit_refused_by_munch_is_retried(tmp_path):
+    munch = RefusingMunch()
+    integration = start_service(munch, str(tmp_path / 'ledger.db'))
+
+    assert integration.process_legitimate_reward(webhook_event())['response_code'] == 500
+    assert integration.process_legitimate_reward(webhook_event())['response_code'] == 500
+    assert len(munch.deposits) == 2
+
+
+def test_each_owed_reward_is_settled_as_it_is_found(tmp_path):
+    munch = FakeMunch()
+    seen = []
+    cards = (make_card(card_id, stamps=24, email=email)
+             for card_id, email in [('card-1', 'thandi@example.co.za'), ('card-2', 'sipho@example.co.za')])
+
+    result = reconcile_campaign('test-campaign', deposit=True, cards=cards,
+                                integration=start_service(munch, str(tmp_path / 'ledger.db')),
+                                on_owed=lambda owed, paid: seen.append((owed.card_id, paid['success'])))
+
+    assert seen == [('card-1', True), ('card-2', True)]
+    assert 'owed' not in result
+    assert result['deposited'] == 2
+
+
+def test_busy_customer_fails_only_that_card(tmp_path):
+    from customer_lock import CustomerLock
+
+    munch = FakeMunch()
+    integration = start_service(munch, str(tmp_path / 'ledger.db'))
+    integration.customer_lock.timeout = 0.05
+    cards = [make_card('card-1', stamps=24, email='thandi@example.co.za'),
+             make_card('card-2', stamps=24, email='sipho@example.co.za')]
+
+    # Another worker is paying Thandi for the whole run
+    with CustomerLock().hold('thandi@example.co.za'):
+        result = reconcile_campaign('test-campaign', deposit=True, cards=cards, integration=integration)
+
+    assert result['success'] is True
+    assert (result['deposited'], result['failed']) == (1, 1)
+    assert [deposit['amount'] for deposit in munch.deposits] == [8000]
@@ -0,0 +1,45 @@
+import pytest
+
+from app_config import reset_config
+from reward_rules import RuleEngine, set_rule_engine
+
+
+@pytest.fixture
+def engine():
+    engine = RuleEngine.from_env()
+    set_rule_engine(engine)
+    yield engine
+    set_rule_engine(None)
+    reset_config()
+
+
+def test_configured_campaign_is_paid(engine):
+    reward = engine.evaluate('test-campaign', 12)
+    assert (reward.rewards, reward.value_cents) == (1, 4000)
+
+
+def test_unconfigured_campaign_gets_no_rule(engine):
+    assert engine.rule_for('SOME-OTHER-STORE') is None
+    assert engine.evaluate('SOME-OTHER-STORE', 120) is None
+
+
+def test_no_campaign_id_means_no_rules(monkeypatch):
+    monkeypatch.delenv('CAMPAIGN_ID')
+    reset_config()
+    try:
+        engine = RuleEngine.from_env()
+    finally:
+        monkeypatch.undo()
+        reset_config()
+
+    assert engine.campaign_ids == []
+    assert engine.rule_for(None) is None
+    assert engine.evaluate('any-campaign', 120) is None
+
+
+def test_discover_campaigns_skips_unconfigured_campaigns(engine):
+    from reconcile_all_campaigns import discover_campaigns
+
+    runnable, skipped = discover_campaigns(['test-campaign', 'SOME-OTHER-STORE'])
+    assert runnable == ['test-campaign']
+    assert [entry['campaign_id'] for entry in skipped] == ['SOME-OTHER-STORE']
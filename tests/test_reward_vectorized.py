@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from benchmark_rewards import CAMPAIGN_ID, make_columns
+from reward_rules import CompiledRule
+from reward_vectorized import CampaignColumns, compute_rewards_loop, compute_rewards_vectorized
+
+pytest.importorskip('numpy')
+
+RULES = {
+    'coffee': CompiledRule(CAMPAIGN_ID, 'Coffee card', 12,
+                           [{'stamps': 12, 'value_cents': 4000, 'label': 'free coffee'}]),
+    'tiered': CompiledRule(CAMPAIGN_ID, 'Tiered card', 10,
+                           [{'stamps': 5, 'value_cents': 1500, 'label': 'pastry'},
+                            {'stamps': 10, 'value_cents': 4000, 'label': 'free coffee'}]),
+}
+
+
+@pytest.mark.parametrize('rule', RULES.values(), ids=list(RULES))
+def test_loop_and_vectorized_agree_card_by_card(rule):
+    lists = make_columns(random.Random(7), 5000)
+    # Cards paid more than the rule allows and cards with negative counts are edge cases too
+    lists.credited_cents[0] = 10 ** 6
+    lists.stamps[1] = -3
+    arrays = CampaignColumns(CAMPAIGN_ID, lists.card_ids, lists.stamps, lists.reported_rewards,
+                             lists.redeemed_rewards, lists.credited_rewards, lists.credited_cents)
+
+    loop = compute_rewards_loop(lists, rule)
+    vectorized = compute_rewards_vectorized(arrays, rule)
+
+    for name in ('earned_rewards', 'earned_cents', 'owed_rewards', 'owed_cents'):
+        assert getattr(vectorized, name).tolist() == getattr(loop, name), name
+    for name, flags in loop.flags.items():
+        assert vectorized.flags[name].tolist() == flags, name
+    loop_totals, vectorized_totals = loop.totals(), vectorized.totals()
+    assert {k: v for k, v in loop_totals.items() if k != 'backend'} == \
+        {k: v for k, v in vectorized_totals.items() if k != 'backend'}
+    assert loop.owed_card_ids() == vectorized.owed_card_ids()
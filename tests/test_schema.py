@@ -0,0 +1,67 @@
+import pytest
+
+import loopy_schema
+from app_config import reset_config
+from conftest import make_card
+from loopy_schema import LoopySchemaError, compile_schema
+from reward_rules import RuleEngine, set_rule_engine
+
+DEPOSIT_FIELDS = ('card_id', 'email', 'campaign_id')
+
+
+@pytest.fixture
+def fresh_deposit_validator(monkeypatch):
+    monkeypatch.setattr(loopy_schema, '_deposit_validator', None)
+    yield
+    set_rule_engine(None)
+    reset_config()
+
+
+def test_unknown_campaign_is_rejected(fresh_deposit_validator):
+    with pytest.raises(LoopySchemaError, match='unknown campaign SOME-OTHER-STORE'):
+        loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='SOME-OTHER-STORE')})
+
+
+def test_configured_campaign_is_accepted(fresh_deposit_validator):
+    event = loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='test-campaign')})
+    assert event.campaign_id == 'test-campaign'
+
+
+def test_no_configured_campaigns_rejects_every_campaign():
+    validator = compile_schema(required=DEPOSIT_FIELDS, campaigns=())
+    with pytest.raises(LoopySchemaError, match='unknown campaign'):
+        validator.validate({'card': make_card(campaign_id='test-campaign')})
+
+
+def test_deposit_validator_fails_closed_without_campaign_id(fresh_deposit_validator, monkeypatch):
+    monkeypatch.delenv('CAMPAIGN_ID')
+    reset_config()
+    assert RuleEngine.from_env().campaign_ids == []
+    set_rule_engine(RuleEngine.from_env())
+    with pytest.raises(LoopySchemaError):
+        loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='any-campaign')})
+
+
+def test_webhook_validator_accepts_any_campaign():
+    event = loopy_schema.webhook_validator().validate({'card': make_card(campaign_id='SOME-OTHER-STORE')})
+    assert event.campaign_id == 'SOME-OTHER-STORE'
+
+
+def test_deposit_validator_follows_reloaded_rules(fresh_deposit_validator):
+    loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='test-campaign')})
+
+    # warm_state reloads REWARD_RULES_FILE and installs a new engine
+    set_rule_engine(RuleEngine.from_config({'campaigns': {'NEW-STORE': {}}}))
+
+    event = loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='NEW-STORE')})
+    assert event.campaign_id == 'NEW-STORE'
+    with pytest.raises(LoopySchemaError, match='unknown campaign test-campaign'):
+        loopy_schema.deposit_validator().validate({'card': make_card(campaign_id='test-campaign')})
+
+
+def test_empty_email_falls_through_to_the_next_alias():
+    card = make_card(email='')
+    card['customerDetails']['Email address'] = '  '
+    card['customerDetails']['Email'] = 'Thandi@Example.co.za'
+
+    assert loopy_schema.webhook_validator().validate({'card': card}).email == 'thandi@example.co.za'
@@ -0,0 +1,77 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import ROOT_DIR
+from vercel_local_runtime import STATS_PATH, FunctionLoader, VercelRouteTable, make_server
+
+VERCEL_JSON = os.path.join(ROOT_DIR, 'vercel.json')
+
+
+@pytest.mark.parametrize('path, resolved', [
+    ('/health', ('/health', 'api/health')),
+    ('/webhook/rewards', ('/webhook/(.*)', 'api/webhook')),
+    ('/api/webhook/stamp?x=1', ('/api/webhook/(.*)', 'api/webhook')),
+    ('/', ('/', 'api/index')),
+    ('/api/health', ('/api/(.*)', 'api/health')),
+    ('/elsewhere', None)])
+def test_routes_are_read_from_vercel_json(path, resolved):
+    assert VercelRouteTable(VERCEL_JSON).resolve(path) == resolved
+
+
+def test_functions_outside_the_repository_are_not_loaded():
+    loader = FunctionLoader(ROOT_DIR)
+    assert loader.handler_class('api/../../etc/passwd') is None
+    assert loader.handler_class('api/missing') is None
+    assert loader.handler_class('api/index') is loader.handler_class('api/index')
+
+
+@pytest.fixture
+def runtime():
+    server = make_server('127.0.0.1', 0, VERCEL_JSON)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    yield connection
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def request(connection, method, path, body=None, headers=None):
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, response.getheader('Content-Length'), response.read()
+
+
+def test_requests_share_one_connection_and_are_counted(runtime):
+    status, length, body = request(runtime, 'GET', '/')
+    assert status == 200 and int(length) == len(body)
+    sock = runtime.sock
+
+    status, _, body = request(runtime, 'GET', '/webhook/stamp')
+    assert status == 200 and json.loads(body)['status'] == 'ready'
+    assert runtime.sock is sock
+
+    assert request(runtime, 'GET', '/api/missing')[0] == 404
+
+    _, _, body = request(runtime, 'GET', STATS_PATH)
+    stats = json.loads(body)
+    assert stats['/']['count'] == 1
+    assert stats['/webhook/(.*)']['status_codes'] == {'200': 1}
+
+
+def test_chunked_request_bodies_reach_the_function(runtime):
+    body = b'{"event": "card.enrolled"}'
+    # http.client sends an iterable body with Transfer-Encoding: chunked
+    chunks = iter([body[:10], body[10:]])
+
+    status, _, reply = request(runtime, 'POST', '/api/webhook/enrolled', body=chunks,
+                               headers={'Content-Type': 'application/json'})
+
+    assert status == 200
+    reply = json.loads(reply)
+    assert (reply['status'], reply['endpoint'], reply['data_received']) == ('success', 'enrolled', True)
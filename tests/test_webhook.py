@@ -0,0 +1,25 @@
+from conftest import FlakyMake, make_card
+
+
+def test_retry_after_failed_forward_is_forwarded_again(webhook, monkeypatch):
+    make = FlakyMake(failures=1)
+    monkeypatch.setattr(webhook.STATE, 'session', lambda name='default', pool_size=10: make)
+    data = {'event': 'rewards.updated', 'card': make_card('card-retry', stamps=24)}
+
+    first = webhook.process_loopy_event('rewards', data, '/api/webhook/rewards')
+    assert first['forwarded_to_make']['success'] is False
+
+    retry = webhook.process_loopy_event('rewards', data, '/api/webhook/rewards')
+    assert retry['status'] == 'success'
+    assert retry['forwarded_to_make']['success'] is True
+    assert make.posts == 2
+
+
+def test_successful_forward_is_not_repeated(webhook, monkeypatch):
+    make = FlakyMake(failures=0)
+    monkeypatch.setattr(webhook.STATE, 'session', lambda name='default', pool_size=10: make)
+    data = {'event': 'rewards.updated', 'card': make_card('card-once', stamps=12)}
+
+    assert webhook.process_loopy_event('rewards', data, '/api/webhook/rewards')['status'] == 'success'
+    assert webhook.process_loopy_event('rewards', data, '/api/webhook/rewards')['status'] == 'duplicate'
+    assert make.posts == 1
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Vercel Local Runtime
+====================
+
+Serve the exact production serverless handlers (api/*.py) on one
+machine, so they can be load-tested without a deploy.
+
+HOW IT WORKS:
+1. Routes are read from vercel.json (`src` regex -> `dest` function)
+2. Each api/<name>.py is loaded once and its `handler` class is
+   invoked per request, just as the Vercel Python runtime does
+3. A threaded HTTP/1.1 server keeps connections alive; handler output
+   is buffered so every response gets a Content-Length
+4. Per-route latency counters are served at /__runtime/stats and
+   printed on shutdown
+
+NOTE: responses are buffered, so the NDJSON bulk endpoint returns its
+results in one piece rather than streaming them.
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from priority_lanes import percentile
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_PATH = '/__runtime/stats'
+
+# Latency samples kept per route for percentiles
+LATENCY_SAMPLES = 5000
+
+
+class VercelRouteTable:
+    """Route matching that follows the `routes` list in vercel.json"""
+
+    def __init__(self, vercel_json_path):
+        with open(vercel_json_path) as f:
+            config = json.load(f)
+
+        self.routes = []
+        for route in config.get('routes', []):
+            pattern = re.compile('^' + route['src'] + '$')
+            self.routes.append((route['src'], pattern, route['dest']))
+
+    def resolve(self, path):
+        """Return (route src, function name) for a request path, or None"""
+
+        path = path.split('?', 1)[0]
+
+        for src, pattern, dest in self.routes:
+            match = pattern.match(path)
+            if match:
+                # Vercel substitutes $1, $2... from the src capture groups
+                dest = re.sub(r'\$(\d+)', lambda m: match.group(int(m.group(1))) or '', dest)
+                return src, dest.strip('/').split('?', 1)[0]
+
+        return None
+
+
+class FunctionLoader:
+    """Load api/<name>.py modules once and hand out their handler classes"""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._modules = {}
+        self._lock = threading.Lock()
+
+    def handler_class(self, function_path):
+        """Handler class for a function path like 'api/webhook', or None"""
+
+        file_path = os.path.normpath(os.path.join(self.root_dir, function_path + '.py'))
+        if not file_path.startswith(self.root_dir + os.sep) or not os.path.isfile(file_path):
+            return None
+
+        with self._lock:
+            module = self._modules.get(file_path)
+            if module is None:
+                name = 'vercel_' + function_path.replace('/', '_')
+                spec = importlib.util.spec_from_file_location(name, file_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                self._modules[file_path] = module
+
+        return getattr(module, 'handler', None)
+
+
+class RouteStats:
+    """Thread-safe per-route latency and status counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, status_code, seconds):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'status_codes': {},
+                    'samples': deque(maxlen=LATENCY_SAMPLES)
+                }
+            stats['count'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['status_codes'][str(status_code)] = stats['status_codes'].get(str(status_code), 0) + 1
+            stats['samples'].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {
+                route: (dict(stats, status_codes=dict(stats['status_codes'])), sorted(stats['samples']))
+                for route, stats in self._routes.items()
+            }
+
+        report = {}
+        for route, (stats, samples) in routes.items():
+            report[route] = {
+                'count': stats['count'],
+                'status_codes': stats['status_codes'],
+                'latency_ms': {
+                    'avg': round(stats['total_seconds'] / stats['count'] * 1000, 3),
+                    'p50': round(percentile(samples, 0.50) * 1000, 3),
+                    'p90': round(percentile(samples, 0.90) * 1000, 3),
+                    'p99': round(percentile(samples, 0.99) * 1000, 3),
+                    'max': round(stats['max_seconds'] * 1000, 3)
+                }
+            }
+        return report
+
+
+def read_chunked(rfile):
+    """Decode a chunked request body"""
+
+    body = io.BytesIO()
+    while True:
+        size = int(rfile.readline().split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            while rfile.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            return body.getvalue()
+        body.write(rfile.read(size))
+        rfile.readline()
+
+
+class RuntimeHandler(BaseHTTPRequestHandler):
+    """Routes requests to the mounted api/*.py handler classes"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately; don't let Nagle delay keep-alive replies
+    disable_nagle_algorithm = True
+
+    # Set by make_server()
+    routes = None
+    loader = None
+    stats = None
+    quiet = True
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_OPTIONS(self):
+        self.dispatch()
+
+    def do_PUT(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def dispatch(self):
+        """Match the route, run the function's handler and relay its response"""
+
+        if self.path.split('?', 1)[0] == STATS_PATH:
+            self.send_raw(200, [('Content-type', 'application/json')],
+                          json.dumps(self.stats.snapshot(), indent=2).encode())
+            return
+
+        resolved = self.routes.resolve(self.path)
+        handler_cls = self.loader.handler_class(resolved[1]) if resolved else None
+
+        if handler_cls is None:
+            self.read_body()
+            self.send_raw(404, [('Content-type', 'application/json')],
+                          json.dumps({'status': 'error', 'message': f'No function for {self.path}'}).encode())
+            return
+
+        route = resolved[0]
+        method = getattr(handler_cls, 'do_' + self.command, None)
+        body = self.read_body()
+
+        if method is None:
+            self.send_raw(405, [('Content-type', 'application/json')],
+                          json.dumps({'status': 'error', 'message': f'{self.command} not supported'}).encode())
+            return
+
+        # Run the production handler against a buffered copy of this request
+        function = handler_cls.__new__(handler_cls)
+        function.__dict__.update(self.__dict__)
+        function.rfile = io.BytesIO(body)
+        function.wfile = io.BytesIO()
+        function._headers_buffer = []
+        function.close_connection = False
+        if self.quiet:
+            function.log_message = lambda *args: None
+
+        started = time.perf_counter()
+        try:
+            method(function)
+            status_code, headers, response_body = self.parse_response(function.wfile.getvalue())
+        except Exception as e:
+            status_code, headers = 500, [('Content-type', 'application/json')]
+            response_body = json.dumps({'status': 'error', 'message': f'Function crashed: {e}'}).encode()
+        elapsed = time.perf_counter() - started
+
+        self.stats.record(route, status_code, elapsed)
+
+        if function.close_connection:
+            self.close_connection = True
+        self.send_raw(status_code, headers, response_body)
+
+    def read_body(self):
+        """Read the whole request body and present it with a Content-Length"""
+
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = read_chunked(self.rfile)
+            del self.headers['Transfer-Encoding']
+            del self.headers['Content-Length']
+            self.headers['Content-Length'] = str(len(body))
+            return body
+
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        return self.rfile.read(length) if length > 0 else b''
+
+    @staticmethod
+    def parse_response(raw):
+        """Split a handler's raw HTTP output into status, headers and body"""
+
+        head, _, body = raw.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status_code = int(lines[0].split(' ', 2)[1]) if lines and lines[0] else 500
+
+        headers = []
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.lower() not in ('content-length', 'connection', 'transfer-encoding', 'server', 'date'):
+                headers.append((name, value.strip()))
+
+        return status_code, headers, body
+
+    def send_raw(self, status_code, headers, body):
+        """Write a complete keep-alive-safe response"""
+
+        self.send_response(status_code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host, port, vercel_json, quiet=True):
+    """Build a threaded server with the vercel.json routes mounted"""
+
+    routes = VercelRouteTable(vercel_json)
+    handler_cls = type('MountedRuntimeHandler', (RuntimeHandler,), {
+        'routes': routes,
+        'loader': FunctionLoader(os.path.dirname(os.path.abspath(vercel_json))),
+        'stats': RouteStats(),
+        'quiet': quiet
+    })
+
+    server = ThreadingHTTPServer((host, port), handler_cls)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """Run the local runtime until Ctrl+C, then print per-route latency"""
+
+    parser = argparse.ArgumentParser(description='Serve api/*.py locally using the vercel.json route table')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=3000, help='Port (default: 3000)')
+    parser.add_argument('--vercel-json', default=os.path.join(ROOT_DIR, 'vercel.json'), help='Route table to load')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    args = parser.parse_args()
+
+    # api/*.py import shared modules from the repository root
+    sys.path.insert(0, ROOT_DIR)
+
+    server = make_server(args.host, args.port, args.vercel_json, quiet=not args.verbose)
+    handler_cls = server.RequestHandlerClass
+
+    print("🧪 VERCEL LOCAL RUNTIME")
+    print("=" * 50)
+    print(f"🔗 http://{args.host}:{args.port}")
+    print(f"📋 Routes from {args.vercel_json}:")
+    for src, _, dest in handler_cls.routes.routes:
+        print(f"   {src} -> {dest}")
+    print(f"📊 Latency stats: http://{args.host}:{args.port}{STATS_PATH}")
+    print()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print("\n📊 PER-ROUTE LATENCY")
+    print("-" * 50)
+    for route, stats in handler_cls.stats.snapshot().items():
+        latency = stats['latency_ms']
+        print(f"{route}: {stats['count']} req | avg {latency['avg']}ms | p50 {latency['p50']}ms | "
+              f"p99 {latency['p99']}ms | max {latency['max']}ms | {stats['status_codes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Warm Container State
+====================
+
+Vercel reuses a function's container for later invocations, and module
+globals survive between them. This module keeps the expensive things
+there instead of rebuilding them on every request:
+
+- pooled HTTP sessions (TCP + TLS connections are reused)
+- the SecureMunchIntegration client
+- the Munch customer directory index
+- the Loopy login token (via loopy_token_cache)
+- the compiled reward rules
+
+HOW IT WORKS:
+1. Each item is a WarmResource: a loader plus a freshness rule (TTL
+   and/or a check such as "rules file unchanged")
+2. get() returns the kept value while it is fresh and reloads it
+   otherwise, so every call validates freshness for the cost of a
+   timestamp comparison
+3. begin_invocation() counts invocations; the first one in a container
+   is cold, every later one is warm. Handlers report this in the
+   X-Container-State response header and /health shows the details
+"""
+
+import os
+import threading
+import time
+
+from app_config import get_config, getenv
+
+class WarmResource:
+    """A lazily loaded value that is reloaded when it goes stale"""
+
+    def __init__(self, name, loader, ttl=None, is_fresh=None):
+        """
+        loader() builds the value (None means "not available, retry next call")
+        ttl: seconds a value stays fresh (None = no expiry)
+        is_fresh(value, loaded_at): extra freshness check
+        """
+
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.is_fresh = is_fresh
+
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+        self.hits = 0
+        self.loads = 0
+        self.failures = 0
+        self.last_load_seconds = 0.0
+        self.last_error = None
+
+    def _fresh(self, now):
+        if self._value is None:
+            return False
+        if self.ttl is not None and now - self._loaded_at > self.ttl:
+            return False
+        if self.is_fresh is not None and not self.is_fresh(self._value, self._loaded_at):
+            return False
+        return True
+
+    def get(self):
+        """Kept value if fresh, otherwise a freshly loaded one (or None)"""
+
+        with self._lock:
+            now = time.time()
+            if self._fresh(now):
+                self.hits += 1
+                return self._value
+
+            started = time.perf_counter()
+            try:
+                value = self.loader()
+            except Exception as e:
+                value = None
+                self.last_error = str(e)
+            self.last_load_seconds = time.perf_counter() - started
+
+            if value is None:
+                self.failures += 1
+                # Keep serving a stale value rather than nothing
+                return self._value
+
+            self._value = value
+            self._loaded_at = time.time()
+            self.loads += 1
+            self.last_error = None
+            return value
+
+    def peek(self):
+        """Current value without loading or validating it"""
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+
+    def status(self):
+        with self._lock:
+            loaded = self._value is not None
+            age = time.time() - self._loaded_at if loaded else None
+            return {
+                'loaded': loaded,
+                'fresh': self._fresh(time.time()),
+                'age_seconds': round(age, 1) if age is not None else None,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'loads': self.loads,
+                'failures': self.failures,
+                'last_load_ms': round(self.last_load_seconds * 1000, 1),
+                'last_error': self.last_error
+            }
+
+
+class WarmState:
+    """Everything a container keeps between invocations"""
+
+    def __init__(self):
+        self.created_at = time.time()
+        self.invocations = 0
+        self.warm_invocations = 0
+        self.resources = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def register(self, resource):
+        self.resources[resource.name] = resource
+        return resource
+
+    def get(self, name):
+        """Fresh value of a registered resource (None if it cannot be loaded)"""
+        return self.resources[name].get()
+
+    def begin_invocation(self):
+        """Count an invocation; returns whether this container was already warm"""
+
+        with self._lock:
+            self.invocations += 1
+            warm = self.invocations > 1
+            if warm:
+                self.warm_invocations += 1
+            return {
+                'warm': warm,
+                'invocation': self.invocations,
+                'container_age_seconds': round(time.time() - self.created_at, 1)
+            }
+
+    def session(self, name='default', pool_size=10):
+        """A pooled requests.Session kept for the container's lifetime"""
+
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[name] = session
+            return session
+
+    def status(self):
+        return {
+            'container_age_seconds': round(time.time() - self.created_at, 1),
+            'invocations': self.invocations,
+            'warm_invocations': self.warm_invocations,
+            'sessions': sorted(self._sessions),
+            'resources': {name: resource.status() for name, resource in self.resources.items()}
+        }
+
+
+# ----------------------------------------------------------------------
+# Default resources
+# ----------------------------------------------------------------------
+
+def _load_rules():
+    from reward_rules import load_rules, set_rule_engine
+
+    engine = load_rules()
+    set_rule_engine(engine)
+    return engine
+
+
+def _rules_file_unchanged(engine, loaded_at):
+    """Reload the rules when their file is edited"""
+
+    from reward_rules import rules_path
+
+    try:
+        return os.path.getmtime(rules_path()) <= loaded_at
+    except OSError:
+        return True
+
+
+def _load_integration():
+    from secure_munch_integration import SecureMunchIntegration
+
+    if not get_config().has_munch_credentials:
+        return None
+    return SecureMunchIntegration(session=STATE.session('munch'))
+
+
+def _load_directory():
+    from munch_directory import MunchDirectory, get_shared_directory, set_shared_directory
+
+    # A pre-fork master may already have loaded one for every worker
+    shared = get_shared_directory()
+    if shared is not None and shared.age_seconds() < STATE.resources['munch_directory'].ttl:
+        return shared
+
+    integration = STATE.get('integration')
+    if integration is None:
+        return None
+
+    directory = MunchDirectory.download(integration)
+    if directory is not None:
+        set_shared_directory(directory)
+    return directory
+
+
+def _load_loopy_token():
+    from loopy_token_cache import get_token_cache
+
+    if not get_config().has_loopy_credentials:
+        return None
+
+    cache = get_token_cache(session=STATE.session('loopy'))
+    token = cache.get_token()
+    if token is None:
+        raise RuntimeError(cache.last_error or 'Loopy login failed')
+    return token
+
+
+def _loopy_token_current(token, loaded_at):
+    """Follow the token cache, which refreshes ahead of the JWT expiry"""
+
+    from loopy_token_cache import get_token_cache
+    return get_token_cache().is_valid(token)
+
+
+STATE = WarmState()
+STATE.register(WarmResource('rules', _load_rules, is_fresh=_rules_file_unchanged))
+STATE.register(WarmResource('integration', _load_integration))
+STATE.register(WarmResource('munch_directory', _load_directory,
+                            ttl=float(getenv('MUNCH_DIRECTORY_TTL', '300'))))
+STATE.register(WarmResource('loopy_token', _load_loopy_token, is_fresh=_loopy_token_current))
+
+
+def get_integration():
+    """
+    Shared SecureMunchIntegration (None without Munch credentials),
+    with the customer directory refreshed if it has gone stale
+    """
+
+    integration = STATE.get('integration')
+    if integration is not None:
+        STATE.get('munch_directory')
+    return integration
+
+
+def begin_invocation():
+    """Mark the start of a request on the shared state"""
+    return STATE.begin_invocation()
+
+
+def container_state_header(invocation):
+    """Value for the X-Container-State response header"""
+    return 'warm' if invocation['warm'] else 'cold'
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Startup Warm-Up
+===============
+
+After a deploy or restart the first rewards used to pay for the TLS
+handshakes, the Loopy login and the Munch directory download. The
+warm-up stage does that work before the service reports ready.
+
+STEPS (WARMUP_STEPS, comma-separated, default all):
+- rules: load and compile the reward rules
+- munch_connection: open pooled keep-alive connections to Munch
+- loopy_login: authenticate to Loopy and keep the token
+- munch_directory: download and index the Munch customer directory
+
+HOW IT WORKS:
+1. Steps run in parallel threads on the shared warm_state resources
+2. The whole stage has a time budget (WARMUP_BUDGET, default 20s);
+   steps still running when it expires are reported as timed out and
+   keep going in the background
+3. /health answers 503 "warming_up" while the stage runs, then reports
+   the outcome and duration of every step
+"""
+
+import threading
+import time
+
+from app_config import get_config, getenv
+from warm_state import STATE, get_integration
+
+DEFAULT_BUDGET_SECONDS = 20.0
+
+
+def _warm_rules():
+    engine = STATE.get('rules')
+    return f"{len(engine.rules)} rule(s)"
+
+
+def _warm_munch_connection():
+    # Any answer means the TCP + TLS connection is open and pooled
+    response = STATE.session('munch').get(get_config().munch_base_url, timeout=5)
+    return f"HTTP {response.status_code}"
+
+
+def _warm_loopy_login():
+    if not get_config().has_loopy_credentials:
+        return 'skipped (no Loopy credentials)'
+    if STATE.get('loopy_token') is None:
+        raise RuntimeError(STATE.resources['loopy_token'].last_error or 'login failed')
+    return 'token ready'
+
+
+def _warm_munch_directory():
+    if not get_config().has_munch_credentials:
+        return 'skipped (no Munch credentials)'
+    directory = STATE.get('munch_directory') if get_integration() is not None else None
+    if directory is None:
+        raise RuntimeError(STATE.resources['munch_directory'].last_error or 'download failed')
+    return f"{len(directory)} customers"
+
+
+STEPS = {
+    'rules': _warm_rules,
+    'munch_connection': _warm_munch_connection,
+    'loopy_login': _warm_loopy_login,
+    'munch_directory': _warm_munch_directory
+}
+
+
+class Warmup:
+    """Runs the warm-up steps once and tracks their progress"""
+
+    def __init__(self, steps=None, budget_seconds=None):
+        if steps is None:
+            names = getenv('WARMUP_STEPS')
+            steps = [name.strip() for name in names.split(',') if name.strip()] if names else list(STEPS)
+        unknown = [name for name in steps if name not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown warm-up step(s): {', '.join(unknown)}")
+
+        if budget_seconds is None:
+            budget_seconds = float(getenv('WARMUP_BUDGET', DEFAULT_BUDGET_SECONDS))
+
+        self.steps = list(steps)
+        self.budget_seconds = budget_seconds
+        self.state = 'not_started'
+        self.started_at = None
+        self.finished_at = None
+        self._results = {name: {'status': 'pending'} for name in self.steps}
+        self._lock = threading.RLock()
+        self._done = threading.Event()
+
+    def _run_step(self, name):
+        started = time.monotonic()
+        with self._lock:
+            self._results[name] = {'status': 'running'}
+
+        try:
+            detail = STEPS[name]()
+            result = {'status': 'done', 'detail': detail}
+        except Exception as e:
+            result = {'status': 'failed', 'error': str(e)}
+        result['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+        with self._lock:
+            # A step that outlives the budget still records its outcome
+            if self.state != 'running':
+                result['late'] = True
+            self._results[name] = result
+
+    def run(self):
+        """Run every step within the budget; returns the status report"""
+
+        with self._lock:
+            if self.state != 'not_started':
+                return self.status()
+            self.state = 'running'
+            self.started_at = time.monotonic()
+
+        threads = [
+            threading.Thread(target=self._run_step, args=(name,), name=f'warmup-{name}', daemon=True)
+            for name in self.steps
+        ]
+        for thread in threads:
+            thread.start()
+
+        deadline = self.started_at + self.budget_seconds
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        with self._lock:
+            for name in self.steps:
+                if self._results[name]['status'] in ('pending', 'running'):
+                    self._results[name] = {'status': 'timed_out'}
+            failed = any(result['status'] != 'done' for result in self._results.values())
+            self.state = 'degraded' if failed else 'ready'
+            self.finished_at = time.monotonic()
+
+        self._done.set()
+        return self.status()
+
+    def start(self):
+        """Run in a background thread so the server can answer /health meanwhile"""
+
+        thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def in_progress(self):
+        return self.state == 'running'
+
+    def status(self):
+        with self._lock:
+            if self.started_at is None:
+                duration = None
+            else:
+                duration = (self.finished_at or time.monotonic()) - self.started_at
+            return {
+                'state': self.state,
+                'budget_seconds': self.budget_seconds,
+                'duration_ms': round(duration * 1000, 1) if duration is not None else None,
+                'completed': sum(1 for r in self._results.values() if r['status'] not in ('pending', 'running')),
+                'total': len(self.steps),
+                'steps': {name: dict(result) for name, result in self._results.items()}
+            }
+
+
+_warmup = None
+
+
+def get_warmup():
+    """The process-wide warm-up (created, not started, on first use)"""
+
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
+
+
+def set_warmup(warmup):
+    global _warmup
+    _warmup = warmup
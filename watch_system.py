@@ -21,18 +21,17 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List
 import requests
-from dotenv import load_dotenv
+from app_config import get_config
 import subprocess
 
-# Load environment variables
-load_dotenv('production.env')
 
 class LiveSystemMonitor:
     """Real-time monitoring of the Loopy-Munch integration system"""
     
     def __init__(self):
-        self.munch_base_url = os.getenv('MUNCH_BASE_URL', 'https://api.munch.cloud/api')
-        self.munch_api_key = os.getenv('MUNCH_API_KEY')
+        config = get_config()
+        self.munch_base_url = config.munch_base_url
+        self.munch_api_key = config.munch_api_key
         self.munch_headers = {
             'Authorization': f'Bearer {self.munch_api_key}',
             'Content-Type': 'application/json'